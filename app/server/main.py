@@ -15,29 +15,36 @@ from dotenv import load_dotenv
 from app.server.dialog.logger import DialogLogger
 from app.server.utils.error_logger import ErrorLogger
 from app.server.utils.paths import ensure_dirs, DIALOG_DIR
-from app.server.providers.openai_client import OpenAIClient
-from app.server.rag.pipeline import rebuild_index, load_index
-from app.server.rag.retriever import retrieve_top
+from app.server.providers.embedding_cache import QUERY_CACHE
+from app.server.providers.openai_client import AsyncOpenAIClient, OpenAIClient, aclose_http_client, close_http_client
+from app.server.rag.pipeline import rebuild_index, load_index, INDEX_CACHE, EMBEDDING_CACHE
+from app.server.rag.retriever import aretrieve_top
+from app.server.rag.jobs import JobRunner, ReindexCancelled, ReindexJob
 from app.server.rag.reader import parse_markdown_file
-from app.server.utils.paths import BOOK_DIR, CONTEXT_DIR
+from app.server.rag.index_store import section_table_of
+from app.server.rag.lexicon import ScanResult, get_lexicon
+from app.server.rag.sections import SectionTable
+from app.server.rag.watcher import INDEX_WATCH, SourceWatcher
+from app.server.utils.paths import BOOK_DIR, CONTEXT_DIR, DATA_ROOT
 
 load_dotenv()
 
 app = FastAPI(title="Coreader")
 logger = DialogLogger()
 error_logger = ErrorLogger()
+# Фоновые задачи переиндексации (по одной за раз)
+REINDEX_JOBS = JobRunner()
 
 
-# Optional hard order for Plato's Symposium speeches (domain-specific guardrail)
-SPEAKER_ORDER = {
-    "федр": 1,
-    "павсан": 2,
-    "эриксимах": 3,
-    "аристофан": 4,
-    "агафон": 5,
-    "сократ": 6,
-    "алкивиад": 7,
-}
+# Говорящие, триггеры чтения и анахронизмы берутся из словаря книги (*.lexicon.json в BOOK_DIR);
+# сообщение просматривается одним проходом автомата Ахо–Корасик
+def _scan(msg: str) -> ScanResult:
+    return get_lexicon().scan(msg)
+
+
+# Ключи триггеров словаря: намерение для границы и триггеры «читаю сейчас ...»
+READ_INTENTS = (("start", ("start",)), ("just", ("just", "read")), ("now", ("now",)))
+CURRENT_TRIGGERS = {"start", "just", "now"}
 
 
 def _validate_env() -> None:
@@ -64,53 +71,33 @@ def _validate_env() -> None:
             pass
 
 
-def _auto_boundary_from_message(msg: str, store) -> Optional[int]:
+def _section_table(store) -> SectionTable:
+    """Оглавление поколения (кэшируется в сторе) с заранее найденными основами говорящих."""
+    if isinstance(store, SectionTable):
+        return store
+    return section_table_of(store).warm(get_lexicon().speakers)
+
+
+def _auto_boundary_from_message(msg: str, store, scan: Optional[ScanResult] = None) -> Optional[int]:
     """Heuristic: detect phrases like 'начал читать/я читаю/только что прочитал' + speaker name
     and compute boundary seq from store titles.
     """
-    import re
-
-    text = msg.lower()
-    # Known speakers/sections (expandable)
-    speakers = [
-        ("сократ", "сократ"),
-        ("павсан", "павсан"),
-        ("аристофан", "аристофан"),
-        ("эриксимах", "эриксимах"),
-        ("федр", "федр"),
-        ("агафон", "агафон"),
-        ("алкивиад", "алкивиад"),
-    ]
-
-    # Determine intent
-    intent = None  # 'start', 'now', 'just'
-    if re.search(r"начал[аио]?\s+читать", text):
-        intent = 'start'
-    elif re.search(r"только\s+что\s+прочитал[аио]?", text) or re.search(r"прочитал[аио]?", text):
-        intent = 'just'
-    elif re.search(r"я\s+читаю", text) or re.search(r"\bчитаю\b", text):
-        intent = 'now'
-
+    scan = scan or _scan(msg)
+    # Determine intent: 'start' > 'just' (в т.ч. просто «прочитал») > 'now'
+    intent = next((i for i, keys in READ_INTENTS if any(scan.has("trigger", k) for k in keys)), None)
     if not intent:
         return None
 
     # Find mentioned speaker
-    target = None
-    for key, stem in speakers:
-        if stem in text:
-            target = stem
-            break
+    target = _detect_speaker(msg, scan)
     if not target:
         return None
 
-    # Scan store to find contiguous span(s) by title including target
-    items = sorted(store.all(), key=lambda i: i.seq)
-    matches = [it for it in items if target in (it.title or '').lower()]
-    if not matches:
+    # Span of sections whose title includes target (precomputed per index generation)
+    span = _section_table(store).span(target)
+    if span is None:
         return None
-    # Determine span bounds
-    min_seq = min(it.seq for it in matches)
-    max_seq = max(it.seq for it in matches)
+    min_seq, max_seq = span
 
     if intent == 'start':
         return max(min_seq - 1, 0)
@@ -140,46 +127,35 @@ def _extract_zotero_key_from_file(file_path: Optional[str]) -> Optional[str]:
     return None
 
 
-def _detect_speaker(msg: str) -> Optional[str]:
-    text = msg.lower()
-    for stem in ("сократ", "павсан", "аристофан", "эриксимах", "федр", "агафон", "алкивиад"):
-        if stem in text:
-            return stem
-    return None
+def _detect_speaker(msg: str, scan: Optional[ScanResult] = None) -> Optional[str]:
+    """Упомянутый говорящий; при нескольких — первый в порядке словаря."""
+    found = set((scan or _scan(msg)).keys("speaker"))
+    return next((key for key in get_lexicon().speakers if key in found), None)
 
 
 def _span_for_speaker(store, stem: str) -> Optional[tuple[int, int]]:
-    items = sorted(store.all(), key=lambda i: i.seq)
-    hits = [it.seq for it in items if stem in (it.title or '').lower()]
-    if not hits:
-        return None
-    return (min(hits), max(hits))
+    return _section_table(store).span(stem)
 
 
-def _detect_current_stem(msg: str) -> Optional[str]:
-    import re
-    text = msg.lower()
-    # pattern: (trigger) + anything + (name)
-    triggers = r"(начал[аио]?\s+читать|я\s+читаю|\bчитаю\b|только\s+что\s+прочитал[аио]?)"
-    names = r"(сократ|павсан\w*|аристофан|эриксимах|федр|агафон|алкивиад)"
-    m = re.search(triggers + r"[^.\n]*?" + names, text)
-    if m:
-        stem = m.group(2)
-        # normalize to base stems we use elsewhere
-        for base in ("сократ", "павсан", "аристофан", "эриксимах", "федр", "агафон", "алкивиад"):
-            if base in stem:
-                return base
+def _detect_current_stem(msg: str, scan: Optional[ScanResult] = None) -> Optional[str]:
+    """Говорящий после триггера чтения в том же предложении (trigger ... name)."""
+    scan = scan or _scan(msg)
+    speakers = scan.of("speaker")
+    for trig in scan.of("trigger"):
+        if trig.key not in CURRENT_TRIGGERS:
+            continue
+        for sp in speakers:
+            if sp.start < trig.end:
+                continue
+            gap = scan.text[trig.end : sp.start]
+            if "." in gap or "\n" in gap:
+                break
+            return sp.key
     return None
 
 
 def _first_seq_for_stem(store, stem: str) -> Optional[int]:
-    items = sorted(store.all(), key=lambda i: i.seq)
-    for it in items:
-        title_l = (it.title or '').lower()
-        quote_l = (getattr(it, 'quote', '') or '').lower()
-        if stem in title_l or stem in quote_l:
-            return it.seq
-    return None
+    return _section_table(store).first_seq(stem)
 
 class ChatRequest(BaseModel):
     message: str
@@ -208,6 +184,16 @@ SETTINGS = Settings(
 async def on_startup() -> None:
     ensure_dirs()
     _validate_env()
+    if INDEX_WATCH:
+        WATCHER.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    WATCHER.stop()
+    REINDEX_JOBS.cancel_all()
+    close_http_client()
+    await aclose_http_client()
 
 
 @app.get("/settings", response_model=Settings)
@@ -247,19 +233,21 @@ async def chat(req: ChatRequest) -> ChatResponse:
             logger.log("assistant", msg, citations=[])
             return ChatResponse(reply=msg, citations=[])
         api_key = os.getenv("OPENAI_API_KEY")
-        client = OpenAIClient(api_key=api_key, offline=SETTINGS.offline)
+        client = AsyncOpenAIClient(api_key=api_key, offline=SETTINGS.offline)
         # Auto boundary from message (if any), then apply the strictest
-        auto_seq = _auto_boundary_from_message(req.message, store)
+        sections = _section_table(store)
+        scan = _scan(req.message)
+        auto_seq = _auto_boundary_from_message(req.message, sections, scan)
         max_seq = SETTINGS.read_boundary_seq
         if auto_seq is not None:
             max_seq = min(auto_seq, max_seq) if max_seq is not None else auto_seq
 
         # Если пользователь спрашивает про спикера, который идёт ПОСЛЕ границы — отвечаем отказом
-        asked = _detect_speaker(req.message)
-        current_stem = _detect_current_stem(req.message)
+        asked = _detect_speaker(req.message, scan)
+        current_stem = _detect_current_stem(req.message, scan)
         if asked and max_seq is not None:
-            span = _span_for_speaker(store, asked)
-            asked_first = _first_seq_for_stem(store, asked)
+            span = _span_for_speaker(sections, asked)
+            asked_first = _first_seq_for_stem(sections, asked)
             violate = False
             if span and span[0] > max_seq:
                 violate = True
@@ -267,12 +255,13 @@ async def chat(req: ChatRequest) -> ChatResponse:
                 violate = True
             # if user reading one speaker now and asks about another later one
             if not violate and current_stem and asked != current_stem:
-                curr_span = _span_for_speaker(store, current_stem)
+                curr_span = _span_for_speaker(sections, current_stem)
                 if curr_span and asked_first is not None and asked_first > curr_span[1]:
                     violate = True
             # Additional order-based guard: if current speaker exists and is earlier than asked
-            if not violate and current_stem and asked in SPEAKER_ORDER and current_stem in SPEAKER_ORDER:
-                if SPEAKER_ORDER[current_stem] < SPEAKER_ORDER[asked]:
+            order = get_lexicon().speaker_order
+            if not violate and current_stem and asked in order and current_stem in order:
+                if order[current_stem] < order[asked]:
                     violate = True
 
             if violate:
@@ -283,7 +272,7 @@ async def chat(req: ChatRequest) -> ChatResponse:
                 logger.log("assistant", msg, citations=[])
                 return ChatResponse(reply=msg, citations=[])
 
-        hits = retrieve_top(
+        hits = await aretrieve_top(
             req.message,
             store,
             client,
@@ -306,11 +295,7 @@ async def chat(req: ChatRequest) -> ChatResponse:
             return ChatResponse(reply=msg, citations=[])
 
         # Анахронизмы: явные современные термины — корректный отказ
-        anach = any(stem in req.message.lower() for stem in [
-            "автомобил", "интернет", "смартфон", "компьютер", "ракет", "поезд", "телефон",
-            "кибер", "электрон", "бензин", "двигател", "нефт", "спутник"
-        ])
-        if anach:
+        if scan.has("anachronism"):
             msg = (
                 "Не могу ответить строго по книге: в тексте нет упоминаний некоторых терминов из вопроса. "
                 "Переформулируйте вопрос в терминах книги или уберите современные понятия."
@@ -358,7 +343,7 @@ async def chat(req: ChatRequest) -> ChatResponse:
                 f"Вопрос: {req.message}\n\nЦитаты:\n{ctx}\n\nКраткий ответ (<= {SETTINGS.reply_limit_chars} символов):"\
             )
             try:
-                gen = client.chat(prompt, max_tokens=approx_tokens)
+                gen = await client.chat(prompt, max_tokens=approx_tokens)
                 if gen:
                     reply = gen.strip()
             except Exception:
@@ -538,8 +523,26 @@ async def zotero_search(payload: Dict[str, Any]) -> JSONResponse:
     items_sorted = sorted(items, key=score, reverse=True)
     return JSONResponse({"status": "ok", "items": items_sorted})
 
+def _submit_reindex(client: OpenAIClient, full: bool = False, route: str = "/admin/reindex") -> ReindexJob:
+    def run(job: ReindexJob) -> Dict[str, Any]:
+        try:
+            store = rebuild_index(client, progress=job.report, full=full)
+        except ReindexCancelled:
+            raise
+        except Exception as e:
+            error_logger.log(route=route, err=e, extra={"job": job.id})
+            raise
+        return {"items": len(store.all()), **EMBEDDING_CACHE.last_run}
+
+    return REINDEX_JOBS.submit(run)
+
+
 @app.post("/admin/reindex")
-async def admin_reindex() -> JSONResponse:
+async def admin_reindex(full: bool = False) -> JSONResponse:
+    """Поставить переиндексацию в фон; прогресс — GET /admin/reindex/{id}.
+
+    По умолчанию инкрементальная (только изменённые файлы), `?full=true` — с нуля.
+    """
     if SETTINGS.offline:
         error_logger.log(route="/admin/reindex", err="offline mode")
         raise HTTPException(status_code=400, detail="Оффлайн-режим: переиндексация недоступна")
@@ -547,14 +550,55 @@ async def admin_reindex() -> JSONResponse:
     if not api_key:
         error_logger.log(route="/admin/reindex", err="OPENAI_API_KEY missing")
         raise HTTPException(status_code=400, detail="Не задан OPENAI_API_KEY")
-    try:
-        client = OpenAIClient(api_key=api_key, offline=False)
-        store = rebuild_index(client)
-        return JSONResponse({"status": "ok", "items": len(store.all())})
-    except Exception as e:
-        # Вернуть ошибку для диагностики
-        error_logger.log(route="/admin/reindex", err=e)
-        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
+    job = _submit_reindex(OpenAIClient(api_key=api_key, offline=False), full=full)
+    return JSONResponse({"status": "accepted", "job_id": job.id, "job": job.to_dict()}, status_code=202)
+
+
+def _watcher_trigger():
+    """Запуск инкрементальной переиндексации по сигналу наблюдателя."""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if SETTINGS.offline or not api_key:
+        raise RuntimeError("переиндексация недоступна: оффлайн-режим или не задан OPENAI_API_KEY")
+    job = _submit_reindex(OpenAIClient(api_key=api_key, offline=False), route="/admin/watcher")
+    return lambda: job.status
+
+
+# Опциональный наблюдатель за BOOK_DIR/CONTEXT_DIR (INDEX_WATCH=true); при нескольких воркерах — один на все
+WATCHER = SourceWatcher([BOOK_DIR, CONTEXT_DIR], _watcher_trigger, lock_path=DATA_ROOT / "index.watch.lock")
+
+
+@app.get("/admin/watcher")
+async def admin_watcher() -> JSONResponse:
+    """Состояние наблюдателя: время последнего опроса, длина очереди изменённых файлов."""
+    return JSONResponse({"status": "ok", "watcher": WATCHER.stats()})
+
+
+@app.get("/admin/reindex/{job_id}")
+async def admin_reindex_status(job_id: str) -> JSONResponse:
+    job = REINDEX_JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return JSONResponse({"status": "ok", "job": job.to_dict()})
+
+
+@app.delete("/admin/reindex/{job_id}")
+async def admin_reindex_cancel(job_id: str) -> JSONResponse:
+    job = REINDEX_JOBS.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return JSONResponse({"status": "ok", "job": job.to_dict()})
+
+
+@app.get("/admin/stats")
+async def admin_stats() -> JSONResponse:
+    """Счётчики кэшей: индекс (hits/misses/reloads), LRU эмбеддингов запросов,
+    дисковый кэш эмбеддингов чанков (переиспользовано/заново)."""
+    return JSONResponse({
+        "status": "ok",
+        "index": INDEX_CACHE.stats(),
+        "query_embeddings": QUERY_CACHE.stats(),
+        "embeddings": EMBEDDING_CACHE.stats(),
+    })
 
 
 @app.get("/progress")
@@ -562,18 +606,7 @@ async def get_progress() -> JSONResponse:
     """Вернуть список разделов (по title) с диапазоном seq.
     Используется для выбора «границы прочитанного» без чисел.
     """
-    store = load_index()
-    items = store.all()
-    buckets: Dict[str, Dict[str, Any]] = {}
-    for it in items:
-        title = (it.title or "").strip()
-        if not title:
-            continue
-        b = buckets.setdefault(title, {"title": title, "min_seq": it.seq, "max_seq": it.seq, "count": 0})
-        b["min_seq"] = min(b["min_seq"], it.seq)
-        b["max_seq"] = max(b["max_seq"], it.seq)
-        b["count"] += 1
-    sections = sorted(buckets.values(), key=lambda x: x["min_seq"])
+    sections = section_table_of(load_index()).sections()
     return JSONResponse({"status": "ok", "sections": sections, "current_seq": SETTINGS.read_boundary_seq})
 
 
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.server.utils.paths import DATA_ROOT
+
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "512"))
+# Время жизни записи в секундах; 0 — без ограничения
+QUERY_EMBED_CACHE_TTL = float(os.getenv("QUERY_EMBED_CACHE_TTL", "0"))
+
+# Дисковый кэш эмбеддингов чанков для переиндексации
+EMBED_CACHE_PATH = Path(os.getenv("EMBED_CACHE_PATH", str(DATA_ROOT / "embeddings.sqlite")))
+
+
+def normalize_query(text: str) -> str:
+    """Нормализация текста запроса для ключа кэша: регистр и пробелы."""
+    return " ".join(text.lower().split())
+
+
+class QueryEmbeddingCache:
+    """Ограниченный LRU эмбеддингов запросов с необязательным TTL.
+
+    Ключ — (модель эмбеддингов, нормализованный текст запроса).
+    """
+
+    def __init__(self, max_size: int = QUERY_EMBED_CACHE_SIZE, ttl: float = QUERY_EMBED_CACHE_TTL) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, model: str, query: str) -> Optional[List[float]]:
+        key = (model, normalize_query(query))
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, vec = entry
+            if self.ttl > 0 and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, model: str, query: str, vec: List[float]) -> None:
+        if self.max_size <= 0:
+            return
+        key = (model, normalize_query(query))
+        with self._lock:
+            self._data[key] = (time.monotonic(), vec)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# Общий кэш процесса для эмбеддингов запросов (/chat)
+QUERY_CACHE = QueryEmbeddingCache()
+
+
+def content_hash(text: str) -> str:
+    """Хэш содержимого входа эмбеддинга (полный sha1, в отличие от короткого якоря абзаца)."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingDiskCache:
+    """Content-addressed кэш эмбеддингов на диске (SQLite): ключ — (модель, хэш текста).
+
+    Переиндексация берёт отсюда векторы неизменившихся абзацев и ходит в API
+    только за промахами. Векторы хранятся как float32.
+    """
+
+    _BATCH = 500
+
+    def __init__(self, path: Path = EMBED_CACHE_PATH) -> None:
+        self.path = path
+        self._init_lock = threading.Lock()
+        self._ready = False
+        self.reused = 0
+        self.embedded = 0
+        self.last_run: Dict[str, int] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            with self._init_lock:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with sqlite3.connect(self.path) as conn:
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS embeddings ("
+                        "model TEXT NOT NULL, hash TEXT NOT NULL, dim INTEGER NOT NULL, vec BLOB NOT NULL, "
+                        "PRIMARY KEY (model, hash))"
+                    )
+                self._ready = True
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, model: str, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        keys = list(dict.fromkeys(hashes))
+        found: Dict[str, List[float]] = {}
+        conn = self._connect()
+        try:
+            for i in range(0, len(keys), self._BATCH):
+                part = keys[i : i + self._BATCH]
+                marks = ",".join("?" * len(part))
+                rows = conn.execute(
+                    f"SELECT hash, vec FROM embeddings WHERE model = ? AND hash IN ({marks})", [model, *part]
+                )
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype="<f4").tolist()
+        finally:
+            conn.close()
+        return found
+
+    def put_many(self, model: str, items: Sequence[Tuple[str, Sequence[float]]]) -> None:
+        if not items:
+            return
+        rows = []
+        for h, vec in items:
+            arr = np.asarray(vec, dtype="<f4")
+            rows.append((model, h, int(arr.shape[0]), arr.tobytes()))
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO embeddings (model, hash, dim, vec) VALUES (?, ?, ?, ?)", rows)
+        finally:
+            conn.close()
+
+    def record_run(self, reused: int, embedded: int) -> None:
+        self.reused += reused
+        self.embedded += embedded
+        self.last_run = {"reused": reused, "embedded": embedded}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "reused_total": self.reused,
+            "embedded_total": self.embedded,
+            "last_run": dict(self.last_run),
+        }
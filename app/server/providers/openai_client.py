@@ -1,62 +1,238 @@
 from __future__ import annotations
 
+import asyncio
 import os
-from typing import List
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
 
 import httpx
 import hashlib
 import math
 
+from app.server.providers.embedding_cache import QUERY_CACHE, QueryEmbeddingCache
+
 
 OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
 OPENAI_CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
 OPENAI_API_URL = os.getenv("OPENAI_API_URL", "https://api.openai.com/v1")
 FAKE_EMBEDDINGS = os.getenv("FAKE_EMBEDDINGS", "false").lower() == "true"
 
+# Пул HTTP-соединений к OpenAI: один на процесс, с keep-alive (и HTTP/2, если установлен h2)
+OPENAI_HTTP_TIMEOUT = float(os.getenv("OPENAI_HTTP_TIMEOUT", "60"))
+OPENAI_HTTP_CONNECT_TIMEOUT = float(os.getenv("OPENAI_HTTP_CONNECT_TIMEOUT", "10"))
+OPENAI_HTTP_MAX_CONNECTIONS = int(os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", "20"))
+OPENAI_HTTP_MAX_KEEPALIVE = int(os.getenv("OPENAI_HTTP_MAX_KEEPALIVE", "10"))
+OPENAI_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_HTTP_KEEPALIVE_EXPIRY", "60"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "true").lower() == "true"
+
+# Пакетная индексация: лимиты пакета, параллельность и повторы при 429/5xx
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "100000"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_BACKOFF_BASE = float(os.getenv("EMBED_BACKOFF_BASE", "1.0"))
+EMBED_BACKOFF_MAX = float(os.getenv("EMBED_BACKOFF_MAX", "30.0"))
+
+# Уменьшенная размерность эмбеддингов (0 — полная). auto/api — параметр dimensions API,
+# если модель его поддерживает (иначе локально); truncate/pca — всегда локально при индексации
+EMBED_DIMENSIONS = int(os.getenv("EMBED_DIMENSIONS", "0"))
+EMBED_REDUCTION = os.getenv("EMBED_REDUCTION", "auto").lower()
+
+_POOL: Optional[httpx.Client] = None
+_POOL_LOCK = threading.Lock()
+_APOOL: Optional[httpx.AsyncClient] = None
+_APOOL_LOOP: Optional[asyncio.AbstractEventLoop] = None
+# Задачи закрытия пулов прежних циклов (ссылки, чтобы задачу не собрал GC)
+_RETIRING: set = set()
+
+
+class OpenAIHTTPError(RuntimeError):
+    """Ошибка HTTP от OpenAI; хранит статус и Retry-After для решения о повторе."""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code == 429 or self.status_code >= 500
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _http2_available() -> bool:
+    if not OPENAI_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def http_pool_settings() -> dict:
+    """Параметры пула (timeout/limits/http2), общие для sync- и async-клиента."""
+    return {
+        "timeout": httpx.Timeout(OPENAI_HTTP_TIMEOUT, connect=OPENAI_HTTP_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=OPENAI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "http2": _http2_available(),
+    }
+
+
+def http_client() -> httpx.Client:
+    """Долгоживущий httpx.Client процесса (создаётся лениво, потокобезопасен)."""
+    global _POOL
+    if _POOL is None or _POOL.is_closed:
+        with _POOL_LOCK:
+            if _POOL is None or _POOL.is_closed:
+                _POOL = httpx.Client(**http_pool_settings())
+    return _POOL
+
+
+def close_http_client() -> None:
+    """Закрыть пул соединений (вызывается при остановке приложения)."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.close()
+            _POOL = None
+
+
+def async_http_client() -> httpx.AsyncClient:
+    """Долгоживущий httpx.AsyncClient для текущего event loop."""
+    global _APOOL, _APOOL_LOOP
+    loop = asyncio.get_running_loop()
+    if _APOOL is None or _APOOL.is_closed or _APOOL_LOOP is not loop:
+        # Соединения привязаны к циклу событий: для нового цикла — новый пул, старый закрывается
+        _retire_async_pool(_APOOL, _APOOL_LOOP, loop)
+        _APOOL = httpx.AsyncClient(**http_pool_settings())
+        _APOOL_LOOP = loop
+    return _APOOL
+
+
+def _retire_async_pool(
+    pool: Optional[httpx.AsyncClient],
+    pool_loop: Optional[asyncio.AbstractEventLoop],
+    loop: asyncio.AbstractEventLoop,
+) -> None:
+    """Закрыть пул прежнего цикла: в его же цикле, если тот ещё работает (другой поток), иначе — задачей в текущем."""
+    if pool is None or pool.is_closed:
+        return
+    if pool_loop is not None and pool_loop is not loop and pool_loop.is_running() and not pool_loop.is_closed():
+        asyncio.run_coroutine_threadsafe(pool.aclose(), pool_loop)
+        return
+    task = loop.create_task(_aclose_quietly(pool))
+    _RETIRING.add(task)
+    task.add_done_callback(_RETIRING.discard)
+
+
+async def _aclose_quietly(pool: httpx.AsyncClient) -> None:
+    try:
+        await pool.aclose()
+    except Exception:
+        # Цикл, к которому привязаны соединения, уже закрыт: сокеты закрываются без ожидания
+        pass
+
+
+async def aclose_http_client() -> None:
+    global _APOOL, _APOOL_LOOP
+    pool, _APOOL, _APOOL_LOOP = _APOOL, None, None
+    if pool is not None and not pool.is_closed:
+        await pool.aclose()
+
+
+def supports_dimensions(model: str) -> bool:
+    """Модели с укороченными векторами (параметр dimensions)."""
+    return model.startswith("text-embedding-3")
+
+
+class _OpenAIBase:
+    """Общая часть sync/async клиентов: заголовки, тела запросов и разбор ответов."""
 
-class OpenAIClient:
     def __init__(self, api_key: str | None, offline: bool = False) -> None:
         self.api_key = api_key
         self.offline = offline
+        # LRU эмбеддингов запросов; None отключает кэш
+        self.query_cache: Optional[QueryEmbeddingCache] = QUERY_CACHE
+
+    @property
+    def embedding_dimensions(self) -> Optional[int]:
+        """Размерность, запрашиваемая у API, или None (полные векторы)."""
+        if FAKE_EMBEDDINGS or EMBED_DIMENSIONS <= 0 or EMBED_REDUCTION not in ("auto", "api"):
+            return None
+        return EMBED_DIMENSIONS if supports_dimensions(OPENAI_EMBEDDING_MODEL) else None
+
+    @property
+    def embedding_model(self) -> str:
+        """Ключ модели для кэшей эмбеддингов; укороченные API векторы не смешиваются с полными."""
+        if FAKE_EMBEDDINGS:
+            return "fake"
+        dims = self.embedding_dimensions
+        return f"{OPENAI_EMBEDDING_MODEL}@{dims}" if dims else OPENAI_EMBEDDING_MODEL
 
     def _headers(self) -> dict:
         if not self.api_key:
             raise RuntimeError("OPENAI_API_KEY is not set")
         return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
 
-    def embed(self, texts: List[str]) -> List[List[float]]:
-        if FAKE_EMBEDDINGS:
-            return [self._fake_vector(t) for t in texts]
+    def _embed_payload(self, texts: List[str]) -> dict:
         if self.offline:
             raise RuntimeError("Offline mode: embeddings unavailable")
         payload = {"model": OPENAI_EMBEDDING_MODEL, "input": texts}
-        with httpx.Client(timeout=60) as client:
-            r = client.post(f"{OPENAI_API_URL}/embeddings", headers=self._headers(), json=payload)
-            try:
-                r.raise_for_status()
-            except httpx.HTTPStatusError as e:
-                raise RuntimeError(f"OpenAI embeddings HTTP {e.response.status_code}: {e.response.text}") from e
-            data = r.json()
-            return [item["embedding"] for item in data["data"]]
+        if self.embedding_dimensions:
+            payload["dimensions"] = self.embedding_dimensions
+        return payload
 
-    def chat(self, prompt: str, max_tokens: int = 300) -> str:
+    def _chat_payload(self, prompt: str, max_tokens: int) -> dict:
         if self.offline:
             raise RuntimeError("Offline mode: generation unavailable")
         # Use Chat Completions
-        payload = {
+        return {
             "model": OPENAI_CHAT_MODEL,
             "messages": [{"role": "user", "content": prompt}],
             "max_tokens": max_tokens,
             "temperature": 0.2,
         }
-        with httpx.Client(timeout=60) as client:
-            r = client.post(f"{OPENAI_API_URL}/chat/completions", headers=self._headers(), json=payload)
-            try:
-                r.raise_for_status()
-            except httpx.HTTPStatusError as e:
-                raise RuntimeError(f"OpenAI chat HTTP {e.response.status_code}: {e.response.text}") from e
-            data = r.json()
-            return data["choices"][0]["message"]["content"].strip()
+
+    @staticmethod
+    def _parse_embeddings(r: httpx.Response) -> List[List[float]]:
+        try:
+            r.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            raise OpenAIHTTPError(
+                f"OpenAI embeddings HTTP {e.response.status_code}: {e.response.text}",
+                e.response.status_code,
+                _retry_after(e.response),
+            ) from e
+        data = r.json()
+        return [item["embedding"] for item in data["data"]]
+
+    @staticmethod
+    def _parse_chat(r: httpx.Response) -> str:
+        try:
+            r.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            raise OpenAIHTTPError(
+                f"OpenAI chat HTTP {e.response.status_code}: {e.response.text}",
+                e.response.status_code,
+                _retry_after(e.response),
+            ) from e
+        data = r.json()
+        return data["choices"][0]["message"]["content"].strip()
 
     @staticmethod
     def _fake_vector(text: str, dim: int = 64) -> List[float]:
@@ -72,3 +248,155 @@ class OpenAIClient:
         # L2 normalize
         norm = math.sqrt(sum(x * x for x in vec)) or 1.0
         return [x / norm for x in vec]
+
+
+def approx_tokens(text: str) -> int:
+    """Грубая верхняя оценка числа токенов (≈2 символа на токен для кириллицы)."""
+    return max(1, len(text) // 2)
+
+
+def split_batches(texts: List[str], max_items: int = EMBED_BATCH_SIZE, max_tokens: int = EMBED_BATCH_TOKENS) -> List[List[int]]:
+    """Разбить входы на пакеты индексов с ограничением по числу элементов и токенам."""
+    batches: List[List[int]] = []
+    cur: List[int] = []
+    cur_tokens = 0
+    for i, t in enumerate(texts):
+        n = approx_tokens(t)
+        if cur and (len(cur) >= max_items or cur_tokens + n > max_tokens):
+            batches.append(cur)
+            cur, cur_tokens = [], 0
+        cur.append(i)
+        cur_tokens += n
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+def _with_retries(fn: Callable[[], List[List[float]]], max_retries: int, sleep: Callable[[float], None]) -> List[List[float]]:
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except (OpenAIHTTPError, httpx.TransportError) as e:
+            retryable = isinstance(e, httpx.TransportError) or e.retryable
+            if not retryable or attempt >= max_retries:
+                raise
+            delay = getattr(e, "retry_after", None)
+            if delay is None:
+                delay = min(EMBED_BACKOFF_MAX, EMBED_BACKOFF_BASE * (2 ** attempt)) * (0.5 + random.random() / 2)
+            else:
+                # Retry-After сервера не дольше EMBED_BACKOFF_MAX: один 429 не должен останавливать переиндексацию надолго
+                delay = min(EMBED_BACKOFF_MAX, max(0.0, delay))
+            sleep(delay)
+            attempt += 1
+
+
+def embed_batched(
+    client: "OpenAIClient",
+    texts: List[str],
+    max_items: int = EMBED_BATCH_SIZE,
+    max_tokens: int = EMBED_BATCH_TOKENS,
+    concurrency: int = EMBED_CONCURRENCY,
+    max_retries: int = EMBED_MAX_RETRIES,
+    sleep: Callable[[float], None] = time.sleep,
+    on_batch: Optional[Callable[[int], None]] = None,
+) -> List[List[float]]:
+    """Эмбеддинги большого набора текстов: пакеты по размеру/токенам, ограниченная
+    параллельность, повторы с backoff при 429/5xx/сетевых ошибках; порядок сохраняется.
+    on_batch(n) вызывается после каждого готового пакета (может бросить исключение для отмены)."""
+    batches = split_batches(texts, max_items, max_tokens)
+    out: List[Optional[List[float]]] = [None] * len(texts)
+
+    def run(batch: List[int]) -> None:
+        vecs = _with_retries(lambda: client.embed([texts[i] for i in batch]), max_retries, sleep)
+        if len(vecs) != len(batch):
+            raise RuntimeError(f"OpenAI embeddings: expected {len(batch)} vectors, got {len(vecs)}")
+        for i, v in zip(batch, vecs):
+            out[i] = v
+        if on_batch is not None:
+            on_batch(len(batch))
+
+    if len(batches) <= 1 or concurrency <= 1:
+        for batch in batches:
+            run(batch)
+    else:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as pool:
+            futures = [pool.submit(run, b) for b in batches]
+            try:
+                for fut in futures:
+                    fut.result()
+            except BaseException:
+                for fut in futures:
+                    fut.cancel()
+                raise
+    return out  # type: ignore[return-value]
+
+
+class OpenAIClient(_OpenAIBase):
+    def __init__(self, api_key: str | None, offline: bool = False, http: httpx.Client | None = None) -> None:
+        super().__init__(api_key, offline)
+        # По умолчанию — общий пул процесса; явный клиент удобен для тестов
+        self._http = http
+
+    @property
+    def http(self) -> httpx.Client:
+        return self._http or http_client()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if FAKE_EMBEDDINGS:
+            return [self._fake_vector(t) for t in texts]
+        payload = self._embed_payload(texts)
+        r = self.http.post(f"{OPENAI_API_URL}/embeddings", headers=self._headers(), json=payload)
+        return self._parse_embeddings(r)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Эмбеддинг одного запроса через LRU: повторный вопрос не идёт в сеть."""
+        cache = self.query_cache
+        if cache is not None:
+            hit = cache.get(self.embedding_model, text)
+            if hit is not None:
+                return hit
+        vec = self.embed([text])[0]
+        if cache is not None:
+            cache.put(self.embedding_model, text, vec)
+        return vec
+
+    def chat(self, prompt: str, max_tokens: int = 300) -> str:
+        payload = self._chat_payload(prompt, max_tokens)
+        r = self.http.post(f"{OPENAI_API_URL}/chat/completions", headers=self._headers(), json=payload)
+        return self._parse_chat(r)
+
+
+class AsyncOpenAIClient(_OpenAIBase):
+    """Асинхронный клиент на httpx.AsyncClient: сетевое ожидание не блокирует event loop."""
+
+    def __init__(self, api_key: str | None, offline: bool = False, http: httpx.AsyncClient | None = None) -> None:
+        super().__init__(api_key, offline)
+        self._http = http
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        return self._http or async_http_client()
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        if FAKE_EMBEDDINGS:
+            return [self._fake_vector(t) for t in texts]
+        payload = self._embed_payload(texts)
+        r = await self.http.post(f"{OPENAI_API_URL}/embeddings", headers=self._headers(), json=payload)
+        return self._parse_embeddings(r)
+
+    async def embed_query(self, text: str) -> List[float]:
+        cache = self.query_cache
+        if cache is not None:
+            hit = cache.get(self.embedding_model, text)
+            if hit is not None:
+                return hit
+        vec = (await self.embed([text]))[0]
+        if cache is not None:
+            cache.put(self.embedding_model, text, vec)
+        return vec
+
+    async def chat(self, prompt: str, max_tokens: int = 300) -> str:
+        payload = self._chat_payload(prompt, max_tokens)
+        r = await self.http.post(f"{OPENAI_API_URL}/chat/completions", headers=self._headers(), json=payload)
+        return self._parse_chat(r)
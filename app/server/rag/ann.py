@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import math
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+# Приближённый поиск соседей (IVF-flat) для больших корпусов
+INDEX_ANN = os.getenv("INDEX_ANN", "true").lower() == "true"
+# Меньше этого числа элементов — только точный поиск
+ANN_MIN_ITEMS = int(os.getenv("ANN_MIN_ITEMS", "20000"))
+# Число списков (0 — sqrt(N)) и число просматриваемых списков на запрос (полнота/задержка)
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+# Минимум кандидатов внутри границы max_seq: при нехватке nprobe увеличивается
+ANN_MIN_CANDIDATES = int(os.getenv("ANN_MIN_CANDIDATES", "256"))
+
+# Инкрементальная переиндексация дописывает новые строки в списки без k-means, пока
+# доля новых строк не больше этой (иначе центроиды обучаются заново)
+ANN_SPLICE_MAX_FRACTION = float(os.getenv("ANN_SPLICE_MAX_FRACTION", "0.2"))
+
+_TRAIN_PER_LIST = 40
+_ASSIGN_BLOCK = 8192
+
+
+def _normalized(matrix: np.ndarray, inv_norms: np.ndarray) -> np.ndarray:
+    return (np.asarray(matrix, dtype=np.float32) * inv_norms[:, None]).astype(np.float32, copy=False)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Ближайший (по косинусу) центроид для каждой строки, блоками — без матрицы N x nlist целиком."""
+    out = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], _ASSIGN_BLOCK):
+        block = vectors[start : start + _ASSIGN_BLOCK]
+        out[start : start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+class IVFIndex:
+    """IVF-flat: сферический k-means по нормированным векторам и инвертированные списки строк.
+
+    Запрос сравнивается с центроидами, просматриваются `nprobe` ближайших списков;
+    точный косинус считается только для их строк. Строки в списке — по возрастанию.
+    """
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, rows: np.ndarray) -> None:
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.nlist = int(centroids.shape[0])
+        self.n_items = int(rows.shape[0])
+
+    @classmethod
+    def build(
+        cls,
+        matrix: np.ndarray,
+        inv_norms: np.ndarray,
+        nlist: int = 0,
+        iters: int = 10,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        n = matrix.shape[0]
+        nlist = max(1, min(n, nlist or int(math.sqrt(n))))
+        vectors = _normalized(matrix, inv_norms)
+        rng = np.random.default_rng(seed)
+        train_n = min(n, nlist * _TRAIN_PER_LIST)
+        train = vectors[np.sort(rng.choice(n, size=train_n, replace=False))] if train_n < n else vectors
+        centroids = train[rng.choice(train.shape[0], size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            labels = _assign(train, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, train)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            # Пустой список получает случайную точку обучения
+            if empty.any():
+                sums[empty] = train[rng.choice(train.shape[0], size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = (sums / np.where(norms == 0, 1.0, norms)).astype(np.float32)
+        return cls.from_labels(centroids, _assign(vectors, centroids))
+
+    @classmethod
+    def from_labels(cls, centroids: np.ndarray, labels: np.ndarray) -> "IVFIndex":
+        """Инвертированные списки по номеру списка каждой строки."""
+        nlist = int(centroids.shape[0])
+        rows = np.argsort(labels, kind="stable").astype(np.int32)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(labels, minlength=nlist))
+        return cls(centroids, offsets, rows)
+
+    def labels(self) -> np.ndarray:
+        """Номер списка для каждой строки (обратное к rows/offsets)."""
+        out = np.empty(self.n_items, dtype=np.int32)
+        out[self.rows] = np.repeat(np.arange(self.nlist, dtype=np.int32), np.diff(self.offsets))
+        return out
+
+    def splice(
+        self,
+        keep: np.ndarray,
+        added: np.ndarray,
+        added_inv_norms: np.ndarray,
+        perm: Optional[np.ndarray] = None,
+    ) -> "IVFIndex":
+        """Индекс после замены строк без k-means: оставшиеся строки `keep` сохраняют свои списки,
+        новые `added` попадают в списки ближайших центроидов; `perm` — итоговый порядок строк."""
+        labels = self.labels()[keep]
+        if added.shape[0]:
+            labels = np.concatenate([labels, _assign(_normalized(added, added_inv_norms), self.centroids)])
+        if perm is not None:
+            labels = labels[perm]
+        return IVFIndex.from_labels(self.centroids, labels)
+
+    def candidates(
+        self,
+        q: np.ndarray,
+        nprobe: Optional[int] = None,
+        allowed: Optional[np.ndarray] = None,
+        min_candidates: Optional[int] = None,
+    ) -> np.ndarray:
+        """Строки из nprobe ближайших списков (с учётом маски allowed), по возрастанию.
+
+        Если после фильтра кандидатов меньше min_candidates, просматриваются
+        следующие списки, пока не наберётся достаточно или списки не кончатся.
+        """
+        q = np.asarray(q, dtype=np.float32)
+        order = np.argsort(-(self.centroids @ q), kind="stable")
+        nprobe = max(1, min(ANN_NPROBE if nprobe is None else nprobe, self.nlist))
+        min_candidates = ANN_MIN_CANDIDATES if min_candidates is None else min_candidates
+        parts = []
+        found = 0
+        probed = 0
+        while probed < self.nlist:
+            step = order[probed : probed + nprobe]
+            for c in step:
+                rows = self.rows[self.offsets[c] : self.offsets[c + 1]]
+                if allowed is not None:
+                    rows = rows[allowed[rows]]
+                parts.append(rows)
+                found += rows.size
+            probed += step.size
+            if found >= min_candidates:
+                break
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts)).astype(np.int64)
+
+    def save(self, path: Path) -> None:
+        with open(path, "wb") as f:
+            np.savez(f, centroids=self.centroids, offsets=self.offsets, rows=self.rows)
+
+    @classmethod
+    def load(cls, path: Path) -> "IVFIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["centroids"], data["offsets"], data["rows"])
+
+
+def should_build(n_items: int) -> bool:
+    return INDEX_ANN and n_items >= ANN_MIN_ITEMS
+
+
+def can_splice(ann: Optional[IVFIndex], n_kept: int, n_added: int, dim: int) -> bool:
+    """Можно ли дописать новые строки в существующие списки: центроиды той же размерности и правка
+    мала относительно корпуса (иначе центроиды переобучаются полным k-means)."""
+    return (
+        ann is not None
+        and n_added <= ANN_SPLICE_MAX_FRACTION * max(1, n_kept)
+        and (n_added == 0 or ann.centroids.shape[1] == dim)
+    )
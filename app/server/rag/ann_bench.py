@@ -0,0 +1,101 @@
+"""Бенчмарк IVF против точного поиска: полнота top-k и задержка по значениям nprobe.
+
+    python -m app.server.rag.ann_bench --n 200000 --dim 256
+    python -m app.server.rag.ann_bench --index data/coreader/index.json
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.server.rag.ann import IVFIndex
+from app.server.rag.index_store import IndexStore, _inverse_norms
+from app.server.rag.retriever import _cosine_scores, _top_k
+
+
+def synthetic_corpus(n: int, dim: int, clusters: int = 0, seed: int = 0) -> np.ndarray:
+    """Кластеризованные векторы (как у эмбеддингов текстов), float32."""
+    rng = np.random.default_rng(seed)
+    clusters = clusters or max(1, n // 500)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return (centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)).astype(np.float32)
+
+
+def run_benchmark(
+    matrix: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+    nprobes: Sequence[int] = (1, 2, 4, 8, 16, 32),
+    nlist: int = 0,
+    ivf: Optional[IVFIndex] = None,
+) -> List[Dict[str, float]]:
+    """Для каждого nprobe — recall@k относительно точного косинуса и средняя задержка (мс)."""
+    inv_norms = _inverse_norms(matrix)
+    t0 = time.perf_counter()
+    ivf = ivf or IVFIndex.build(matrix, inv_norms, nlist)
+    build_s = time.perf_counter() - t0
+
+    exact: List[np.ndarray] = []
+    t0 = time.perf_counter()
+    for q in queries:
+        exact.append(_top_k(_cosine_scores(q, matrix, inv_norms), k))
+    exact_ms = (time.perf_counter() - t0) * 1000 / max(1, len(queries))
+
+    rows: List[Dict[str, float]] = [{"nprobe": 0, "recall": 1.0, "ms": exact_ms, "candidates": float(matrix.shape[0])}]
+    for nprobe in nprobes:
+        hits, n_cand = 0, 0
+        t0 = time.perf_counter()
+        for q, truth in zip(queries, exact):
+            cand = ivf.candidates(q, nprobe=nprobe, min_candidates=k)
+            top = cand[_top_k(_cosine_scores(q, matrix[cand], inv_norms[cand]), k)]
+            hits += len(set(top.tolist()) & set(truth.tolist()))
+            n_cand += cand.size
+        ms = (time.perf_counter() - t0) * 1000 / max(1, len(queries))
+        rows.append({
+            "nprobe": nprobe,
+            "recall": hits / max(1, k * len(queries)),
+            "ms": ms,
+            "candidates": n_cand / max(1, len(queries)),
+        })
+    rows[0]["build_s"] = build_s
+    return rows
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--index", type=Path, help="реальный index.json вместо синтетики")
+    ap.add_argument("--n", type=int, default=100000)
+    ap.add_argument("--dim", type=int, default=256)
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--nlist", type=int, default=0)
+    ap.add_argument("--nprobe", default="1,2,4,8,16,32")
+    args = ap.parse_args(argv)
+
+    rng = np.random.default_rng(1)
+    if args.index:
+        store = IndexStore(args.index)
+        store.load()
+        matrix = np.asarray(store.embedding_matrix(), dtype=np.float32)
+        # Запросы — зашумлённые строки корпуса
+        picks = rng.choice(matrix.shape[0], size=min(args.queries, matrix.shape[0]), replace=False)
+        queries = matrix[picks] + 0.1 * rng.standard_normal((picks.size, matrix.shape[1])).astype(np.float32)
+    else:
+        matrix = synthetic_corpus(args.n, args.dim)
+        queries = synthetic_corpus(args.queries, args.dim, seed=2)
+    nprobes = [int(x) for x in args.nprobe.split(",") if x]
+    rows = run_benchmark(matrix, queries, k=args.k, nprobes=nprobes, nlist=args.nlist)
+    print(f"N={matrix.shape[0]} dim={matrix.shape[1]} k={args.k} build={rows[0]['build_s']:.2f}s")
+    print(f"{'nprobe':>8} {'recall':>8} {'ms/query':>10} {'candidates':>12}")
+    for r in rows:
+        label = "exact" if r["nprobe"] == 0 else str(r["nprobe"])
+        print(f"{label:>8} {r['recall']:>8.3f} {r['ms']:>10.2f} {r['candidates']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
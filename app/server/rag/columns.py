@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+from array import array
+from collections.abc import Sequence as SequenceABC
+from dataclasses import dataclass
+import json
+from itertools import accumulate
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from app.server.rag.mapped import Buffer, map_array, map_bytes, write_array
+from app.server.rag.quantize import Int8Row
+
+# Файлы колонок в каталоге поколения (читаются через mmap, см. ChunkColumns.attach)
+COLUMN_FILES = ("tables.json", "file_ids.i32", "title_ids.i32", "seqs.i32", "offsets.i64", "blob.utf8")
+
+
+@dataclass
+class IndexedChunk:
+    file: str
+    title: str
+    anchor: str
+    seq: int
+    embedding: List[float]
+    quote: str
+
+
+_CHUNK_FIELDS = ("file", "title", "anchor", "seq", "quote")
+
+
+def _same_chunk(a: IndexedChunk, b: Any) -> bool:
+    """Равенство элементов по полям; embedding (строка матрицы или список) — поэлементно."""
+    if not all(hasattr(b, f) for f in _CHUNK_FIELDS + ("embedding",)):
+        return False
+    if any(getattr(a, f) != getattr(b, f) for f in _CHUNK_FIELDS):
+        return False
+    return np.array_equal(np.asarray(a.embedding, dtype=np.float32), np.asarray(b.embedding, dtype=np.float32))
+
+
+def _intern(values: Iterable[str], table: List[str], ids: Dict[str, int]) -> array:
+    out = array("i")
+    for v in values:
+        i = ids.get(v)
+        if i is None:
+            i = ids[v] = len(table)
+            table.append(v)
+        out.append(i)
+    return out
+
+
+def _as_np(a: Union[array, np.ndarray], dtype: Any) -> np.ndarray:
+    if isinstance(a, np.ndarray):
+        return a
+    return np.frombuffer(a, dtype=dtype) if len(a) else np.zeros(0, dtype=dtype)
+
+
+class ChunkColumns:
+    """Метаданные индекса в параллельных массивах (struct-of-arrays).
+
+    file и title интернированы (список уникальных строк + array('i') id),
+    seq — array('i'), anchor и quote — срезы одной строки `blob` по offsets
+    (2 смещения на строку: начало anchor, начало quote; плюс общий конец).
+    После attach колонки — memmap поколения, а blob — UTF-8 байты (mmap),
+    смещения в байтах.
+    """
+
+    __slots__ = ("files", "file_ids", "titles", "title_ids", "seqs", "blob", "offsets")
+
+    def __init__(
+        self,
+        files: List[str],
+        file_ids: array,
+        titles: List[str],
+        title_ids: array,
+        seqs: array,
+        blob: Union[str, Buffer],
+        offsets: array,
+    ) -> None:
+        self.files = files
+        self.file_ids = file_ids
+        self.titles = titles
+        self.title_ids = title_ids
+        self.seqs = seqs
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_rows(
+        cls,
+        files: Iterable[str],
+        titles: Iterable[str],
+        anchors: Sequence[str],
+        seqs: Iterable[int],
+        quotes: Sequence[str],
+    ) -> "ChunkColumns":
+        file_table: List[str] = []
+        title_table: List[str] = []
+        file_ids = _intern(files, file_table, {})
+        title_ids = _intern((t or "" for t in titles), title_table, {})
+        pieces: List[str] = []
+        for a, q in zip(anchors, quotes):
+            pieces.append(a or "")
+            pieces.append(q or "")
+        offsets = array("q", [0])
+        offsets.extend(accumulate(len(p) for p in pieces))
+        return cls(file_table, file_ids, title_table, title_ids, array("i", seqs), "".join(pieces), offsets)
+
+    @classmethod
+    def from_items(cls, items: Sequence[Any]) -> "ChunkColumns":
+        return cls.from_rows(
+            [it.file for it in items],
+            [it.title for it in items],
+            [it.anchor for it in items],
+            [int(it.seq) for it in items],
+            [getattr(it, "quote", "") or "" for it in items],
+        )
+
+    @classmethod
+    def empty(cls) -> "ChunkColumns":
+        return cls.from_rows([], [], [], [], [])
+
+    def __len__(self) -> int:
+        return len(self.seqs)
+
+    def consistent(self, count: int) -> bool:
+        """Все колонки на count строк, а blob покрывает последнее смещение (проверка поколения с диска)."""
+        sizes = (len(self.file_ids), len(self.title_ids), len(self.seqs))
+        if sizes != (count, count, count) or len(self.offsets) != 2 * count + 1:
+            return False
+        return len(self.blob) >= int(self.offsets[-1])
+
+    def file(self, i: int) -> str:
+        return self.files[self.file_ids[i]]
+
+    def title(self, i: int) -> str:
+        return self.titles[self.title_ids[i]]
+
+    def _text(self, start: int, end: int) -> str:
+        s = self.blob[start:end]
+        return s if isinstance(s, str) else s.decode("utf-8")
+
+    def anchor(self, i: int) -> str:
+        return self._text(self.offsets[2 * i], self.offsets[2 * i + 1])
+
+    def quote(self, i: int) -> str:
+        return self._text(self.offsets[2 * i + 1], self.offsets[2 * i + 2])
+
+    def seq_array(self) -> np.ndarray:
+        """seq без копии (int32 поверх array('i'))."""
+        return _as_np(self.seqs, np.int32)
+
+    def file_id_array(self) -> np.ndarray:
+        return _as_np(self.file_ids, np.int32)
+
+    def title_id_array(self) -> np.ndarray:
+        return _as_np(self.title_ids, np.int32)
+
+    def take(self, rows: np.ndarray) -> "ChunkColumns":
+        """Подмножество строк в заданном порядке; таблицы файлов и заголовков общие."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not isinstance(self.blob, str):
+            r = rows.tolist()
+            return ChunkColumns.from_rows(
+                [self.file(i) for i in r], [self.title(i) for i in r], [self.anchor(i) for i in r],
+                [int(self.seqs[i]) for i in r], [self.quote(i) for i in r],
+            )
+        offs = _as_np(self.offsets, np.int64)
+        starts, mids, ends = offs[2 * rows], offs[2 * rows + 1], offs[2 * rows + 2]
+        blob = "".join(self.blob[s:e] for s, e in zip(starts.tolist(), ends.tolist()))
+        lengths = np.empty(2 * rows.size, dtype=np.int64)
+        lengths[0::2] = mids - starts
+        lengths[1::2] = ends - mids
+        offsets = array("q", [0])
+        offsets.frombytes(np.cumsum(lengths).astype(np.int64).tobytes())
+
+        def pick(a: array) -> array:
+            out = array("i")
+            out.frombytes(_as_np(a, np.int32)[rows].astype(np.int32).tobytes())
+            return out
+
+        return ChunkColumns(list(self.files), pick(self.file_ids), list(self.titles), pick(self.title_ids), pick(self.seqs), blob, offsets)
+
+    @classmethod
+    def concat(cls, parts: Sequence["ChunkColumns"]) -> "ChunkColumns":
+        return cls.from_rows(
+            [p.file(i) for p in parts for i in range(len(p))],
+            [p.title(i) for p in parts for i in range(len(p))],
+            [p.anchor(i) for p in parts for i in range(len(p))],
+            [int(p.seqs[i]) for p in parts for i in range(len(p))],
+            [p.quote(i) for p in parts for i in range(len(p))],
+        )
+
+    def save(self, directory: Path) -> None:
+        """Колонки в сырые файлы поколения; anchor/quote — в UTF-8 со смещениями в байтах."""
+        pieces: List[bytes] = []
+        for i in range(len(self)):
+            pieces.append(self.anchor(i).encode("utf-8"))
+            pieces.append(self.quote(i).encode("utf-8"))
+        offsets = np.zeros(len(pieces) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in pieces], dtype=np.int64)
+        tables = {"files": self.files, "titles": self.titles}
+        (directory / "tables.json").write_text(json.dumps(tables, ensure_ascii=False), encoding="utf-8")
+        write_array(directory / "file_ids.i32", _as_np(self.file_ids, np.int32), "<i4")
+        write_array(directory / "title_ids.i32", _as_np(self.title_ids, np.int32), "<i4")
+        write_array(directory / "seqs.i32", _as_np(self.seqs, np.int32), "<i4")
+        write_array(directory / "offsets.i64", offsets, "<i8")
+        with open(directory / "blob.utf8", "wb") as f:
+            f.write(b"".join(pieces))
+
+    @classmethod
+    def attach(cls, directory: Path, shared: bool = True) -> "ChunkColumns":
+        """Колонки поколения без разбора: массивы — memmap, blob — mmap (shared=False — копии в памяти)."""
+        tables = json.loads((directory / "tables.json").read_text(encoding="utf-8"))
+        return cls(
+            tables["files"],
+            map_array(directory / "file_ids.i32", "<i4", shared),
+            tables["titles"],
+            map_array(directory / "title_ids.i32", "<i4", shared),
+            map_array(directory / "seqs.i32", "<i4", shared),
+            map_bytes(directory / "blob.utf8", shared),
+            map_array(directory / "offsets.i64", "<i8", shared),
+        )
+
+
+class ChunkView(SequenceABC):
+    """Ленивая последовательность IndexedChunk поверх колонок и матрицы эмбеддингов.
+
+    Объекты создаются при обращении и не хранятся; embedding — строка матрицы
+    без копии (для int8 — разквантующая обёртка).
+    """
+
+    __slots__ = ("columns", "matrix", "scales")
+
+    def __init__(self, columns: ChunkColumns, matrix: np.ndarray, scales: Optional[np.ndarray] = None) -> None:
+        self.columns = columns
+        self.matrix = matrix
+        self.scales = scales
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def _row(self, i: int) -> IndexedChunk:
+        c = self.columns
+        emb = self.matrix[i] if self.scales is None else Int8Row(self.matrix[i], float(self.scales[i]))
+        return IndexedChunk(file=c.file(i), title=c.title(i), anchor=c.anchor(i), seq=int(c.seqs[i]), embedding=emb, quote=c.quote(i))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._row(j) for j in range(*i.indices(len(self)))]
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("index out of range")
+        return self._row(int(i))
+
+    def __iter__(self) -> Iterator[IndexedChunk]:
+        for i in range(len(self)):
+            yield self._row(i)
+
+    def __eq__(self, other: object) -> bool:
+        # Совместимость со списком, которым раньше был items
+        if isinstance(other, (list, tuple, ChunkView)):
+            return len(self) == len(other) and all(_same_chunk(a, b) for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"ChunkView({len(self)} chunks)"
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import json
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.server.rag.mapped import map_array, write_array
+
+# Сущность — основа слова, которое в корпусе пишется с заглавной буквы внутри предложения
+# не реже этой доли своих вхождений и хотя бы ENTITY_MIN_COUNT раз (имена, боги, места)
+ENTITY_MIN_CAPITAL_RATIO = 0.6
+ENTITY_MIN_COUNT = 2
+ENTITY_MIN_WORD_LEN = 4
+
+_WORD = re.compile(r"[A-Za-zА-Яа-яЁё]+")
+_SENTENCE_END = re.compile(r"[.!?…:;\n]")
+# Падежные окончания для грубой основы: «Павсания», «Павсанием» → «павсан»
+_ENDINGS = re.compile(r"(иями|ями|ами|ием|ией|иям|иях|ий|ия|ию|ии|ие|ей|ой|ом|ем|ам|ям|ах|ях|ов|ев|а|я|у|ю|е|ы|и|о|ь|й)$")
+_MIN_STEM = 3
+
+
+def stem(word: str) -> str:
+    w = word.lower()
+    m = _ENDINGS.search(w)
+    return w[: m.start()] if m and m.start() >= _MIN_STEM else w
+
+
+def _words(text: str) -> Iterable[Tuple[str, bool]]:
+    """(слово, начинает ли оно предложение) по тексту."""
+    last = 0
+    sentence_start = True
+    for m in _WORD.finditer(text):
+        if _SENTENCE_END.search(text, last, m.start()):
+            sentence_start = True
+        yield m.group(0), sentence_start
+        sentence_start = False
+        last = m.end()
+
+
+def _doc_stems(text: str) -> Set[str]:
+    return {stem(w) for w, _ in _words(text) if len(w) >= ENTITY_MIN_WORD_LEN}
+
+
+class EntityIndex:
+    """Постинги сущностей: основа → строки индекса, где она встречается (в заголовке или цитате).
+
+    Отдельно хранятся строки, где основа есть в заголовке (для буста). Строится при
+    переиндексации и лежит в поколении (entities/), читается через mmap.
+    """
+
+    def __init__(
+        self,
+        vocab: Sequence[str],
+        offsets: np.ndarray,
+        rows: np.ndarray,
+        title_offsets: np.ndarray,
+        title_rows: np.ndarray,
+        n_rows: int,
+    ) -> None:
+        self.vocab = list(vocab)
+        self.term_ids: Dict[str, int] = {t: i for i, t in enumerate(self.vocab)}
+        self.offsets = offsets
+        self.rows = rows
+        self.title_offsets = title_offsets
+        self.title_rows = title_rows
+        self.n_rows = n_rows
+
+    @classmethod
+    def build(cls, titles: Sequence[str], quotes: Sequence[str]) -> "EntityIndex":
+        capital: Counter = Counter()
+        total: Counter = Counter()
+        title_cache: Dict[str, Set[str]] = {}
+        for text in _texts(titles, quotes):
+            for w, sentence_start in _words(text):
+                if len(w) < ENTITY_MIN_WORD_LEN:
+                    continue
+                s = stem(w)
+                if sentence_start:
+                    # Начало предложения не говорит о регистре имени
+                    continue
+                total[s] += 1
+                if w[0].isupper():
+                    capital[s] += 1
+        vocab = sorted(s for s, c in capital.items() if c >= ENTITY_MIN_COUNT and c / total[s] >= ENTITY_MIN_CAPITAL_RATIO)
+        ids = {s: i for i, s in enumerate(vocab)}
+        postings: List[List[int]] = [[] for _ in vocab]
+        title_postings: List[List[int]] = [[] for _ in vocab]
+        for row, (title, quote) in enumerate(zip(titles, quotes)):
+            t = title or ""
+            in_title = title_cache.get(t)
+            if in_title is None:
+                in_title = title_cache[t] = {s for s in _doc_stems(t) if s in ids}
+            for s in in_title:
+                title_postings[ids[s]].append(row)
+            for s in in_title | {s for s in _doc_stems(quote or "") if s in ids}:
+                postings[ids[s]].append(row)
+        offsets, rows = _csr(postings)
+        title_offsets, title_rows = _csr(title_postings)
+        return cls(vocab, offsets, rows, title_offsets, title_rows, len(titles))
+
+    def rows_for(self, stems: Iterable[str], title: bool = False) -> np.ndarray:
+        """Объединение постингов основ (строки по возрастанию)."""
+        offsets, rows = (self.title_offsets, self.title_rows) if title else (self.offsets, self.rows)
+        parts = []
+        for s in stems:
+            i = self.term_ids.get(s)
+            if i is not None:
+                parts.append(rows[offsets[i] : offsets[i + 1]])
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts)).astype(np.int64) if len(parts) > 1 else np.asarray(parts[0], dtype=np.int64)
+
+    def match(self, tokens: Iterable[str], aliases: Optional[Dict[str, List[str]]] = None) -> List[List[str]]:
+        """Сущности среди токенов запроса: для каждой — её основы в корпусе с учётом синонимов словаря.
+
+        Порядок — по первому появлению в запросе, без повторов.
+        """
+        aliases = aliases or {}
+        out: Dict[Tuple[str, ...], None] = {}
+        for t in tokens:
+            s = stem(t)
+            group = tuple(a for a in aliases.get(s, [s]) if a in self.term_ids)
+            if group:
+                out.setdefault(group, None)
+        return [list(g) for g in out]
+
+    def save(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        meta = {"vocab": self.vocab, "n_rows": self.n_rows}
+        (directory / "vocab.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        write_array(directory / "offsets.i64", self.offsets, "<i8")
+        write_array(directory / "rows.i32", self.rows, "<i4")
+        write_array(directory / "title_offsets.i64", self.title_offsets, "<i8")
+        write_array(directory / "title_rows.i32", self.title_rows, "<i4")
+
+    @classmethod
+    def attach(cls, directory: Path, shared: bool = True) -> "EntityIndex":
+        meta = json.loads((directory / "vocab.json").read_text(encoding="utf-8"))
+        return cls(
+            meta["vocab"],
+            map_array(directory / "offsets.i64", "<i8", shared),
+            map_array(directory / "rows.i32", "<i4", shared),
+            map_array(directory / "title_offsets.i64", "<i8", shared),
+            map_array(directory / "title_rows.i32", "<i4", shared),
+            int(meta["n_rows"]),
+        )
+
+
+def _texts(titles: Sequence[str], quotes: Sequence[str]) -> Iterable[str]:
+    # Каждый заголовок учитывается один раз, а не на каждой строке раздела
+    seen: Set[str] = set()
+    for t in titles:
+        if t and t not in seen:
+            seen.add(t)
+            yield t
+    for q in quotes:
+        if q:
+            yield q
+
+
+def _csr(postings: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(p) for p in postings], dtype=np.int64)
+    rows = np.fromiter((r for p in postings for r in p), dtype=np.int32, count=int(offsets[-1]))
+    return offsets, rows
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.server.rag.lexical import BM25Index, doc_text
+
+# Двухэтапный поиск (по умолчанию выключен): сначала разделы (центроид + BM25 по разделу),
+# затем абзацы в top-M разделах; вместо IVF, а не поверх него
+HIER_RETRIEVAL = os.getenv("HIER_RETRIEVAL", "false").lower() == "true"
+HIER_TOP_SECTIONS = int(os.getenv("HIER_TOP_SECTIONS", "8"))
+# Меньше этого числа абзацев внутри границы — абзацы ранжируются напрямую
+HIER_MIN_ITEMS = int(os.getenv("HIER_MIN_ITEMS", "5000"))
+
+_BLOCK = 8192
+
+
+class SectionIndex:
+    """Разделы корпуса — группы абзацев с одинаковыми (file, title).
+
+    Для раздела хранятся нормированный центроид векторов его абзацев, минимальный
+    seq (раздел доступен, если начинается не дальше границы) и BM25-документ
+    «заголовок + цитаты абзацев». Строки раздела — в CSR (offsets, rows).
+    """
+
+    def __init__(
+        self,
+        section_of: np.ndarray,
+        offsets: np.ndarray,
+        rows: np.ndarray,
+        centroids: np.ndarray,
+        min_seqs: np.ndarray,
+        bm25: BM25Index,
+    ) -> None:
+        self.section_of = section_of
+        self.offsets = offsets
+        self.rows = rows
+        self.centroids = centroids
+        self.min_seqs = min_seqs
+        self.bm25 = bm25
+        self.n_sections = int(centroids.shape[0])
+
+    @classmethod
+    def build(cls, items: Sequence[Any], matrix: np.ndarray, inv_norms: np.ndarray) -> "SectionIndex":
+        n = len(items)
+        keys: Dict[Tuple[str, str], int] = {}
+        section_of = np.empty(n, dtype=np.int32)
+        for i, it in enumerate(items):
+            section_of[i] = keys.setdefault((it.file, it.title or ""), len(keys))
+        n_sec = len(keys)
+        rows = np.argsort(section_of, kind="stable").astype(np.int32)
+        offsets = np.zeros(n_sec + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(section_of, minlength=n_sec))
+
+        # Суммы нормированных векторов блоками по отсортированным строкам (reduceat по границам разделов)
+        dim = matrix.shape[1] if matrix.ndim == 2 else 0
+        centroids = np.zeros((n_sec, dim), dtype=np.float32)
+        for start in range(0, n, _BLOCK):
+            r = rows[start : start + _BLOCK]
+            sec = section_of[r]
+            vecs = np.asarray(matrix[r], dtype=np.float32) * inv_norms[r][:, None]
+            bounds = np.flatnonzero(np.r_[True, sec[1:] != sec[:-1]])
+            centroids[sec[bounds]] += np.add.reduceat(vecs, bounds, axis=0)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.where(norms == 0, 1.0, norms)
+
+        seqs = np.fromiter((int(it.seq) for it in items), dtype=np.int64, count=n)
+        min_seqs = np.minimum.reduceat(seqs[rows], offsets[:-1]) if n else np.zeros(0, dtype=np.int64)
+        titles = [""] * n_sec
+        for (_, title), sid in keys.items():
+            titles[sid] = title
+        docs = [
+            doc_text(titles[s], " ".join(items[j].quote or "" for j in rows[offsets[s] : offsets[s + 1]]))
+            for s in range(n_sec)
+        ]
+        return cls(section_of, offsets, rows, centroids, min_seqs, BM25Index.build(docs, min_seqs))
+
+    def top_sections(
+        self,
+        q_emb: Sequence[float],
+        q_tokens: List[str],
+        max_seq: Optional[int] = None,
+        top_m: Optional[int] = None,
+    ) -> np.ndarray:
+        """Первый этап: 0.6 * косинус с центроидом + 0.4 * нормированный BM25 раздела."""
+        top_m = max(1, HIER_TOP_SECTIONS if top_m is None else top_m)
+        q = np.asarray(q_emb, dtype=np.float32)
+        q_norm = float(np.linalg.norm(q))
+        score = np.zeros(self.n_sections, dtype=np.float64)
+        if q_norm and self.centroids.shape[1] == q.shape[0]:
+            score += 0.6 * (self.centroids @ q) / q_norm
+        docs, raw = self.bm25.score(q_tokens, max_seq)
+        if docs.size and float(raw.max()) > 0.0:
+            score[docs] += 0.4 * raw / float(raw.max())
+        candidates = np.arange(self.n_sections) if max_seq is None else np.flatnonzero(self.min_seqs <= max_seq)
+        if candidates.size <= top_m:
+            return candidates
+        part = candidates[np.argpartition(-score[candidates], top_m - 1)[:top_m]]
+        return np.sort(part)
+
+    def rows_of(self, sections: np.ndarray) -> np.ndarray:
+        """Второй этап: строки выбранных разделов по возрастанию."""
+        if sections.size == 0:
+            return np.zeros(0, dtype=np.int64)
+        parts = [self.rows[self.offsets[s] : self.offsets[s + 1]] for s in sections]
+        return np.sort(np.concatenate(parts)).astype(np.int64)
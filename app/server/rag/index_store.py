@@ -1,66 +1,704 @@
 from __future__ import annotations
 
 import json
-from dataclasses import asdict, dataclass
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Optional, Sequence, Tuple
 
+import numpy as np
+
+from app.server.rag import ann as ann_mod
+from app.server.rag.ann import IVFIndex
+from app.server.rag.hierarchy import SectionIndex
+from app.server.rag.columns import ChunkColumns, ChunkView, IndexedChunk
+from app.server.rag.entities import EntityIndex
+from app.server.rag.lexical import LexicalIndex
+from app.server.rag.mapped import map_array, write_array
+from app.server.rag.projection import Projection
+from app.server.rag.sections import SectionTable
+from app.server.rag import quantize as quantize_mod
+from app.server.rag.quantize import PRECISIONS, SCALE_DTYPE, check_precision, dequantize, quantize, recall_at_k
 from app.server.rag.reader import Chunk
 from app.server.utils.paths import DATA_ROOT
 
 INDEX_PATH = DATA_ROOT / "index.json"
 
+# Бинарный формат рядом с index.json: матрица (little-endian, row-major), заголовок meta.json
+# и сырые файлы колонок/норм/лексики
+BINARY_FORMAT_VERSION = 2
+VECTOR_DTYPE = np.dtype("<f4")
+
+# Поколения бинарного индекса: <stem>.gen/<id>/{vectors.f32,meta.json,колонки,bm25/}.
+# Поколение пишется во временный каталог, публикуется rename'ом, а текущее
+# выбирается атомарной заменой указателя <stem>.gen/CURRENT.
+INDEX_GENERATIONS_KEEP = int(os.getenv("INDEX_GENERATIONS_KEEP", "3"))
+_STALE_TMP_SECONDS = 3600
+
+# Как часто (сек) кэш индекса проверяет mtime/size файла; 0 — на каждом запросе
+INDEX_CHECK_INTERVAL = float(os.getenv("INDEX_CHECK_INTERVAL", "1.0"))
+
+# Общий режим для нескольких воркеров: колонки, нормы, BM25 и склейки подстрочного поиска
+# поколения открываются через mmap только для чтения, и страницы файлов делятся между
+# процессами через page cache. false — те же файлы читаются в память процесса.
+INDEX_SHARED = os.getenv("INDEX_SHARED", "true").lower() == "true"
+
+
+def generations_dir_for(path: Path) -> Path:
+    return path.with_name(path.stem + ".gen")
+
+
+def current_pointer_for(path: Path) -> Path:
+    return generations_dir_for(path) / "CURRENT"
+
+
+def read_current_generation(path: Path) -> Optional[str]:
+    try:
+        gen = current_pointer_for(path).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return gen or None
+
+
+def _new_generation_id() -> str:
+    # Сортируемый по времени идентификатор
+    return datetime.now().strftime("%Y%m%d-%H%M%S-%f") + "-" + uuid.uuid4().hex[:4]
 
-@dataclass
-class IndexedChunk:
-    file: str
-    title: str
-    anchor: str
-    seq: int
-    embedding: List[float]
-    quote: str
+
+def _fsync_dir(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_durable(path: Path, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _fsync_tree(root: Path) -> None:
+    """fsync всех файлов и каталогов поколения перед публикацией rename'ом."""
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            fd = os.open(os.path.join(dirpath, name), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        _fsync_dir(Path(dirpath))
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """Запись через временный файл и os.replace: читатель видит либо старое, либо новое содержимое."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{uuid.uuid4().hex[:6]}.tmp")
+    try:
+        _write_durable(tmp, data)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    _fsync_dir(path.parent)
+
+
+def gc_generations(path: Path, keep: Optional[int] = None) -> List[str]:
+    """Удалить старые поколения (кроме текущего и `keep` последних) и брошенные временные каталоги.
+
+    Уже открытые memmap старых поколений остаются валидными (POSIX), поэтому
+    читатели со старым снимком не ломаются.
+    """
+    keep = INDEX_GENERATIONS_KEEP if keep is None else keep
+    root = generations_dir_for(path)
+    if not root.exists():
+        return []
+    current = read_current_generation(path)
+    gens = sorted(p.name for p in root.iterdir() if p.is_dir() and not p.name.startswith("."))
+    survivors = set(gens[-max(1, keep):])
+    if current:
+        survivors.add(current)
+    removed = []
+    for name in gens:
+        if name not in survivors:
+            shutil.rmtree(root / name, ignore_errors=True)
+            removed.append(name)
+    now = time.time()
+    for p in root.iterdir():
+        if p.is_dir() and p.name.startswith(".tmp-") and now - p.stat().st_mtime > _STALE_TMP_SECONDS:
+            shutil.rmtree(p, ignore_errors=True)
+    return removed
 
 
 class IndexStore:
+    """Индекс абзацев: колонки метаданных (ChunkColumns) и одна матрица эмбеддингов.
+
+    `items`/`all()` — ленивое представление IndexedChunk поверх них; присваивание
+    списка IndexedChunk упаковывает его в колонки и матрицу.
+    """
+
     def __init__(self, path: Path = INDEX_PATH) -> None:
         self.path = path
-        self.items: List[IndexedChunk] = []
+        self.columns = ChunkColumns.empty()
+        # Матрица эмбеддингов (N x dim); при загрузке бинарного формата — memmap без копии
+        self.matrix: np.ndarray = np.zeros((0, 0), dtype=VECTOR_DTYPE)
+        # Поколение, из которого загружен (или в которое сохранён) стор
+        self.generation: Optional[str] = None
+        # Точность матрицы (float32/float16/int8), масштабы строк для int8 и оценка потери полноты
+        self.precision = "float32"
+        self.scales: Optional[np.ndarray] = None
+        self.quantization: Dict[str, Any] = {}
+        # Локальное понижение размерности (усечение/PCA), которым получены векторы; запросы проецируются так же
+        self.projection: Optional[Projection] = None
+        self._reset_derived()
+
+    @property
+    def items(self) -> ChunkView:
+        return ChunkView(self.columns, self.matrix, self.scales)
+
+    @items.setter
+    def items(self, items: Iterable[IndexedChunk]) -> None:
+        items = list(items)
+        self.columns = ChunkColumns.from_items(items)
+        self.matrix = _stack_embeddings(items)
+        self.precision, self.scales = "float32", None
+        self.generation = None
+        self._reset_derived()
+
+    def _reset_derived(self) -> None:
+        """Сбросить производные структуры (нормы, seq, лексический индекс, ANN) после смены items."""
+        self._inv_norms: Optional[np.ndarray] = None
+        self._seqs: Optional[np.ndarray] = None
+        self._lexical: Optional[LexicalIndex] = None
+        self._ann: Optional[IVFIndex] = None
+        self._ann_checked = False
+        self._sections: Optional[SectionIndex] = None
+        self._section_table: Optional[SectionTable] = None
+        self._entities: Optional[EntityIndex] = None
+
+    @property
+    def generation_dir(self) -> Path:
+        gen = self.generation or read_current_generation(self.path) or "_none"
+        return generations_dir_for(self.path) / gen
+
+    @property
+    def vectors_path(self) -> Path:
+        return self.generation_dir / PRECISIONS[self.precision][1]
+
+    @property
+    def scales_path(self) -> Path:
+        return self.generation_dir / "scales.f32"
+
+    @property
+    def projection_path(self) -> Path:
+        return self.generation_dir / "projection.npz"
+
+    @property
+    def meta_path(self) -> Path:
+        return self.generation_dir / "meta.json"
+
+    @property
+    def norms_path(self) -> Path:
+        return self.generation_dir / "inv_norms.f32"
+
+    @property
+    def bm25_path(self) -> Path:
+        return self.generation_dir / "bm25"
+
+    @property
+    def entities_path(self) -> Path:
+        return self.generation_dir / "entities"
+
+    @property
+    def ann_path(self) -> Path:
+        return self.generation_dir / "ivf.npz"
+
+    def has_binary(self) -> bool:
+        """Есть ли опубликованное поколение, не старее index.json."""
+        gen = read_current_generation(self.path)
+        if not gen or not (generations_dir_for(self.path) / gen / "meta.json").exists():
+            return False
+        if not self.path.exists():
+            return True
+        return current_pointer_for(self.path).stat().st_mtime_ns >= self.path.stat().st_mtime_ns
 
     def load(self) -> None:
+        if self.has_binary():
+            self.load_binary()
+        else:
+            self.load_json()
+        self._reset_derived()
+
+    def load_json(self) -> None:
+        self.quantization, self.projection = {}, None
         if not self.path.exists():
             self.items = []
             return
         data = json.loads(self.path.read_text(encoding="utf-8"))
-        fixed = []
-        for row in data:
-            if "quote" not in row:
-                row["quote"] = ""
-            fixed.append(row)
-        self.items = [IndexedChunk(**row) for row in fixed]
+        self.columns = ChunkColumns.from_rows(
+            [row["file"] for row in data],
+            [row["title"] for row in data],
+            [row["anchor"] for row in data],
+            [int(row["seq"]) for row in data],
+            [row.get("quote", "") for row in data],
+        )
+        self.matrix = np.asarray([row["embedding"] for row in data], dtype=VECTOR_DTYPE) if data else np.zeros((0, 0), dtype=VECTOR_DTYPE)
+        self.precision, self.scales, self.generation = "float32", None, None
+
+    def load_binary(self, generation: Optional[str] = None) -> None:
+        """Memory-map матрицы и колонок поколения; векторы и метаданные не копируются и не разбираются."""
+        self.generation = generation or read_current_generation(self.path)
+        meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+        if int(meta.get("version", 0)) != BINARY_FORMAT_VERSION:
+            raise ValueError(f"Поколение {self.generation}: неподдерживаемая версия формата {meta.get('version')}")
+        count, dim = int(meta["count"]), int(meta["dim"])
+        self.precision = check_precision(meta.get("precision", "float32"))
+        self.quantization = dict(meta.get("quantization") or {})
+        dtype = PRECISIONS[self.precision][0]
+        if count and dim:
+            matrix = np.memmap(self.vectors_path, dtype=dtype, mode="r", shape=(count, dim))
+        else:
+            matrix = np.zeros((count, dim), dtype=dtype)
+        scales = None
+        if self.precision == "int8":
+            scales = np.memmap(self.scales_path, dtype=SCALE_DTYPE, mode="r", shape=(count,)) if count else np.zeros(0, dtype=SCALE_DTYPE)
+        self.matrix = matrix
+        self.scales = scales
+        self.projection = Projection.load(self.projection_path) if self.projection_path.exists() else None
+        self.columns = ChunkColumns.attach(self.generation_dir, INDEX_SHARED)
+        if not self.columns.consistent(count):
+            raise ValueError(f"Поколение {self.generation} повреждено: колонки не совпадают с meta.json (count={count})")
 
     def save(self) -> None:
         self.path.parent.mkdir(parents=True, exist_ok=True)
-        data = [asdict(i) for i in self.items]
-        self.path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        c = self.columns
+        vectors = dequantize(self.matrix, self.scales).tolist()
+        data = [
+            {
+                "file": c.file(i),
+                "title": c.title(i),
+                "anchor": c.anchor(i),
+                "seq": int(c.seqs[i]),
+                "embedding": vectors[i],
+                "quote": c.quote(i),
+            }
+            for i in range(len(c))
+        ]
+        atomic_write_bytes(self.path, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+        self.save_binary()
+
+    def save_binary(self, precision: Optional[str] = None, ann: Optional[IVFIndex] = None) -> None:
+        """Записать новое поколение (матрица, колонки, нормы, лексика) и атомарно сделать его текущим.
+
+        Матрица хранится в точности `precision` (по умолчанию INDEX_VECTOR_PRECISION);
+        для float16/int8 в сайдкар пишется recall@10 относительно float32. Матрица,
+        уже хранящаяся в этой точности (после splice), не переквантуется, и оценка
+        recall берётся из прошлого поколения. `ann` — готовый IVF-индекс для этих строк.
+        """
+        precision = check_precision(precision or quantize_mod.INDEX_VECTOR_PRECISION)
+        root = generations_dir_for(self.path)
+        root.mkdir(parents=True, exist_ok=True)
+        gen = _new_generation_id()
+        tmp = root / f".tmp-{gen}"
+        tmp.mkdir()
+        recall = self.quantization.get("recall_at_10")
+        if precision == self.precision and (recall is not None or precision == "float32"):
+            matrix, scales, full = self.matrix, self.scales, None
+        else:
+            full = dequantize(self.matrix, self.scales)
+            matrix, scales = quantize(full, precision) if full.size else (full.astype(PRECISIONS[precision][0]), None)
+        dim = matrix.shape[1] if matrix.ndim == 2 else 0
+        quantization: Dict[str, Any] = {
+            "precision": precision,
+            "bytes_per_vector": int(matrix.itemsize * dim + (SCALE_DTYPE.itemsize if scales is not None else 0)),
+        }
+        if precision != "float32":
+            quantization["recall_at_10"] = recall if full is None else round(recall_at_k(full, precision), 4)
+        meta = {
+            "version": BINARY_FORMAT_VERSION,
+            "count": int(matrix.shape[0]),
+            "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+            "dtype": matrix.dtype.str,
+            "precision": precision,
+            "quantization": quantization,
+        }
+        lexical = LexicalIndex.from_items(self.items)
+        entities = _build_entities(self.columns)
+        inv_norms = _inverse_norms(matrix)
+        if not ann_mod.should_build(len(self.items)):
+            ann = None
+        elif ann is None or ann.n_items != len(self.items):
+            ann = IVFIndex.build(matrix, inv_norms, ann_mod.ANN_NLIST)
+        try:
+            _write_durable(tmp / PRECISIONS[precision][1], np.ascontiguousarray(matrix).tobytes())
+            if scales is not None:
+                _write_durable(tmp / "scales.f32", scales.tobytes())
+            self.columns.save(tmp)
+            write_array(tmp / "inv_norms.f32", inv_norms, "<f4")
+            lexical.save(tmp)
+            entities.save(tmp / "entities")
+            _write_durable(tmp / "meta.json", json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+            if ann is not None:
+                ann.save(tmp / "ivf.npz")
+            if self.projection is not None:
+                self.projection.save(tmp / "projection.npz")
+            # Колонки, лексика и сущности пишутся обычной записью: до публикации всё должно быть на диске
+            _fsync_tree(tmp)
+            os.rename(tmp, root / gen)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        _fsync_dir(root)
+        atomic_write_bytes(current_pointer_for(self.path), gen.encode("utf-8"))
+        self.generation = gen
+        self.precision, self.scales, self.quantization = precision, scales, quantization
+        self.matrix = matrix
+        self._inv_norms = inv_norms
+        self._lexical = lexical
+        self._entities = entities
+        self._ann, self._ann_checked = ann, True
+        gc_generations(self.path)
 
     def rebuild(self, chunks: List[Chunk], embeddings: List[List[float]]) -> None:
-        assert len(chunks) == len(embeddings)
-        def make_quote(text: str, max_len: int = 200) -> str:
-            t = " ".join(text.strip().split())
-            return t if len(t) <= max_len else t[: max_len - 1] + "…"
-
-        self.items = [
-            IndexedChunk(
-                file=c.file,
-                title=c.title,
-                anchor=c.anchor,
-                seq=c.seq,
-                embedding=emb,
-                quote=make_quote(c.text),
-            )
-            for c, emb in zip(chunks, embeddings)
-        ]
+        self.items = _to_items(chunks, embeddings)
+        self._reset_derived()
         self.save()
 
-    def all(self) -> List[IndexedChunk]:
+    def splice(
+        self,
+        files: Iterable[str],
+        chunks: List[Chunk],
+        embeddings: List[List[float]],
+        order: Optional[Sequence[str]] = None,
+    ) -> None:
+        """Заменить элементы перечисленных файлов новыми чанками и сохранить.
+
+        Элементы остальных файлов (и их seq) не меняются; `order` — порядок файлов
+        в индексе (как при полном разборе), сортировка устойчивая.
+
+        Пишется только новое бинарное поколение: index.json остаётся от последней
+        полной пересборки (загрузка берёт поколение, оно новее). Оставшиеся строки
+        матрицы не переквантуются, а IVF-индекс дописывается без k-means
+        (см. ann.can_splice).
+        """
+        drop = set(files)
+        c = self.columns
+        drop_ids = [fid for fid, f in enumerate(c.files) if f in drop]
+        keep = np.flatnonzero(~np.isin(c.file_id_array(), drop_ids))
+        fresh = _to_items(chunks, embeddings)
+        columns = ChunkColumns.concat([c.take(keep), ChunkColumns.from_items(fresh)])
+        added = _stack_embeddings(fresh)
+        precision = check_precision(quantize_mod.INDEX_VECTOR_PRECISION)
+        old_ann = self.ann() if ann_mod.INDEX_ANN else None
+        if precision != self.precision or (precision != "float32" and "recall_at_10" not in self.quantization):
+            # Другая точность: всё переквантуется при сохранении
+            kept = dequantize(self.matrix[keep], None if self.scales is None else self.scales[keep])
+            kept_scales, added_q, added_scales = None, added, None
+            precision = "float32"
+        else:
+            kept = np.asarray(self.matrix[keep])
+            kept_scales = None if self.scales is None else np.asarray(self.scales[keep])
+            added_q, added_scales = quantize(added, precision) if fresh else (added, None)
+        if not fresh:
+            matrix, scales = kept, kept_scales
+        elif not keep.size:
+            matrix, scales = added_q, added_scales
+        else:
+            matrix = np.vstack([kept, added_q])
+            scales = None if kept_scales is None else np.concatenate([kept_scales, added_scales])
+        perm = None
+        if order is not None:
+            rank = {f: i for i, f in enumerate(order)}
+            file_rank = np.asarray([rank.get(f, len(rank)) for f in columns.files], dtype=np.int64)
+            perm = np.argsort(file_rank[columns.file_id_array()], kind="stable")
+            columns, matrix = columns.take(perm), matrix[perm]
+            scales = None if scales is None else scales[perm]
+        ann = None
+        dim = added.shape[1] if added.ndim == 2 else 0
+        if ann_mod.can_splice(old_ann, keep.size, len(fresh), dim):
+            ann = old_ann.splice(keep, added, _inverse_norms(added), perm)
+        self.columns = columns
+        self.matrix = np.ascontiguousarray(matrix, dtype=PRECISIONS[precision][0])
+        self.precision, self.scales, self.generation = precision, scales, None
+        self._reset_derived()
+        self.save_binary(ann=ann)
+
+    def all(self) -> ChunkView:
         return self.items
+
+    def embedding_matrix(self) -> np.ndarray:
+        """Матрица эмбеддингов в порядке items (N x dim; float32, float16 или int8)."""
+        return self.matrix
+
+    def inverse_norms(self) -> np.ndarray:
+        """1/||v|| для каждой строки (0 для нулевых векторов); считается один раз на загрузку."""
+        if self._inv_norms is None:
+            inv_norms = None
+            if self.generation is not None and self.norms_path.exists():
+                inv_norms = map_array(self.norms_path, "<f4", INDEX_SHARED)
+            if inv_norms is None or inv_norms.shape[0] != self.matrix.shape[0]:
+                inv_norms = _inverse_norms(self.embedding_matrix())
+            self._inv_norms = inv_norms
+        return self._inv_norms
+
+    def seq_array(self) -> np.ndarray:
+        if self._seqs is None or self._seqs.shape[0] != len(self.columns):
+            self._seqs = self.columns.seq_array()
+        return self._seqs
+
+    def lexical(self) -> LexicalIndex:
+        """BM25 и подстрочный поиск из поколения (mmap), иначе строятся по items."""
+        if self._lexical is None or self._lexical.hay.n_docs != len(self.items):
+            lexical = None
+            if self.generation is not None and self.bm25_path.is_dir():
+                try:
+                    lexical = LexicalIndex.attach(self.generation_dir, INDEX_SHARED)
+                except Exception:
+                    lexical = None
+            if lexical is None or lexical.hay.n_docs != len(self.items):
+                lexical = LexicalIndex.from_items(self.items)
+            self._lexical = lexical
+        return self._lexical
+
+    def sections(self) -> SectionIndex:
+        """Разделы (file, title) с центроидами и BM25; строятся один раз на загрузку."""
+        if self._sections is None or self._sections.section_of.shape[0] != len(self.items):
+            self._sections = SectionIndex.build(self.items, self.embedding_matrix(), self.inverse_norms())
+        return self._sections
+
+    def entities(self) -> EntityIndex:
+        """Постинги сущностей из поколения (mmap), иначе строятся по колонкам."""
+        if self._entities is None or self._entities.n_rows != len(self.columns):
+            entities = None
+            if self.generation is not None and self.entities_path.is_dir():
+                try:
+                    entities = EntityIndex.attach(self.entities_path, INDEX_SHARED)
+                except Exception:
+                    entities = None
+            if entities is None or entities.n_rows != len(self.columns):
+                entities = _build_entities(self.columns)
+            self._entities = entities
+        return self._entities
+
+    def section_table(self) -> SectionTable:
+        """Оглавление (заголовок → диапазон seq, основа → первый seq); один раз на загрузку."""
+        table = self._section_table
+        if table is None or table.n_rows != len(self.columns):
+            c = self.columns
+            table = SectionTable.build(c.titles, c.title_id_array(), self.seq_array(), self.lexical())
+            self._section_table = table
+        return table
+
+    def ann(self) -> Optional[IVFIndex]:
+        """IVF-индекс текущего поколения, если он построен для этих items; иначе None (точный поиск)."""
+        if not self._ann_checked:
+            self._ann_checked = True
+            if self.generation is not None and self.ann_path.exists():
+                try:
+                    ann = IVFIndex.load(self.ann_path)
+                except Exception:
+                    ann = None
+                if ann is not None and ann.n_items == len(self.items):
+                    self._ann = ann
+        return self._ann
+
+
+def _make_quote(text: str, max_len: int = 200) -> str:
+    t = " ".join(text.strip().split())
+    return t if len(t) <= max_len else t[: max_len - 1] + "…"
+
+
+def _to_items(chunks: List[Chunk], embeddings: List[List[float]]) -> List[IndexedChunk]:
+    assert len(chunks) == len(embeddings)
+    return [
+        IndexedChunk(
+            file=c.file,
+            title=c.title,
+            anchor=c.anchor,
+            seq=c.seq,
+            embedding=emb,
+            quote=_make_quote(c.text),
+        )
+        for c, emb in zip(chunks, embeddings)
+    ]
+
+
+def _stack_embeddings(items: List[IndexedChunk]) -> np.ndarray:
+    if not items:
+        return np.zeros((0, 0), dtype=VECTOR_DTYPE)
+    return np.asarray([i.embedding for i in items], dtype=VECTOR_DTYPE)
+
+
+def _inverse_norms(matrix: np.ndarray) -> np.ndarray:
+    norms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix, dtype=np.float32)) if matrix.size else np.zeros(matrix.shape[0], dtype=np.float32)
+    inv = np.zeros_like(norms)
+    np.divide(1.0, norms, out=inv, where=norms > 0)
+    return inv
+
+
+def _build_entities(c: ChunkColumns) -> EntityIndex:
+    return EntityIndex.build([c.title(i) for i in range(len(c))], [c.quote(i) for i in range(len(c))])
+
+
+def _seq_array(items: List[IndexedChunk]) -> np.ndarray:
+    return np.fromiter((int(i.seq) for i in items), dtype=np.int64, count=len(items))
+
+
+def vectors_of(store: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """(матрица, обратные нормы) для IndexStore или любого стора с методом all()."""
+    if isinstance(store, IndexStore):
+        return store.embedding_matrix(), store.inverse_norms()
+    matrix = _stack_embeddings(store.all())
+    return matrix, _inverse_norms(matrix)
+
+
+def seqs_of(store: Any) -> np.ndarray:
+    if isinstance(store, IndexStore):
+        return store.seq_array()
+    return _seq_array(store.all())
+
+
+def lexical_of(store: Any) -> LexicalIndex:
+    if isinstance(store, IndexStore):
+        return store.lexical()
+    return LexicalIndex.from_items(store.all())
+
+
+def sections_of(store: Any) -> SectionIndex:
+    if isinstance(store, IndexStore):
+        return store.sections()
+    matrix, inv_norms = vectors_of(store)
+    return SectionIndex.build(store.all(), matrix, inv_norms)
+
+
+def entities_of(store: Any) -> EntityIndex:
+    if isinstance(store, IndexStore):
+        return store.entities()
+    items = store.all()
+    return EntityIndex.build([it.title or "" for it in items], [getattr(it, "quote", "") or "" for it in items])
+
+
+def section_table_of(store: Any) -> SectionTable:
+    if isinstance(store, IndexStore):
+        return store.section_table()
+    return SectionTable.from_items(store.all())
+
+
+def ann_of(store: Any) -> Optional[IVFIndex]:
+    if isinstance(store, IndexStore) and ann_mod.INDEX_ANN:
+        return store.ann()
+    return None
+
+
+def convert_json_index(path: Path = INDEX_PATH) -> IndexStore:
+    """Разовая конвертация существующего index.json в бинарное поколение."""
+    store = IndexStore(path)
+    store.load_json()
+    store.save_binary()
+    return store
+
+
+def _file_signature(path: Path) -> Optional[Tuple[int, int, int, int]]:
+    sig: List[int] = []
+    for p in (path, current_pointer_for(path)):
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            sig.extend((0, -1))
+            continue
+        sig.extend((st.st_mtime_ns, st.st_size))
+    if sig == [0, -1, 0, -1]:
+        return None
+    return tuple(sig)  # type: ignore[return-value]
+
+
+class IndexCache:
+    """Общий для процесса загруженный индекс.
+
+    Файл перечитывается только при смене mtime/size index.json или указателя
+    поколения (проверка не чаще `check_interval` секунд) или при явной публикации
+    нового стора после переиндексации. Запросы, уже получившие стор, дорабатывают
+    со своим снимком; новые получают новое поколение. Счётчики hits/misses/reloads
+    показывают, ходил ли горячий путь на диск. Кэш свой у каждого воркера: поколение,
+    опубликованное другим процессом, подхватывается по смене указателя CURRENT.
+    """
+
+    def __init__(self, path: Path = INDEX_PATH, check_interval: float = INDEX_CHECK_INTERVAL) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._store: Optional[IndexStore] = None
+        self._signature: Optional[Tuple[int, int, int, int]] = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def get(self) -> IndexStore:
+        now = time.monotonic()
+        store = self._store
+        if store is not None and now - self._checked_at < self.check_interval:
+            self.hits += 1
+            return store
+        with self._lock:
+            sig = _file_signature(self.path)
+            self._checked_at = now
+            if self._store is not None and sig == self._signature:
+                self.hits += 1
+                return self._store
+            if self._store is None:
+                self.misses += 1
+            else:
+                self.reloads += 1
+            fresh = IndexStore(self.path)
+            fresh.load()
+            self._store = fresh
+            self._signature = sig
+            return fresh
+
+    def publish(self, store: IndexStore) -> None:
+        """Подменить закэшированный стор уже загруженным (например, после reindex)."""
+        with self._lock:
+            self._store = store
+            self._signature = _file_signature(self.path)
+            self._checked_at = time.monotonic()
+            self.reloads += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._store = None
+            self._signature = None
+            self._checked_at = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        store = self._store
+        return {
+            "path": str(self.path),
+            "loaded": store is not None,
+            "generation": store.generation if store is not None else None,
+            "shared": INDEX_SHARED,
+            "pid": os.getpid(),
+            "quantization": dict(store.quantization) if store is not None else {},
+            "items": len(store.all()) if store is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+        }
+
+
+if __name__ == "__main__":
+    # python -m app.server.rag.index_store [path/to/index.json]
+    target = Path(sys.argv[1]) if len(sys.argv) > 1 else INDEX_PATH
+    converted = convert_json_index(target)
+    print(f"converted {len(converted.all())} items -> {converted.generation_dir}")
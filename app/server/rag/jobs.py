@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+# Доля общего прогресса, приходящаяся на стадии переиндексации
+_STAGE_SPAN = {
+    "queued": (0.0, 0.0),
+    "parse": (0.0, 5.0),
+    "embed": (5.0, 95.0),
+    "save": (95.0, 100.0),
+    "done": (100.0, 100.0),
+}
+
+
+class ReindexCancelled(Exception):
+    """Задача переиндексации отменена пользователем."""
+
+
+@dataclass
+class ReindexJob:
+    id: str
+    status: str = "queued"  # queued | running | done | error | cancelled
+    stage: str = "queued"  # queued | parse | embed | save | done
+    done: int = 0
+    total: int = 0
+    items: Optional[int] = None
+    result: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    _cancel: threading.Event = field(default_factory=threading.Event, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def percent(self) -> float:
+        lo, hi = _STAGE_SPAN.get(self.stage, (0.0, 0.0))
+        frac = (self.done / self.total) if self.total else 0.0
+        return round(lo + (hi - lo) * min(1.0, frac), 1)
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def report(self, stage: str, done: int = 0, total: int = 0) -> None:
+        """Колбэк прогресса для rebuild_index; бросает ReindexCancelled после отмены."""
+        if self._cancel.is_set():
+            raise ReindexCancelled()
+        with self._lock:
+            self.stage, self.done, self.total = stage, done, total
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "percent": self.percent,
+            "done": self.done,
+            "total": self.total,
+            "items": self.items,
+            "result": dict(self.result),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobRunner:
+    """Фоновый исполнитель переиндексаций: одна задача за раз, остальные ждут в очереди."""
+
+    def __init__(self, history: int = 20) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reindex")
+        self._jobs: "OrderedDict[str, ReindexJob]" = OrderedDict()
+        self._history = history
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[[ReindexJob], Optional[Dict[str, Any]]]) -> ReindexJob:
+        job = ReindexJob(id=uuid.uuid4().hex[:12])
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        self._pool.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: ReindexJob, fn: Callable[[ReindexJob], Optional[Dict[str, Any]]]) -> None:
+        if job.cancel_requested:
+            job.status, job.finished_at = "cancelled", time.time()
+            return
+        job.status, job.started_at = "running", time.time()
+        try:
+            result = fn(job) or {}
+            job.result = result
+            job.items = result.get("items")
+            with job._lock:
+                job.stage, job.done, job.total = "done", 1, 1
+            job.status = "done"
+        except ReindexCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status, job.error = "error", str(e)
+        finally:
+            job.finished_at = time.time()
+
+    def _trim(self) -> None:
+        finished = [j.id for j in self._jobs.values() if j.status in ("done", "error", "cancelled")]
+        while len(self._jobs) > self._history and finished:
+            self._jobs.pop(finished.pop(0), None)
+
+    def get(self, job_id: str) -> Optional[ReindexJob]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[ReindexJob]:
+        job = self._jobs.get(job_id)
+        if job is not None and job.status in ("queued", "running"):
+            job.cancel()
+        return job
+
+    def list(self) -> List[ReindexJob]:
+        return list(self._jobs.values())
+
+    def cancel_all(self) -> None:
+        """Отменить все незавершённые задачи (при остановке приложения)."""
+        for job in list(self._jobs.values()):
+            if job.status in ("queued", "running"):
+                job.cancel()
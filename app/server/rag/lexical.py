@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import json
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.server.rag.mapped import Buffer, map_array, map_bytes, write_array
+
+_TOKEN_SPLIT = re.compile(r"[^\wа-яА-ЯёЁ]+")
+
+# Параметры BM25 (как и раньше в retriever)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Токены длиннее двух символов в нижнем регистре."""
+    return [t for t in _TOKEN_SPLIT.split(text.lower()) if len(t) > 2]
+
+
+def doc_text(title: Optional[str], quote: Optional[str]) -> str:
+    """Текст документа для лексического поиска: title + quote."""
+    return f"{title or ''} {quote or ''}".lower()
+
+
+class BM25Index:
+    """Инвертированный индекс в CSR-виде: для термина — doc id и tf, упорядоченные по seq.
+
+    Статистики (df, N, avgdl, idf) берутся из постингов, поэтому стоимость запроса
+    пропорциональна числу затронутых постингов, а не размеру корпуса. Для границы
+    чтения (seq <= max_seq) N и сумма длин берутся из префиксных сумм по корпусу,
+    отсортированному по seq, а df — бинарным поиском в постингах термина.
+    """
+
+    def __init__(
+        self,
+        vocab: Sequence[str],
+        offsets: np.ndarray,
+        doc_ids: np.ndarray,
+        tfs: np.ndarray,
+        doc_len: np.ndarray,
+        doc_seqs: np.ndarray,
+        derived: Optional[Dict[str, np.ndarray]] = None,
+    ) -> None:
+        self.vocab = list(vocab)
+        self.term_ids: Dict[str, int] = {t: i for i, t in enumerate(self.vocab)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.doc_seqs = doc_seqs
+        self.n_docs = int(doc_len.shape[0])
+        self.total_len = int(doc_len.sum()) if self.n_docs else 0
+        if derived is not None:
+            # Сохранённые производные массивы (load_dir): не пересчитываются в каждом процессе
+            self.sorted_seqs = derived["sorted_seqs"]
+            self.cum_len = derived["cum_len"]
+            self.post_seqs = derived["post_seqs"]
+            self.idf = derived["idf"]
+            return
+        order = np.argsort(doc_seqs, kind="stable")
+        self.sorted_seqs = doc_seqs[order]
+        self.cum_len = np.concatenate(([0], np.cumsum(doc_len[order], dtype=np.int64)))
+        self.post_seqs = doc_seqs[doc_ids]
+        df = np.diff(offsets).astype(np.float64)
+        n = float(max(1, self.n_docs))
+        self.idf = np.maximum(0.0, np.log((n - df + 0.5) / (df + 0.5))) if df.size else np.zeros(0)
+
+    @classmethod
+    def build(cls, docs: Iterable[str], seqs: Optional[Sequence[int]] = None) -> "BM25Index":
+        counts = [Counter(tokenize(text)) for text in docs]
+        doc_seqs = np.arange(len(counts), dtype=np.int64) if seqs is None else np.asarray(seqs, dtype=np.int64)
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        # Обходим документы по возрастанию seq, чтобы постинги были отсортированы по seq
+        for doc_id in np.argsort(doc_seqs, kind="stable").tolist():
+            for term, tf in counts[doc_id].items():
+                ids, freqs = postings.setdefault(term, ([], []))
+                ids.append(doc_id)
+                freqs.append(tf)
+        vocab = sorted(postings)
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        for i, term in enumerate(vocab):
+            offsets[i + 1] = offsets[i] + len(postings[term][0])
+        doc_ids = np.fromiter((d for t in vocab for d in postings[t][0]), dtype=np.int32, count=int(offsets[-1]))
+        tfs = np.fromiter((f for t in vocab for f in postings[t][1]), dtype=np.int32, count=int(offsets[-1]))
+        lengths = np.fromiter((sum(c.values()) for c in counts), dtype=np.int32, count=len(counts))
+        return cls(vocab, offsets, doc_ids, tfs, lengths, doc_seqs)
+
+    def prefix_size(self, max_seq: Optional[int]) -> int:
+        """Число документов с seq <= max_seq (бинарный поиск)."""
+        if max_seq is None:
+            return self.n_docs
+        return int(np.searchsorted(self.sorted_seqs, max_seq, side="right"))
+
+    def postings(self, term: str, max_seq: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        tid = self.term_ids.get(term)
+        if tid is None:
+            return self.doc_ids[:0], self.tfs[:0]
+        lo, hi = int(self.offsets[tid]), int(self.offsets[tid + 1])
+        if max_seq is not None:
+            hi = lo + int(np.searchsorted(self.post_seqs[lo:hi], max_seq, side="right"))
+        return self.doc_ids[lo:hi], self.tfs[lo:hi]
+
+    def score(self, q_tokens: Iterable[str], max_seq: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Сырые BM25-скоры документов, содержащих хотя бы один термин запроса.
+
+        При max_seq N, df и avgdl считаются только по документам с seq <= max_seq,
+        как если бы индекс был построен по этому префиксу. Возвращает (doc_ids, scores).
+        """
+        terms = sorted(set(q_tokens))
+        n_docs = self.prefix_size(max_seq)
+        total = self.total_len if max_seq is None else int(self.cum_len[n_docs])
+        N = max(1, n_docs)
+        avgdl = (total / N) or 1.0
+        ids_parts: List[np.ndarray] = []
+        contrib_parts: List[np.ndarray] = []
+        for term in terms:
+            ids, tfs = self.postings(term, max_seq)
+            n = ids.size
+            if n == 0:
+                continue
+            idf = max(0.0, math.log((N - n + 0.5) / (n + 0.5)))
+            f = tfs.astype(np.float64)
+            dl = self.doc_len[ids].astype(np.float64)
+            denom = f + BM25_K1 * (1 - BM25_B + BM25_B * (dl / avgdl))
+            ids_parts.append(ids)
+            contrib_parts.append(idf * ((f * (BM25_K1 + 1)) / denom))
+        if not ids_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        docs, inverse = np.unique(np.concatenate(ids_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contrib_parts), minlength=docs.size)
+        return docs.astype(np.int64), scores
+
+    _ARRAYS = ("offsets", "doc_ids", "tfs", "doc_len", "doc_seqs", "sorted_seqs", "cum_len", "post_seqs", "idf")
+
+    def save_dir(self, path: Path) -> None:
+        """Каталог .npy (включая производные массивы) для load_dir с mmap."""
+        path.mkdir(parents=True, exist_ok=True)
+        (path / "vocab.json").write_text(json.dumps(self.vocab, ensure_ascii=False), encoding="utf-8")
+        for name in self._ARRAYS:
+            np.save(path / f"{name}.npy", np.ascontiguousarray(getattr(self, name)))
+
+    @classmethod
+    def load_dir(cls, path: Path, shared: bool = True) -> "BM25Index":
+        """Постинги из save_dir; при shared массивы — memmap только для чтения."""
+        vocab = json.loads((path / "vocab.json").read_text(encoding="utf-8"))
+        arrays = {name: np.load(path / f"{name}.npy", mmap_mode="r" if shared else None) for name in cls._ARRAYS}
+        derived = {name: arrays.pop(name) for name in ("sorted_seqs", "cum_len", "post_seqs", "idf")}
+        return cls(vocab, derived=derived, **arrays)
+
+
+class SubstringIndex:
+    """Поиск документов по подстроке в одной склейке текстов (без цикла по документам).
+
+    Склейка — str либо UTF-8 байты (mmap поколения, см. attach); во втором случае
+    starts — смещения в байтах, а искомая подстрока кодируется перед поиском.
+    """
+
+    SEP = "\x00"
+
+    def __init__(self, texts: Iterable[str]) -> None:
+        parts = list(texts)
+        self.blob: Union[str, Buffer] = self.SEP.join(parts)
+        starts = np.zeros(len(parts), dtype=np.int64)
+        if parts:
+            starts[1:] = np.cumsum([len(t) + 1 for t in parts[:-1]], dtype=np.int64)
+        self.starts = starts
+        self.n_docs = len(parts)
+
+    def docs_containing(self, needle: str) -> np.ndarray:
+        out: List[int] = []
+        if not needle or not self.n_docs:
+            return np.asarray(out, dtype=np.int64)
+        blob = self.blob
+        key = needle if isinstance(blob, str) else needle.encode("utf-8")
+        pos = blob.find(key)
+        while pos != -1:
+            d = int(np.searchsorted(self.starts, pos, side="right")) - 1
+            out.append(d)
+            if d + 1 >= self.n_docs:
+                break
+            pos = blob.find(key, int(self.starts[d + 1]))
+        return np.asarray(out, dtype=np.int64)
+
+    def save(self, directory: Path, name: str) -> None:
+        parts = self.blob.split(self.SEP) if self.n_docs else []
+        encoded = [t.encode("utf-8") for t in parts]
+        starts = np.zeros(len(encoded), dtype=np.int64)
+        if encoded:
+            starts[1:] = np.cumsum([len(t) + 1 for t in encoded[:-1]], dtype=np.int64)
+        with open(directory / f"{name}.utf8", "wb") as f:
+            f.write(self.SEP.encode("utf-8").join(encoded))
+        write_array(directory / f"{name}_starts.i64", starts, "<i8")
+
+    @classmethod
+    def attach(cls, directory: Path, name: str, shared: bool = True) -> "SubstringIndex":
+        obj = cls.__new__(cls)
+        obj.blob = map_bytes(directory / f"{name}.utf8", shared)
+        obj.starts = map_array(directory / f"{name}_starts.i64", "<i8", shared)
+        obj.n_docs = int(obj.starts.shape[0])
+        return obj
+
+
+class LexicalIndex:
+    """Лексические структуры стора: BM25 по title+quote и подстрочный поиск."""
+
+    def __init__(self, bm25: BM25Index, hay: SubstringIndex) -> None:
+        self.bm25 = bm25
+        self.hay = hay
+
+    @classmethod
+    def from_items(cls, items: Sequence) -> "LexicalIndex":
+        docs = [doc_text(it.title, getattr(it, "quote", "")) for it in items]
+        bm25 = BM25Index.build(docs, [int(it.seq) for it in items])
+        return cls(bm25, SubstringIndex(docs))
+
+    def save(self, directory: Path) -> None:
+        self.bm25.save_dir(directory / "bm25")
+        self.hay.save(directory, "hay")
+
+    @classmethod
+    def attach(cls, directory: Path, shared: bool = True) -> "LexicalIndex":
+        """Лексические структуры поколения без перестройки (mmap при shared)."""
+        return cls(
+            BM25Index.load_dir(directory / "bm25", shared),
+            SubstringIndex.attach(directory, "hay", shared),
+        )
+
+    def keyword_hits(self, q_tokens: Sequence[str]) -> np.ndarray:
+        """Для каждого документа — число токенов запроса, входящих подстрокой в title+quote."""
+        hits = np.zeros(self.hay.n_docs, dtype=np.float64)
+        for t in q_tokens:
+            hits[self.hay.docs_containing(t)] += 1.0
+        return hits
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.server.utils.paths import BOOK_DIR
+
+# Словарь книги (говорящие, триггеры чтения, анахронизмы, синонимы имён): явный путь
+# к JSON или все *.lexicon.json рядом с книгой в BOOK_DIR
+BOOK_LEXICON = os.getenv("BOOK_LEXICON", "")
+
+_SPACES = re.compile(r"[^\S\n]+")
+
+
+@dataclass(frozen=True)
+class Match:
+    category: str
+    key: str
+    start: int
+    end: int
+
+
+class AhoCorasick:
+    """Автомат Ахо–Корасик: все вхождения всех шаблонов за один проход по тексту.
+
+    Шаблон несёт (category, key, word); при word совпадение засчитывается только
+    на границах слов.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, str, str, bool]]) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, str, int, bool]]] = [[]]
+        for text, category, key, word in patterns:
+            if not text:
+                continue
+            node = 0
+            for ch in text:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append((category, key, len(text), word))
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                # У узлов первого уровня суффиксная ссылка — в корень
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def scan(self, text: str) -> List[Match]:
+        out: List[Match] = []
+        goto, fail, outputs = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for category, key, length, word in outputs[node]:
+                start = i + 1 - length
+                if word and not _word_bounded(text, start, i + 1):
+                    continue
+                out.append(Match(category, key, start, i + 1))
+        out.sort(key=lambda m: (m.start, m.end))
+        return out
+
+
+def _word_bounded(text: str, start: int, end: int) -> bool:
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return not (before.isalnum() or before == "_") and not (after.isalnum() or after == "_")
+
+
+@dataclass
+class ScanResult:
+    """Нормализованный текст сообщения и все совпадения словаря по возрастанию позиции."""
+
+    text: str
+    matches: List[Match]
+
+    def of(self, category: str) -> List[Match]:
+        return [m for m in self.matches if m.category == category]
+
+    def keys(self, category: str) -> List[str]:
+        seen: Dict[str, None] = {}
+        for m in self.matches:
+            if m.category == category:
+                seen.setdefault(m.key, None)
+        return list(seen)
+
+    def has(self, category: str, key: Optional[str] = None) -> bool:
+        return any(m.category == category and (key is None or m.key == key) for m in self.matches)
+
+
+@dataclass
+class Lexicon:
+    """Словарь книги и скомпилированный по нему автомат.
+
+    speakers — ключи говорящих в порядке приоритета распознавания, speaker_order —
+    порядок речей в книге; aliases — основа имени → все её написания (группа синонимов
+    для постингов сущностей).
+    """
+
+    speakers: List[str] = field(default_factory=list)
+    speaker_order: Dict[str, int] = field(default_factory=dict)
+    aliases: Dict[str, List[str]] = field(default_factory=dict)
+    patterns: List[Tuple[str, str, str, bool]] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        self._automaton = AhoCorasick(self.patterns)
+
+    @classmethod
+    def from_data(cls, data: Dict[str, Any]) -> "Lexicon":
+        return cls.merge([data])
+
+    @classmethod
+    def merge(cls, sources: Sequence[Dict[str, Any]]) -> "Lexicon":
+        speakers: List[str] = []
+        order: Dict[str, int] = {}
+        aliases: Dict[str, List[str]] = {}
+        patterns: List[Tuple[str, str, str, bool]] = []
+
+        def add(category: str, key: str, entries: Iterable[Any]) -> None:
+            for e in entries:
+                text, word = (e, False) if isinstance(e, str) else (e["text"], bool(e.get("word")))
+                patterns.append((_normalize(text), category, key, word))
+
+        for data in sources:
+            for sp in data.get("speakers", []):
+                key = sp["key"]
+                if key not in order:
+                    speakers.append(key)
+                order[key] = int(sp.get("order", len(order) + 1))
+                add("speaker", key, sp.get("stems") or [key])
+            for intent, entries in data.get("triggers", {}).items():
+                add("trigger", intent, entries)
+            for e in data.get("anachronisms", []):
+                add("anachronism", e if isinstance(e, str) else e["text"], [e])
+            for group in data.get("aliases", []):
+                stems = [_normalize(g) for g in group]
+                for g in stems:
+                    aliases[g] = list(dict.fromkeys(aliases.get(g, [g]) + stems))
+        return cls(speakers, order, aliases, patterns)
+
+    def scan(self, text: str) -> ScanResult:
+        """Один проход автомата по сообщению в нижнем регистре (пробелы схлопнуты, переводы строк сохранены)."""
+        norm = _normalize(text)
+        return ScanResult(norm, self._automaton.scan(norm))
+
+
+def _normalize(text: str) -> str:
+    return _SPACES.sub(" ", text.lower())
+
+
+def lexicon_paths() -> List[Path]:
+    if BOOK_LEXICON:
+        return [Path(BOOK_LEXICON)]
+    return sorted(BOOK_DIR.glob("*.lexicon.json")) if BOOK_DIR.exists() else []
+
+
+def load_lexicon(paths: Optional[Sequence[Path]] = None) -> Lexicon:
+    """Словарь из JSON-файлов (несколько книг объединяются); нет файлов — пустой словарь."""
+    paths = lexicon_paths() if paths is None else paths
+    return Lexicon.merge([json.loads(Path(p).read_text(encoding="utf-8")) for p in paths])
+
+
+_LEXICON: Optional[Lexicon] = None
+_LEXICON_LOCK = threading.Lock()
+
+
+def get_lexicon() -> Lexicon:
+    """Общий для процесса словарь; автомат компилируется при первом обращении."""
+    global _LEXICON
+    if _LEXICON is None:
+        with _LEXICON_LOCK:
+            if _LEXICON is None:
+                _LEXICON = load_lexicon()
+    return _LEXICON
+
+
+def reset_lexicon() -> None:
+    global _LEXICON
+    with _LEXICON_LOCK:
+        _LEXICON = None
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from app.server.rag.index_store import atomic_write_bytes
+
+MANIFEST_VERSION = 1
+
+
+@dataclass(frozen=True)
+class FileState:
+    size: int
+    mtime_ns: int
+    sha1: str
+
+
+@dataclass
+class Manifest:
+    """Состояние источников, по которым построен индекс: файл → (size, mtime, sha1).
+
+    Порядок files совпадает с порядком разбора (каталоги по очереди, файлы по имени).
+    """
+
+    model: str
+    files: Dict[str, FileState] = field(default_factory=dict)
+
+
+@dataclass
+class ManifestDiff:
+    added: List[str]
+    changed: List[str]
+    removed: List[str]
+    unchanged: List[str]
+
+    @property
+    def dirty(self) -> List[str]:
+        """Файлы, которые нужно разобрать и заэмбеддить заново."""
+        return self.added + self.changed
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.changed or self.removed)
+
+
+def manifest_path_for(index_path: Path) -> Path:
+    return index_path.with_name(index_path.stem + ".manifest.json")
+
+
+def file_sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def scan_sources(dirs: Sequence[Path], previous: Optional[Dict[str, FileState]] = None) -> Dict[str, FileState]:
+    """Снимок .md-файлов каталогов. Хэш считается только для файлов с новыми size/mtime."""
+    previous = previous or {}
+    files: Dict[str, FileState] = {}
+    for d in dirs:
+        if not d.exists():
+            continue
+        for p in sorted(d.glob("**/*.md")):
+            st = p.stat()
+            key = str(p)
+            prev = previous.get(key)
+            if prev is not None and prev.size == st.st_size and prev.mtime_ns == st.st_mtime_ns:
+                files[key] = prev
+            else:
+                files[key] = FileState(size=st.st_size, mtime_ns=st.st_mtime_ns, sha1=file_sha1(p))
+    return files
+
+
+def diff_manifest(old: Dict[str, FileState], new: Dict[str, FileState]) -> ManifestDiff:
+    """Сравнение по содержимому: изменённым считается файл с другим sha1 (touch — не изменение)."""
+    added = [f for f in new if f not in old]
+    removed = [f for f in old if f not in new]
+    changed = [f for f in new if f in old and old[f].sha1 != new[f].sha1]
+    unchanged = [f for f in new if f in old and old[f].sha1 == new[f].sha1]
+    return ManifestDiff(added=added, changed=changed, removed=removed, unchanged=unchanged)
+
+
+def load_manifest(path: Path) -> Optional[Manifest]:
+    """Манифест с диска; None, если его нет или он не читается (тогда нужна полная переиндексация)."""
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        files = {f: FileState(int(s["size"]), int(s["mtime_ns"]), str(s["sha1"])) for f, s in data["files"].items()}
+        return Manifest(model=str(data["model"]), files=files)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def save_manifest(path: Path, manifest: Manifest) -> None:
+    data = {
+        "version": MANIFEST_VERSION,
+        "model": manifest.model,
+        "files": {
+            f: {"size": s.size, "mtime_ns": s.mtime_ns, "sha1": s.sha1} for f, s in manifest.files.items()
+        },
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_bytes(path, json.dumps(data, ensure_ascii=False).encode("utf-8"))
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import mmap
+from pathlib import Path
+from typing import Any, Union
+
+import numpy as np
+
+Buffer = Union[bytes, mmap.mmap]
+
+
+def write_array(path: Path, array: np.ndarray, dtype: Any) -> None:
+    """Сырые данные массива (little-endian, без заголовка) для последующего map_array."""
+    with open(path, "wb") as f:
+        f.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+
+
+def map_array(path: Path, dtype: Any, shared: bool = True) -> np.ndarray:
+    """Одномерный массив из файла: memmap только для чтения (страницы общие для процессов) или копия в памяти."""
+    dtype = np.dtype(dtype)
+    size = path.stat().st_size
+    if size == 0:
+        return np.zeros(0, dtype=dtype)
+    if shared:
+        return np.memmap(path, dtype=dtype, mode="r", shape=(size // dtype.itemsize,))
+    return np.fromfile(path, dtype=dtype)
+
+
+def map_bytes(path: Path, shared: bool = True) -> Buffer:
+    """Содержимое файла как mmap только для чтения (поддерживает find и срезы) или bytes."""
+    if not shared or path.stat().st_size == 0:
+        return path.read_bytes()
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
@@ -1,13 +1,33 @@
 from __future__ import annotations
 
+import threading
+from contextlib import closing
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, List, Sequence
 
-from app.server.rag.reader import parse_markdown_dir, Chunk
-from app.server.rag.index_store import IndexStore
-from app.server.providers.openai_client import OpenAIClient
+import numpy as np
+
+from app.server.rag.reader import iter_parsed_files, parse_markdown_dir, Chunk
+from app.server.rag.index_store import IndexStore, IndexCache
+from app.server.rag.manifest import (
+    Manifest,
+    diff_manifest,
+    load_manifest,
+    manifest_path_for,
+    save_manifest,
+    scan_sources,
+)
+from app.server.providers.embedding_cache import EmbeddingDiskCache, content_hash
+from app.server.providers import openai_client
+from app.server.providers.openai_client import OpenAIClient, embed_batched
+from app.server.rag.projection import Projection, index_model_key, local_reduction
 from app.server.utils.paths import BOOK_DIR, CONTEXT_DIR
 
+# Общий на процесс индекс для горячего пути (/chat, /progress)
+INDEX_CACHE = IndexCache()
+# Кэш эмбеддингов чанков: переиндексация ходит в API только за новыми/изменёнными абзацами
+EMBEDDING_CACHE = EmbeddingDiskCache()
+
 
 def collect_chunks(book_dir: Path = BOOK_DIR, context_dir: Path = CONTEXT_DIR) -> List[Chunk]:
     chunks: List[Chunk] = []
@@ -18,27 +38,146 @@ def collect_chunks(book_dir: Path = BOOK_DIR, context_dir: Path = CONTEXT_DIR) -
     return chunks
 
 
-def rebuild_index(client: OpenAIClient, store: IndexStore | None = None) -> IndexStore:
+# Колбэк прогресса переиндексации: (стадия, сделано, всего)
+Progress = Callable[[str, int, int], None]
+
+
+def _no_progress(stage: str, done: int, total: int) -> None:
+    pass
+
+
+def embed_with_cache(
+    client: OpenAIClient,
+    texts: List[str],
+    cache: EmbeddingDiskCache | None = None,
+    progress: Progress | None = None,
+) -> List[List[float]]:
+    """Эмбеддинги текстов: из кэша по (модель, хэш текста), в API — только промахи."""
+    progress = progress or _no_progress
+    cache = cache if cache is not None else EMBEDDING_CACHE
+    model = client.embedding_model
+    hashes = [content_hash(t) for t in texts]
+    found = cache.get_many(model, hashes)
+    # Одинаковые тексты эмбеддим один раз
+    missing: Dict[str, str] = {}
+    for h, t in zip(hashes, texts):
+        if h not in found and h not in missing:
+            missing[h] = t
+    total = len(texts)
+    done = [total - len(missing)]
+    progress("embed", done[0], total)
+    if missing:
+        lock = threading.Lock()
+
+        def on_batch(n: int) -> None:
+            with lock:
+                done[0] += n
+                progress("embed", min(done[0], total), total)
+
+        fresh = embed_batched(client, list(missing.values()), on_batch=on_batch)
+        new_items = list(zip(missing.keys(), fresh))
+        cache.put_many(model, new_items)
+        found.update(new_items)
+    cache.record_run(reused=len(texts) - len(missing), embedded=len(missing))
+    return [found[h] for h in hashes]
+
+
+# Limit per-input size to avoid model context overflow
+def limit_text(t: str, max_chars: int = 1500) -> str:
+    if len(t) <= max_chars:
+        return t
+    # keep beginning; simple truncation is fine for embeddings
+    return t[:max_chars]
+
+
+def reduce_embeddings(client: OpenAIClient, store: IndexStore, embeddings: List[List[float]], refit: bool) -> List[List[float]]:
+    """Локальное понижение размерности (EMBED_DIMENSIONS) при индексации.
+
+    При полной пересборке проекция подбирается заново и сохраняется со стором;
+    при инкрементальной новые абзацы проецируются уже сохранённой.
+    """
+    kind = local_reduction(client)
+    if kind is None:
+        store.projection = None
+        return embeddings
+    if not embeddings:
+        return embeddings
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if refit or store.projection is None or store.projection.kind != kind:
+        store.projection = Projection.fit(kind, openai_client.EMBED_DIMENSIONS, matrix)
+    return list(store.projection.apply(matrix))
+
+
+def rebuild_index(
+    client: OpenAIClient,
+    store: IndexStore | None = None,
+    cache: EmbeddingDiskCache | None = None,
+    progress: Progress | None = None,
+    full: bool = False,
+    sources: Sequence[Path] | None = None,
+) -> IndexStore:
+    """Переиндексация: разбор Markdown, эмбеддинги, сохранение и публикация в кэш.
+
+    По манифесту источников (size, mtime, sha1) заново разбираются только
+    добавленные и изменённые файлы; их чанки вклеиваются в существующий индекс,
+    элементы остальных файлов и их seq не меняются. Без манифеста, при смене
+    модели эмбеддингов или с full=True индекс строится целиком.
+
+    Новый стор собирается отдельно от опубликованного, поэтому /chat до конца
+    переиндексации обслуживается предыдущим индексом.
+    """
+    progress = progress or _no_progress
     store = store or IndexStore()
-    chunks = collect_chunks()
-    if not chunks:
-        store.items = []
-        store.save()
-        return store
-    # Limit per-input size to avoid model context overflow
-    def limit_text(t: str, max_chars: int = 1500) -> str:
-        if len(t) <= max_chars:
-            return t
-        # keep beginning; simple truncation is fine for embeddings
-        return t[:max_chars]
+    sources = list(sources) if sources is not None else [BOOK_DIR, CONTEXT_DIR]
+    model = index_model_key(client)
+    manifest_path = manifest_path_for(store.path)
+    progress("parse", 0, 1)
+    old = None if full else load_manifest(manifest_path)
+    # Инкрементальный путь вклеивает в бинарное поколение (index.json после него не обновляется)
+    if old is not None and (old.model != model or not store.has_binary()):
+        old = None
+    files = scan_sources(sources, old.files if old is not None else None)
+    diff = None
+    if old is not None:
+        store.load()
+        # Без сохранённой проекции новые векторы не с чем согласовать — полная пересборка
+        if local_reduction(client) and store.projection is None:
+            old = None
+        else:
+            diff = diff_manifest(old.files, files)
+    # Разбираем в порядке манифеста, как при полном проходе
+    wanted = None if diff is None else set(diff.dirty)
+    dirty = [f for f in files if wanted is None or f in wanted]
+    chunks: List[Chunk] = []
+    # closing: при отмене (ReindexCancelled из progress) пул разбора останавливается сразу
+    with closing(iter_parsed_files([Path(f) for f in dirty])) as parsed_files:
+        for i, parsed in enumerate(parsed_files):
+            chunks.extend(parsed)
+            progress("parse", i + 1, len(dirty))
+    progress("parse", 1, 1)
 
     texts = [limit_text(c.text) for c in chunks]
-    embeddings = client.embed(texts)
-    store.rebuild(chunks, embeddings)
+    embeddings = embed_with_cache(client, texts, cache, progress)
+    embeddings = reduce_embeddings(client, store, embeddings, refit=diff is None)
+    progress("save", 0, 1)
+    if diff is None:
+        store.rebuild(chunks, embeddings)
+    elif not diff.is_empty():
+        store.splice(dirty + diff.removed, chunks, embeddings, order=list(files))
+    save_manifest(manifest_path, Manifest(model=model, files=files))
+    if diff is None or not diff.is_empty():
+        _publish(store)
     return store
 
 
+def _publish(store: IndexStore) -> None:
+    if store.path == INDEX_CACHE.path:
+        INDEX_CACHE.publish(store)
+
+
 def load_index(store: IndexStore | None = None) -> IndexStore:
-    store = store or IndexStore()
+    """Без аргумента возвращает общий закэшированный индекс; с явным стором — перечитывает его."""
+    if store is None:
+        return INDEX_CACHE.get()
     store.load()
     return store
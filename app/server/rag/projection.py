@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+
+from app.server.providers import openai_client
+
+# Сколько строк брать для подбора PCA
+_PCA_SAMPLE = 20000
+
+
+def _normalize_rows(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    return (m / np.where(norms == 0, 1.0, norms)).astype(np.float32)
+
+
+class Projection:
+    """Локальное понижение размерности эмбеддингов: усечение или PCA, затем нормировка.
+
+    Хранится в поколении индекса (projection.npz); запросы проецируются тем же
+    преобразованием, что и абзацы.
+    """
+
+    def __init__(self, kind: str, input_dim: int, components: Optional[np.ndarray] = None, mean: Optional[np.ndarray] = None, dim: int = 0) -> None:
+        self.kind = kind
+        self.input_dim = input_dim
+        self.components = components
+        self.mean = mean
+        self.dim = int(components.shape[0]) if components is not None else dim
+
+    @classmethod
+    def fit(cls, kind: str, dim: int, matrix: np.ndarray, seed: int = 0) -> "Projection":
+        matrix = np.asarray(matrix, dtype=np.float32)
+        input_dim = int(matrix.shape[1])
+        dim = min(dim, input_dim)
+        if kind == "truncate":
+            return cls("truncate", input_dim, dim=dim)
+        if kind != "pca":
+            raise ValueError(f"Неизвестный способ понижения размерности: {kind}")
+        n = matrix.shape[0]
+        sample = matrix
+        if n > _PCA_SAMPLE:
+            rng = np.random.default_rng(seed)
+            sample = matrix[np.sort(rng.choice(n, size=_PCA_SAMPLE, replace=False))]
+        mean = sample.mean(axis=0)
+        # Главные компоненты — правые сингулярные векторы центрированной выборки
+        _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+        components = vt[: min(dim, vt.shape[0])].astype(np.float32)
+        return cls("pca", input_dim, components=components, mean=mean.astype(np.float32))
+
+    def apply(self, matrix: np.ndarray) -> np.ndarray:
+        m = np.asarray(matrix, dtype=np.float32)
+        if self.kind == "truncate":
+            return _normalize_rows(m[:, : self.dim])
+        return _normalize_rows((m - self.mean) @ self.components.T)
+
+    def apply_one(self, vec: Sequence[float]) -> List[float]:
+        return self.apply(np.asarray(vec, dtype=np.float32)[None, :])[0].tolist()
+
+    def save(self, path: Path) -> None:
+        arrays = {"kind": np.asarray(self.kind), "input_dim": np.asarray(self.input_dim), "dim": np.asarray(self.dim)}
+        if self.kind == "pca":
+            arrays.update(components=self.components, mean=self.mean)
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> "Projection":
+        with np.load(path, allow_pickle=False) as data:
+            kind = str(data["kind"])
+            if kind == "pca":
+                return cls(kind, int(data["input_dim"]), components=data["components"], mean=data["mean"])
+            return cls(kind, int(data["input_dim"]), dim=int(data["dim"]))
+
+
+def local_reduction(client: Any) -> Optional[str]:
+    """Способ локального понижения для клиента: None, если размерность полная или её уменьшает API."""
+    if openai_client.EMBED_DIMENSIONS <= 0 or getattr(client, "embedding_dimensions", None):
+        return None
+    return "pca" if openai_client.EMBED_REDUCTION == "pca" else "truncate"
+
+
+def index_model_key(client: Any) -> str:
+    """Модель + способ понижения: смена любого из них требует полной переиндексации."""
+    kind = local_reduction(client)
+    model = client.embedding_model
+    return f"{model}+{kind}{openai_client.EMBED_DIMENSIONS}" if kind else model
+
+
+def project_query(store: Any, q_emb: Sequence[float]) -> Sequence[float]:
+    proj = getattr(store, "projection", None)
+    if proj is None or len(q_emb) != proj.input_dim:
+        return q_emb
+    return proj.apply_one(q_emb)
@@ -0,0 +1,145 @@
+"""Квантование матрицы эмбеддингов (float16 / int8 с масштабом на вектор) и оценка потери полноты.
+
+    python -m app.server.rag.quantize --index data/coreader/index.json
+    python -m app.server.rag.quantize --n 50000 --dim 1536
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Точность хранения векторов в бинарном поколении: float32 | float16 | int8
+INDEX_VECTOR_PRECISION = os.getenv("INDEX_VECTOR_PRECISION", "float32").lower()
+
+PRECISIONS: Dict[str, Tuple[np.dtype, str]] = {
+    "float32": (np.dtype("<f4"), "vectors.f32"),
+    "float16": (np.dtype("<f2"), "vectors.f16"),
+    "int8": (np.dtype("i1"), "vectors.i8"),
+}
+SCALE_DTYPE = np.dtype("<f4")
+
+_BLOCK = 16384
+
+
+def check_precision(precision: str) -> str:
+    if precision not in PRECISIONS:
+        raise ValueError(f"Неизвестная точность векторов: {precision} (ожидается float32/float16/int8)")
+    return precision
+
+
+def quantize(matrix: np.ndarray, precision: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """(матрица в нужной точности, масштабы строк для int8 или None)."""
+    dtype, _ = PRECISIONS[check_precision(precision)]
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if precision != "int8":
+        return matrix.astype(dtype), None
+    scales = (np.abs(matrix).max(axis=1) / 127.0).astype(SCALE_DTYPE) if matrix.size else np.zeros(matrix.shape[0], dtype=SCALE_DTYPE)
+    safe = np.where(scales == 0, 1.0, scales)[:, None]
+    q = np.clip(np.rint(matrix / safe), -127, 127).astype(dtype)
+    return q, scales
+
+
+def dequantize(matrix: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    out = np.asarray(matrix, dtype=np.float32)
+    return out * scales[:, None] if scales is not None else out
+
+
+def matvec(matrix: np.ndarray, q: np.ndarray) -> np.ndarray:
+    """matrix @ q без полной float32-копии квантованной матрицы: блоками по строкам.
+
+    Для int8 масштаб строки не нужен: в косинусе он сокращается с нормой строки.
+    """
+    if matrix.dtype == np.float32:
+        return matrix @ q
+    out = np.empty(matrix.shape[0], dtype=np.float32)
+    for start in range(0, matrix.shape[0], _BLOCK):
+        block = matrix[start : start + _BLOCK]
+        out[start : start + block.shape[0]] = block.astype(np.float32) @ q
+    return out
+
+
+class Int8Row:
+    """Строка int8-матрицы как последовательность float (значение * масштаб) для IndexedChunk.embedding."""
+
+    __slots__ = ("row", "scale")
+
+    def __init__(self, row: np.ndarray, scale: float) -> None:
+        self.row = row
+        self.scale = scale
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        out = self.row.astype(np.float32) * np.float32(self.scale)
+        return out if dtype is None else out.astype(dtype)
+
+    def __len__(self) -> int:
+        return int(self.row.shape[0])
+
+    def __iter__(self) -> Iterator[float]:
+        return iter(self.__array__().tolist())
+
+    def __getitem__(self, i):
+        return self.__array__()[i]
+
+
+def _rows_normalized(matrix: np.ndarray) -> np.ndarray:
+    m = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.where(norms == 0, 1.0, norms)
+
+
+def recall_at_k(matrix: np.ndarray, precision: str, k: int = 10, queries: int = 32, seed: int = 0) -> float:
+    """Доля совпадений top-k по косинусу между float32 и квантованной матрицей.
+
+    Запросы — случайные строки корпуса с небольшим шумом.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    n = matrix.shape[0]
+    if n == 0 or precision == "float32":
+        return 1.0
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(n, size=min(queries, n), replace=False)
+    qs = matrix[picks] + 0.05 * np.abs(matrix).mean() * rng.standard_normal((picks.size, matrix.shape[1])).astype(np.float32)
+    exact_m = _rows_normalized(matrix)
+    quant, scales = quantize(matrix, precision)
+    quant_m = _rows_normalized(dequantize(quant, scales))
+    hits = 0
+    for q in qs:
+        a = np.argpartition(-(exact_m @ q), k - 1)[:k]
+        b = np.argpartition(-(quant_m @ q), k - 1)[:k]
+        hits += len(set(a.tolist()) & set(b.tolist()))
+    return hits / (k * picks.size)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Потеря полноты top-k при квантовании векторов")
+    ap.add_argument("--index", type=Path, help="реальный index.json вместо синтетики")
+    ap.add_argument("--n", type=int, default=50000)
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=64)
+    args = ap.parse_args(argv)
+    if args.index:
+        from app.server.rag.index_store import IndexStore
+
+        store = IndexStore(args.index)
+        store.load()
+        matrix = dequantize(store.embedding_matrix(), store.scales)
+    else:
+        from app.server.rag.ann_bench import synthetic_corpus
+
+        matrix = synthetic_corpus(args.n, args.dim)
+    print(f"N={matrix.shape[0]} dim={matrix.shape[1]} k={args.k}")
+    print(f"{'precision':>10} {'MB':>10} {'recall':>8}")
+    for precision, (dtype, _) in PRECISIONS.items():
+        mb = matrix.shape[0] * (matrix.shape[1] * dtype.itemsize + (4 if precision == "int8" else 0)) / 2**20
+        r = recall_at_k(matrix, precision, k=args.k, queries=args.queries)
+        print(f"{precision:>10} {mb:>10.1f} {r:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,25 @@
 from __future__ import annotations
 
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Optional
+from typing import BinaryIO, Iterator, List, Optional, Sequence
 import hashlib
+import multiprocessing
+import os
+import re
+
+# Размер буфера чтения исходников: память парсера не зависит от размера файла
+READ_BUFFER = 1 << 16
+
+# Разбор каталога в пуле процессов: PARSE_WORKERS процессов (0 — по числу ядер, 1 — последовательно);
+# каталоги меньше PARSE_PARALLEL_MIN_FILES файлов разбираются в текущем процессе
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))
+PARSE_PARALLEL_MIN_FILES = int(os.getenv("PARSE_PARALLEL_MIN_FILES", "64"))
+
+# Прочие разделители строк str.splitlines() (кроме \n), встречаются редко
+_OTHER_BREAKS = re.compile("[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
 
 
 @dataclass
@@ -19,50 +35,116 @@ def _hash_anchor(text: str) -> str:
     return hashlib.sha1(text.strip().encode("utf-8")).hexdigest()[:10]
 
 
-def parse_markdown_file(path: Path) -> List[Chunk]:
+def _lines(f: BinaryIO) -> Iterator[str]:
+    """Строки файла без переводов строки — как str.splitlines()."""
+    for raw in f:
+        content = raw[:-1] if raw.endswith(b"\n") else raw
+        if content.endswith(b"\r"):
+            content = content[:-1]
+        line = content.decode("utf-8")
+        if not _OTHER_BREAKS.search(line):
+            yield line
+            continue
+        yield from raw.decode("utf-8").splitlines()
+
+
+def iter_markdown_file(path: Path) -> Iterator[Chunk]:
     """Very lightweight Markdown splitter: captures last seen heading as title
     and splits by blank lines into paragraph chunks.
+
+    Файл читается построчно из буферизованного дескриптора, чанки отдаются по
+    мере готовности; в памяти — только текущий абзац.
     """
-    chunks: List[Chunk] = []
     title = ""
     buf: List[str] = []
     seq = 0
 
-    def flush_buf():
-        nonlocal buf, title, seq
-        if not buf:
-            return
+    def make_chunk() -> Optional[Chunk]:
         text = "\n".join(buf).strip()
-        if text:
-            chunks.append(
-                Chunk(
-                    file=str(path),
-                    title=title,
-                    text=text,
-                    anchor=_hash_anchor(text),
-                    seq=seq,
-                )
-            )
-            seq += 1
-        buf = []
-
-    for line in path.read_text(encoding="utf-8").splitlines():
-        if line.lstrip().startswith("#"):
-            # new heading
-            flush_buf()
-            title = line.lstrip("# ").strip()
-            continue
-        if not line.strip():
-            flush_buf()
-        else:
+        if not text:
+            return None
+        return Chunk(file=str(path), title=title, text=text, anchor=_hash_anchor(text), seq=seq)
+
+    with open(path, "rb", buffering=READ_BUFFER) as f:
+        for line in _lines(f):
+            if line.lstrip().startswith("#") or not line.strip():
+                # new heading or blank line: flush paragraph
+                chunk = make_chunk() if buf else None
+                buf = []
+                if chunk is not None:
+                    yield chunk
+                    seq += 1
+                if line.strip():
+                    title = line.lstrip("# ").strip()
+                continue
             buf.append(line)
+    chunk = make_chunk() if buf else None
+    if chunk is not None:
+        yield chunk
+
+
+def parse_markdown_file(path: Path) -> List[Chunk]:
+    return list(iter_markdown_file(path))
+
+
+def parse_workers(workers: Optional[int] = None) -> int:
+    n = PARSE_WORKERS if workers is None else workers
+    return max(1, n if n > 0 else (os.cpu_count() or 1))
+
+
+def _parse_batch(paths: Sequence[Path]) -> List[List[Chunk]]:
+    return [parse_markdown_file(p) for p in paths]
+
+
+def iter_parsed_files(paths: Sequence[Path], workers: Optional[int] = None) -> Iterator[List[Chunk]]:
+    """Чанки каждого файла по порядку paths; при достаточном числе файлов — в пуле процессов.
+
+    seq нумеруется внутри файла, а результаты отдаются в порядке входа, поэтому вывод
+    не зависит от числа процессов. Если пул не поднимается или падает, оставшиеся
+    файлы разбираются последовательно; ошибки разбора файла пробрасываются как есть.
+    При закрытии генератора (отмена переиндексации) невыполненные пакеты отменяются
+    без ожидания.
+    """
+    paths = list(paths)
+    n = min(parse_workers(workers), len(paths))
+    if n <= 1 or len(paths) < PARSE_PARALLEL_MIN_FILES:
+        for p in paths:
+            yield parse_markdown_file(p)
+        return
+    size = max(1, len(paths) // (n * 4))
+    batches = [paths[i : i + size] for i in range(0, len(paths), size)]
+    pool = None
+    try:
+        # spawn: дочерние процессы не наследуют потоки и блокировки сервера
+        pool = ProcessPoolExecutor(max_workers=n, mp_context=multiprocessing.get_context("spawn"))
+        futures = [pool.submit(_parse_batch, b) for b in batches]
+    except (OSError, BrokenProcessPool):
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        for p in paths:
+            yield parse_markdown_file(p)
+        return
+    done = 0
+    finished = False
+    try:
+        for fut in futures:
+            try:
+                parsed = fut.result()
+            except BrokenProcessPool:
+                break
+            yield from parsed
+            done += len(parsed)
+        else:
+            finished = True
+    finally:
+        pool.shutdown(wait=finished, cancel_futures=not finished)
+    for p in paths[done:]:
+        yield parse_markdown_file(p)
+
 
-    flush_buf()
-    return chunks
+def parse_markdown_files(paths: Sequence[Path], workers: Optional[int] = None) -> List[Chunk]:
+    return [c for chunks in iter_parsed_files(paths, workers) for c in chunks]
 
 
-def parse_markdown_dir(directory: Path) -> List[Chunk]:
-    all_chunks: List[Chunk] = []
-    for p in sorted(directory.glob("**/*.md")):
-        all_chunks.extend(parse_markdown_file(p))
-    return all_chunks
+def parse_markdown_dir(directory: Path, workers: Optional[int] = None) -> List[Chunk]:
+    return parse_markdown_files(sorted(directory.glob("**/*.md")), workers)
@@ -1,126 +1,197 @@
 from __future__ import annotations
 
-import math
-import re
-from collections import Counter
+import asyncio
 from typing import List, Dict
 
-from app.server.providers.openai_client import OpenAIClient
-from app.server.rag.index_store import IndexStore, IndexedChunk
+import numpy as np
 
+from app.server.providers.openai_client import AsyncOpenAIClient, OpenAIClient
+from app.server.rag import ann as ann_mod, hierarchy
+from app.server.rag.index_store import IndexStore, ann_of, entities_of, lexical_of, sections_of, seqs_of, vectors_of
+from app.server.rag.lexical import tokenize
+from app.server.rag.lexicon import get_lexicon
+from app.server.rag.projection import project_query
+from app.server.rag.quantize import matvec
 
-def _cosine(a: List[float], b: List[float]) -> float:
-    dot = sum(x * y for x, y in zip(a, b))
-    na = math.sqrt(sum(x * x for x in a))
-    nb = math.sqrt(sum(y * y for y in b))
-    if na == 0.0 or nb == 0.0:
-        return 0.0
-    return dot / (na * nb)
+
+def _cosine_scores(q_emb: List[float], matrix: np.ndarray, inv_norms: np.ndarray) -> np.ndarray:
+    """Косинус запроса со всеми строками матрицы одним матрично-векторным произведением.
+
+    float16/int8-матрица умножается блоками без полной float32-копии.
+    """
+    n = matrix.shape[0]
+    q = np.asarray(q_emb, dtype=np.float32)
+    q_norm = float(np.linalg.norm(q))
+    if n == 0 or q_norm == 0.0 or matrix.shape[1] != q.shape[0]:
+        return np.zeros(n, dtype=np.float32)
+    return matvec(matrix, q) * inv_norms * np.float32(1.0 / q_norm)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Индексы k лучших по убыванию; argpartition вместо полной сортировки, равные — по порядку."""
+    n = scores.shape[0]
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    k = min(k, n)
+    part = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+    return part[np.lexsort((part, -scores[part]))]
 
 
 def retrieve_top(query: str, store: IndexStore, client: OpenAIClient, top_k: int = 3, max_seq: int | None = None) -> List[Dict[str, str]]:
     """Гибрид: векторный косинус + BM25 (по title+quote) + keyword-boost."""
     if not store.all():
         return []
-    q_emb = client.embed([query])[0]
-    # Токенизация запроса
-    q_tokens = [t for t in re.split(r"[^\wа-яА-ЯёЁ]+", query.lower()) if len(t) > 2]
-
-    # Собираем корпус (учитываем max_seq)
-    corpus: List[IndexedChunk] = [it for it in store.all() if (max_seq is None or it.seq <= max_seq)]
-
-    # Токены документов и статистики для BM25
-    def tokens_of(it: IndexedChunk) -> List[str]:
-        text = f"{it.title or ''} {getattr(it, 'quote', '') or ''}".lower()
-        return [t for t in re.split(r"[^\wа-яА-ЯёЁ]+", text) if len(t) > 2]
-
-    doc_tokens = [tokens_of(it) for it in corpus]
-    N = max(1, len(doc_tokens))
-    df: Dict[str, int] = Counter()
-    for toks in doc_tokens:
-        for w in set(toks):
-            df[w] += 1
-    avgdl = (sum(len(toks) for toks in doc_tokens) / N) if N else 1.0
-    k1, b = 1.5, 0.75
-
-    def bm25_for_doc(toks: List[str]) -> float:
-        if not q_tokens or not toks:
-            return 0.0
-        tf = Counter(toks)
-        dl = len(toks)
-        score = 0.0
-        for q in set(q_tokens):
-            n = df.get(q, 0)
-            if n == 0:
-                continue
-            idf = max(0.0, math.log((N - n + 0.5) / (n + 0.5)))
-            f = tf.get(q, 0)
-            denom = f + k1 * (1 - b + b * (dl / (avgdl or 1.0)))
-            score += idf * ((f * (k1 + 1)) / (denom or 1.0))
-        return score
-
-    bm25_scores_raw = [bm25_for_doc(toks) for toks in doc_tokens]
-    if bm25_scores_raw:
-        bm_min, bm_max = min(bm25_scores_raw), max(bm25_scores_raw)
-        rng = (bm_max - bm_min) or 1.0
-        bm25_scores = [(s - bm_min) / rng for s in bm25_scores_raw]
+    embed_query = getattr(client, "embed_query", None)
+    q_emb = embed_query(query) if embed_query else client.embed([query])[0]
+    return rank_top(query, q_emb, store, top_k=top_k, max_seq=max_seq)
+
+
+async def aretrieve_top(query: str, store: IndexStore, client: AsyncOpenAIClient, top_k: int = 3, max_seq: int | None = None) -> List[Dict[str, str]]:
+    """Асинхронный вариант retrieve_top: эмбеддинг запроса не блокирует event loop,
+    ранжирование (numpy) выполняется в пуле потоков."""
+    if not store.all():
+        return []
+    embed_query = getattr(client, "embed_query", None)
+    q_emb = await embed_query(query) if embed_query else (await client.embed([query]))[0]
+    return await asyncio.to_thread(rank_top, query, q_emb, store, top_k, max_seq)
+
+
+def _ann_rows(q_emb: List[float], store: IndexStore, rows: np.ndarray, allowed: np.ndarray | None, nprobe: int | None) -> np.ndarray | None:
+    """Кандидаты IVF внутри границы или None, если нужен точный поиск (нет индекса, малый корпус)."""
+    ann = ann_of(store)
+    if ann is None or rows.size < ann_mod.ANN_MIN_ITEMS:
+        return None
+    q = np.asarray(q_emb, dtype=np.float32)
+    if q.shape[0] != ann.centroids.shape[1]:
+        return None
+    return ann.candidates(q, nprobe=nprobe, allowed=allowed)
+
+
+def _section_rows(q_emb: List[float], q_tokens: List[str], store: IndexStore, rows: np.ndarray, allowed: np.ndarray | None, max_seq: int | None) -> np.ndarray | None:
+    """Строки top-M разделов внутри границы или None, если разделов мало или корпус небольшой."""
+    if not hierarchy.HIER_RETRIEVAL or rows.size < hierarchy.HIER_MIN_ITEMS:
+        return None
+    sections = sections_of(store)
+    if sections.n_sections <= hierarchy.HIER_TOP_SECTIONS:
+        return None
+    found = sections.rows_of(sections.top_sections(q_emb, q_tokens, max_seq))
+    return found if allowed is None else found[allowed[found]]
+
+
+def _entity_rows(q_tokens: List[str], store: IndexStore, n: int, allowed: np.ndarray | None) -> tuple[np.ndarray, np.ndarray, np.ndarray] | None:
+    """Сущности запроса: строки, упоминающие хотя бы одну (внутри границы), доля упомянутых
+    сущностей по каждой строке и строки с сущностью в заголовке (только если она одна).
+
+    None, если в запросе нет сущностей корпуса.
+    """
+    ents = entities_of(store)
+    groups = ents.match(q_tokens, get_lexicon().aliases)
+    if not groups:
+        return None
+    coverage = np.zeros(n, dtype=np.float64)
+    for g in groups:
+        coverage[ents.rows_for(g)] += 1.0 / len(groups)
+    rows = np.flatnonzero(coverage if allowed is None else coverage * allowed)
+    titles = ents.rows_for(groups[0], title=True) if len(groups) == 1 else np.zeros(0, dtype=np.int64)
+    return rows, coverage, titles
+
+
+def rank_top(
+    query: str,
+    q_emb: List[float],
+    store: IndexStore,
+    top_k: int = 3,
+    max_seq: int | None = None,
+    nprobe: int | None = None,
+) -> List[Dict[str, str]]:
+    """Ранжирование корпуса по готовому эмбеддингу запроса.
+
+    Если в запросе есть сущности корпуса (имена с заглавной буквы, см. EntityIndex),
+    кандидаты — абзацы, упоминающие хотя бы одну из них; к скору добавляется
+    0.3 * доля сущностей запроса, упомянутых в абзаце, а если сущность одна —
+    ещё 0.15 абзацам с ней в заголовке. Иначе на больших корпусах при
+    HIER_RETRIEVAL абзацы ранжируются внутри top-M разделов, выбранных по
+    центроидам и BM25 разделов, либо, при наличии IVF-индекса, косинус
+    считается для кандидатов из `nprobe` ближайших списков. Ко всем кандидатам
+    добавляются документы с лексическими совпадениями, а если кандидатов
+    меньше top_k — все строки внутри границы. На малых корпусах — точно по
+    всем строкам.
+    """
+    items = store.all()
+    if not items:
+        return []
+    # Токенизация запроса; эмбеддинг запроса проецируется так же, как векторы индекса
+    q_tokens = tokenize(query)
+    q_emb = project_query(store, q_emb)
+
+    # Собираем корпус (учитываем max_seq): индексы строк в порядке стора
+    allowed = None if max_seq is None else seqs_of(store) <= max_seq
+    rows = np.arange(len(items)) if allowed is None else np.flatnonzero(allowed)
+    if rows.size == 0:
+        return []
+
+    # Векторная часть: одно произведение по нормированным заранее строкам
+    matrix, inv_norms = vectors_of(store)
+    entity = _entity_rows(q_tokens, store, len(items), allowed)
+    candidates = entity[0] if entity is not None and entity[0].size else None
+    if candidates is None:
+        candidates = _section_rows(q_emb, q_tokens, store, rows, allowed, max_seq)
+    if candidates is None:
+        candidates = _ann_rows(q_emb, store, rows, allowed, nprobe)
+    if candidates is None:
+        cos = _cosine_scores(q_emb, matrix, inv_norms).astype(np.float64)
+
+    # BM25 по инвертированному индексу: считаем только документы с терминами запроса;
+    # граница max_seq обрабатывается внутри индекса без пересчёта статистик корпуса
+    lex = lexical_of(store)
+    bm = np.zeros(len(items), dtype=np.float64)
+    bm_docs, bm_raw = lex.bm25.score(q_tokens, max_seq)
+    if bm_docs.size:
+        bm[bm_docs] = bm_raw
+        bm_min = float(bm_raw.min()) if bm_docs.size == lex.bm25.prefix_size(max_seq) else 0.0
+        bm_max = float(bm_raw.max())
+        bm = (bm - bm_min) / ((bm_max - bm_min) or 1.0)
+
+    kw = lex.keyword_hits(q_tokens) / len(q_tokens) if q_tokens else np.zeros(len(items), dtype=np.float64)
+
+    keep = np.zeros(len(items), dtype=bool)
+    if candidates is None:
+        keep[rows] = True
     else:
-        bm25_scores = [0.0] * len(corpus)
-
-    def kw_score(it: IndexedChunk) -> float:
-        hay = f"{it.title or ''} {getattr(it, 'quote', '') or ''}".lower()
-        if not q_tokens:
-            return 0.0
-        hits = sum(1 for t in q_tokens if t in hay)
-        return hits / len(q_tokens)
-
-    raw = []
-    for idx, it in enumerate(corpus):
-        c = _cosine(q_emb, it.embedding)
-        k = kw_score(it)
-        bm = bm25_scores[idx]
-        # Гибридный скор: косинус 0.6, BM25 0.3, keywords 0.1
-        score = 0.6 * c + 0.3 * bm + 0.1 * k
-        raw.append((it, score, k, c, bm))
-
-    # If query contains strong named tokens (e.g., 'павсаний'), prefer items with kw hits
-    strong = any(t in ("павсаний", "паусаний", "эрот", "эроты", "число") for t in q_tokens)
-
-    # Special targeting for Павсаний: require mention of павсан* in title/quote when present in query
-    want_pausanias = any("павсан" in t for t in q_tokens)
-    if want_pausanias:
-        def has_pausanias(it: IndexedChunk) -> bool:
-            hay = f"{it.title} {it.quote}".lower()
-            return ("павсан" in hay) or ("паусан" in hay)
-        # Hard filter; if empty after filter, fall back to kw-based filter
-        filtered = [row for row in raw if has_pausanias(row[0])]
-        if filtered:
-            raw = filtered
-        else:
-            raw = [row for row in raw if row[2] > 0.0] or raw
-        # Title exact boost
-        boosted = []
-        for it, score, k, c, bm in raw:
-            title_l = it.title.lower()
-            if "павсан" in title_l:
-                score += 0.15
-            boosted.append((it, score, k, c, bm))
-        raw = boosted
-    elif strong:
-        raw = [row for row in raw if row[2] > 0.0] or raw
-
-    scored = sorted(raw, key=lambda t: t[1], reverse=True)
-    top = scored[: max(1, top_k)]
+        # Кандидаты сущностей, разделов или ANN плюс документы с лексическими совпадениями
+        keep[candidates] = True
+        lexical_hits = kw > 0.0
+        lexical_hits[bm_docs] = True
+        keep |= lexical_hits if allowed is None else lexical_hits & allowed
+        # Кандидатов меньше top_k — добираем всеми строками внутри границы
+        if np.count_nonzero(keep) < top_k:
+            keep[rows] = True
+        cand = np.flatnonzero(keep)
+        cos = np.zeros(len(items), dtype=np.float64)
+        cos[cand] = _cosine_scores(q_emb, matrix[cand], inv_norms[cand])
+
+    # Гибридный скор: косинус 0.6, BM25 0.3, keywords 0.1
+    score = 0.6 * cos + 0.3 * bm + 0.1 * kw
+
+    # Entity-targeted query: prefer paragraphs mentioning more of the query's entities;
+    # title boost only for a single targeted entity
+    if entity is not None:
+        score += 0.3 * entity[1]
+        score[entity[2]] += 0.15
+
+    kept = np.flatnonzero(keep)
+    top = kept[_top_k(score[kept], max(1, top_k))]
     results = []
-    for it, score, k, c, bm in top:
+    for j in top:
+        it = items[j]
         results.append({
             "file": it.file,
             "anchor": it.anchor,
             "title": it.title,
             "quote": it.quote,
-            "score": float(score),
-            "kw_ratio": float(k),
-            "cosine": float(c),
-            "bm25": float(bm),
+            "score": float(score[j]),
+            "kw_ratio": float(kw[j]),
+            "cosine": float(cos[j]),
+            "bm25": float(bm[j]),
         })
     return results
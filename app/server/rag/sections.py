@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.server.rag.lexical import LexicalIndex
+
+
+class SectionTable:
+    """Оглавление индекса: заголовок → (min_seq, max_seq, count) и основа → первый seq.
+
+    Строится один раз на поколение (см. IndexStore.section_table) по колонкам
+    title/seq без сортировки items. Первое вхождение основы ищется по склейке
+    title+quote лексического индекса и запоминается, диапазон говорящего — по
+    таблице заголовков; повторные запросы — поиск в словаре.
+    """
+
+    def __init__(
+        self,
+        titles: Sequence[str],
+        min_seqs: np.ndarray,
+        max_seqs: np.ndarray,
+        counts: np.ndarray,
+        seqs: np.ndarray,
+        lexical: LexicalIndex,
+    ) -> None:
+        # Заголовки без пробелов по краям, упорядочены по min_seq; пустой заголовок не раздел
+        self.titles = list(titles)
+        self.min_seqs = min_seqs
+        self.max_seqs = max_seqs
+        self.counts = counts
+        self._lower = [t.lower() for t in self.titles]
+        self._seqs = seqs
+        # Число строк индекса, по которым построена таблица
+        self.n_rows = int(seqs.shape[0])
+        self._lexical = lexical
+        self._spans: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._first: Dict[str, Optional[int]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, titles: Sequence[str], title_ids: np.ndarray, seqs: np.ndarray, lexical: LexicalIndex) -> "SectionTable":
+        """titles — таблица уникальных заголовков, title_ids/seqs — колонки по строкам индекса."""
+        seqs = np.asarray(seqs, dtype=np.int64)
+        title_ids = np.asarray(title_ids, dtype=np.int64)
+        # Заголовки, совпадающие после strip, — один раздел
+        keys: Dict[str, int] = {}
+        remap = np.asarray([keys.setdefault((t or "").strip(), len(keys)) for t in titles], dtype=np.int64)
+        sec = remap[title_ids] if title_ids.size else title_ids
+        n = len(keys)
+        counts = np.bincount(sec, minlength=n).astype(np.int64)
+        min_seqs = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+        max_seqs = np.full(n, np.iinfo(np.int64).min, dtype=np.int64)
+        np.minimum.at(min_seqs, sec, seqs)
+        np.maximum.at(max_seqs, sec, seqs)
+        names = list(keys)
+        keep = [i for i in np.argsort(min_seqs, kind="stable").tolist() if names[i] and counts[i]]
+        return cls([names[i] for i in keep], min_seqs[keep], max_seqs[keep], counts[keep], seqs, lexical)
+
+    @classmethod
+    def from_items(cls, items: Sequence[Any], lexical: Optional[LexicalIndex] = None) -> "SectionTable":
+        table: Dict[str, int] = {}
+        title_ids = np.fromiter((table.setdefault(it.title or "", len(table)) for it in items), dtype=np.int64, count=len(items))
+        seqs = np.fromiter((int(it.seq) for it in items), dtype=np.int64, count=len(items))
+        return cls.build(list(table), title_ids, seqs, lexical if lexical is not None else LexicalIndex.from_items(items))
+
+    def sections(self) -> List[Dict[str, Any]]:
+        """Разделы для /progress в порядке чтения."""
+        return [
+            {"title": t, "min_seq": int(lo), "max_seq": int(hi), "count": int(c)}
+            for t, lo, hi, c in zip(self.titles, self.min_seqs.tolist(), self.max_seqs.tolist(), self.counts.tolist())
+        ]
+
+    def span(self, stem: str) -> Optional[Tuple[int, int]]:
+        """(min_seq, max_seq) по разделам, в заголовке которых есть основа."""
+        stem = stem.lower()
+        if stem not in self._spans:
+            hits = [i for i, t in enumerate(self._lower) if stem in t]
+            span = (int(self.min_seqs[hits].min()), int(self.max_seqs[hits].max())) if hits else None
+            with self._lock:
+                self._spans[stem] = span
+        return self._spans[stem]
+
+    def first_seq(self, stem: str) -> Optional[int]:
+        """Наименьший seq абзаца, в заголовке или цитате которого встречается основа."""
+        stem = stem.lower()
+        if stem not in self._first:
+            docs = self._lexical.hay.docs_containing(stem)
+            first = int(self._seqs[docs].min()) if docs.size else None
+            with self._lock:
+                self._first[stem] = first
+        return self._first[stem]
+
+    def warm(self, stems: Sequence[str]) -> "SectionTable":
+        """Заранее заполнить span/first_seq для известных основ (например, говорящих книги)."""
+        for stem in stems:
+            self.span(stem)
+            self.first_seq(stem)
+        return self
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import fcntl
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+# Наблюдатель за каталогами книги и контекста (опционально, опрос mtime без нативных зависимостей)
+INDEX_WATCH = os.getenv("INDEX_WATCH", "false").lower() == "true"
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", "2"))
+INDEX_WATCH_DEBOUNCE = float(os.getenv("INDEX_WATCH_DEBOUNCE", "5"))
+
+# Колбэк запуска переиндексации: возвращает статус задачи (callable без аргументов:
+# queued/running/done/error/cancelled) или None, если запуск не удался. Какие файлы
+# разбирать заново, решает манифест, поэтому пути колбэку не передаются.
+Trigger = Callable[[], Optional[Callable[[], str]]]
+
+_ACTIVE = ("queued", "running")
+
+
+def stat_snapshot(dirs: Sequence[Path]) -> Dict[str, Tuple[int, int]]:
+    """(size, mtime_ns) каждого .md-файла; содержимое не читается."""
+    snap: Dict[str, Tuple[int, int]] = {}
+    for d in dirs:
+        if not d.exists():
+            continue
+        for p in d.glob("**/*.md"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            snap[str(p)] = (st.st_size, st.st_mtime_ns)
+    return snap
+
+
+class SourceWatcher:
+    """Опрос mtime исходников с дебаунсом.
+
+    Изменённые пути копятся в очереди; переиндексация запускается, когда правки
+    затихли на `debounce` секунд и предыдущая запущенная задача завершилась.
+    Если запуск не удался или задача завершилась ошибкой, её пути возвращаются
+    в очередь и запуск повторяется.
+    Какие файлы разбирать заново, решает манифест инкрементальной переиндексации.
+    При нескольких воркерах uvicorn опрашивает только владелец `lock_path`
+    (flock без ожидания); остальные воркеры подхватывают новое поколение через
+    указатель CURRENT.
+    """
+
+    def __init__(
+        self,
+        dirs: Sequence[Path],
+        trigger: Trigger,
+        interval: float = INDEX_WATCH_INTERVAL,
+        debounce: float = INDEX_WATCH_DEBOUNCE,
+        clock: Callable[[], float] = time.monotonic,
+        lock_path: Optional[Path] = None,
+    ) -> None:
+        self.dirs = list(dirs)
+        self.lock_path = lock_path
+        self._lock_fd: Optional[int] = None
+        self.trigger = trigger
+        self.interval = interval
+        self.debounce = debounce
+        self._clock = clock
+        self._snapshot: Optional[Dict[str, Tuple[int, int]]] = None
+        self._pending: Set[str] = set()
+        self._last_change: Optional[float] = None
+        self._running: Optional[Callable[[], str]] = None
+        # Пути, отданные запущенной задаче (возвращаются в очередь при её ошибке)
+        self._batch: List[str] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.scans = 0
+        self.triggers = 0
+        self.last_scan_at: Optional[float] = None
+        self.last_trigger_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def poll_once(self) -> bool:
+        """Один проход: сравнить снимок с предыдущим, при затишье запустить переиндексацию.
+
+        Возвращает True, если переиндексация была запущена.
+        """
+        snap = stat_snapshot(self.dirs)
+        now = self._clock()
+        with self._lock:
+            self.scans += 1
+            self.last_scan_at = time.time()
+            if self._snapshot is not None:
+                changed = {p for p, sig in snap.items() if self._snapshot.get(p) != sig}
+                changed |= set(self._snapshot) - set(snap)
+                if changed:
+                    self._pending |= changed
+                    self._last_change = now
+            self._snapshot = snap
+            busy = self._job_active(now)
+            if not self._pending or self._last_change is None or now - self._last_change < self.debounce:
+                return False
+            if busy:
+                return False
+            paths = sorted(self._pending)
+            self._pending.clear()
+        try:
+            running = self.trigger()
+        except Exception as e:
+            running = None
+            self.last_error = str(e)
+        with self._lock:
+            self._running = running
+            if running is None:
+                # _last_change не сбрасывается: следующий опрос повторит запуск
+                self._pending |= set(paths)
+            else:
+                self._batch = paths
+                self.triggers += 1
+                self.last_trigger_at = time.time()
+                self.last_error = None
+        return running is not None
+
+    @property
+    def batch(self) -> List[str]:
+        """Изменённые пути, по которым запущена текущая задача."""
+        with self._lock:
+            return list(self._batch)
+
+    def _job_active(self, now: float) -> bool:
+        """Идёт ли запущенная задача; завершившаяся ошибкой возвращает свои пути в очередь (под self._lock)."""
+        if self._running is None:
+            return False
+        status = self._running()
+        if status in _ACTIVE:
+            return True
+        if status == "error" and self._batch:
+            self._pending |= set(self._batch)
+            # Повтор — после обычного дебаунса, чтобы не запускать упавшую задачу на каждом опросе
+            self._last_change = now
+            self.last_error = "переиндексация завершилась ошибкой, изменения возвращены в очередь"
+        self._running, self._batch = None, []
+        return False
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                self.last_error = str(e)
+            self._stop.wait(self.interval)
+
+    def _acquire_leader(self) -> bool:
+        if self.lock_path is None or self._lock_fd is not None:
+            return True
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def _release_leader(self) -> None:
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def start(self) -> bool:
+        """Запустить опрос; False, если наблюдатель уже работает в другом процессе."""
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        if not self._acquire_leader():
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="index-watcher", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._release_leader()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.running,
+                "leader": self._lock_fd is not None if self.lock_path is not None else self.running,
+                "interval": self.interval,
+                "debounce": self.debounce,
+                "last_scan_at": self.last_scan_at,
+                "scans": self.scans,
+                "queue_depth": len(self._pending),
+                "reindex_running": self._running is not None and self._running() in _ACTIVE,
+                "triggers": self.triggers,
+                "last_trigger_at": self.last_trigger_at,
+                "last_error": self.last_error,
+            }
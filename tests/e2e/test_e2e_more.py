@@ -20,12 +20,12 @@ def test_e2e_no_confident_hits_refusal(monkeypatch):
     monkeypatch.setattr("app.server.main.load_index", lambda: FakeStore(items))
 
     # Ретривер возвращает очень слабые хиты (ниже порогов kw>=0.15 и cosine>=0.20)
-    def weak_retrieve_top(message, store, client, top_k=3, max_seq=None):
+    async def weak_retrieve_top(message, store, client, top_k=3, max_seq=None):
         return [
             {"file": "x.md", "anchor": "a1", "title": "T", "quote": "Q", "kw_ratio": 0.05, "cosine": 0.1}
         ]
 
-    monkeypatch.setattr("app.server.main.retrieve_top", weak_retrieve_top)
+    monkeypatch.setattr("app.server.main.aretrieve_top", weak_retrieve_top)
 
     SETTINGS.offline = False
     SETTINGS.read_boundary_seq = None
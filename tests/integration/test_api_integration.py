@@ -41,16 +41,28 @@ def test_boundary_guard_refuses_when_asking_later_section(client, monkeypatch):
     assert "Вы ещё не дошли" in data["reply"]
 
 
+def test_progress_lists_sections_in_reading_order(client, monkeypatch):
+    items = [SimpleNamespace(title="Речь Павсана", seq=i) for i in (7, 5, 6)]
+    items += [SimpleNamespace(title="Речь Федра", seq=i) for i in range(0, 5)] + [SimpleNamespace(title="", seq=20)]
+    monkeypatch.setattr("app.server.main.load_index", lambda: FakeStore(items))
+    r = client.get("/progress")
+    assert r.status_code == 200
+    assert r.json()["sections"] == [
+        {"title": "Речь Федра", "min_seq": 0, "max_seq": 4, "count": 5},
+        {"title": "Речь Павсана", "min_seq": 5, "max_seq": 7, "count": 3},
+    ]
+
+
 def test_offline_returns_citations_without_generation(client, monkeypatch):
     # store не пустой
     items = [SimpleNamespace(title="Раздел", seq=0)]
     monkeypatch.setattr("app.server.main.load_index", lambda: FakeStore(items))
     # Подменим retriever на фиксированный набор попаданий
-    def fake_retrieve_top(message, store, client, top_k=3, max_seq=None):
+    async def fake_retrieve_top(message, store, client, top_k=3, max_seq=None):
         return [
             {"file": "x.md", "anchor": "a1", "title": "T", "quote": "Q", "kw_ratio": 0.5, "cosine": 0.3}
         ]
-    monkeypatch.setattr("app.server.main.retrieve_top", fake_retrieve_top)
+    monkeypatch.setattr("app.server.main.aretrieve_top", fake_retrieve_top)
 
     SETTINGS.read_boundary_seq = None
     SETTINGS.offline = True
@@ -79,3 +91,36 @@ def test_export_preview_includes_book_source(client):
     # Проверяем YAML-блок с источником Zotero
     assert "book:" in content
     assert "source: \"zotero://select/library/items/ABC123\"" in content
+
+
+def test_admin_reindex_runs_in_background_job(client, monkeypatch):
+    import time
+    from app.server import main as main_mod
+
+    def fake_rebuild(client, progress=None, full=False):
+        progress("parse", 1, 1)
+        progress("embed", 2, 2)
+        return FakeStore([1, 2])
+
+    monkeypatch.setattr(main_mod, "rebuild_index", fake_rebuild)
+    monkeypatch.setenv("OPENAI_API_KEY", "k")
+    main_mod.SETTINGS.offline = False
+
+    r = client.post("/admin/reindex")
+    assert r.status_code == 202
+    job_id = r.json()["job_id"]
+    for _ in range(200):
+        job = client.get(f"/admin/reindex/{job_id}").json()["job"]
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.01)
+    assert job["status"] == "done"
+    assert job["items"] == 2 and job["percent"] == 100.0
+    assert client.get("/admin/reindex/unknown").status_code == 404
+
+
+def test_admin_watcher_reports_state(client):
+    r = client.get("/admin/watcher")
+    assert r.status_code == 200
+    w = r.json()["watcher"]
+    assert {"last_scan_at", "queue_depth", "enabled"} <= set(w)
@@ -0,0 +1,87 @@
+from pathlib import Path
+
+import numpy as np
+
+import app.server.rag.ann as ann_mod
+from app.server.rag.ann import IVFIndex
+from app.server.rag.ann_bench import run_benchmark, synthetic_corpus
+from app.server.rag.index_store import IndexStore, _inverse_norms
+from app.server.rag.reader import Chunk
+from app.server.rag.retriever import rank_top
+
+
+def test_ivf_recall_grows_with_nprobe_and_is_exact_when_probing_all():
+    matrix = synthetic_corpus(4000, 32, seed=3)
+    queries = synthetic_corpus(20, 32, seed=4)
+    ivf = IVFIndex.build(matrix, _inverse_norms(matrix), nlist=32)
+    rows = run_benchmark(matrix, queries, k=10, nprobes=(1, 8, 32), ivf=ivf)
+    recall = {r["nprobe"]: r["recall"] for r in rows}
+    assert recall[1] <= recall[8] <= recall[32]
+    assert recall[32] == 1.0
+    # Все строки попадают ровно в один список
+    assert sorted(ivf.rows.tolist()) == list(range(4000))
+
+
+def test_ivf_candidates_respect_allowed_mask():
+    matrix = synthetic_corpus(1000, 16, seed=5)
+    ivf = IVFIndex.build(matrix, _inverse_norms(matrix), nlist=10)
+    allowed = np.arange(1000) < 50
+    cand = ivf.candidates(matrix[0], nprobe=1, allowed=allowed, min_candidates=40)
+    assert cand.size >= 40 and (cand < 50).all()
+
+
+def test_store_persists_ivf_and_rank_top_uses_it(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(ann_mod, "ANN_MIN_ITEMS", 100)
+    matrix = synthetic_corpus(600, 16, seed=6)
+    chunks = [Chunk(file="a.md", title="T", text=f"para {i}", anchor=f"a{i}", seq=i) for i in range(600)]
+    path = tmp_path / "index.json"
+    IndexStore(path).rebuild(chunks, matrix.tolist())
+
+    store = IndexStore(path)
+    store.load()
+    assert store.ann_path.exists()
+    ivf = store.ann()
+    assert ivf is not None and ivf.n_items == 600
+
+    q = matrix[123].tolist()
+    # Прощупывание всех списков совпадает с точным поиском, граница max_seq соблюдается
+    approx = rank_top("", q, store, top_k=5, max_seq=300, nprobe=ivf.nlist)
+    monkeypatch.setattr(ann_mod, "ANN_MIN_ITEMS", 10**9)
+    exact = rank_top("", q, store, top_k=5, max_seq=300)
+    assert [r["anchor"] for r in approx] == [r["anchor"] for r in exact]
+    assert approx[0]["anchor"] == "a123"
+
+    # Малый корпус внутри границы — точный поиск без IVF
+    monkeypatch.setattr(ann_mod, "ANN_MIN_ITEMS", 100)
+    small = rank_top("", matrix[10].tolist(), store, top_k=3, max_seq=50, nprobe=1)
+    assert small[0]["anchor"] == "a10"
+
+
+def test_splice_reuses_ivf_lists_and_skips_json(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(ann_mod, "ANN_MIN_ITEMS", 100)
+    matrix = synthetic_corpus(600, 16, seed=7)
+    chunks = [Chunk(file=f"f{i // 100}.md", title="T", text=f"para {i}", anchor=f"a{i}", seq=i % 100) for i in range(600)]
+    path = tmp_path / "index.json"
+    IndexStore(path).rebuild(chunks, matrix.tolist())
+    json_before = path.read_bytes()
+
+    store = IndexStore(path)
+    store.load()
+    before = store.ann()
+    labels = dict(zip((it.anchor for it in store.all()), before.labels().tolist()))
+    monkeypatch.setattr(IVFIndex, "build", classmethod(lambda cls, *a, **k: (_ for _ in ()).throw(AssertionError("k-means"))))
+    new = [Chunk(file="f2.md", title="T", text=f"new {i}", anchor=f"n{i}", seq=i) for i in range(50)]
+    store.splice(["f2.md"], new, synthetic_corpus(50, 16, seed=8).tolist(), order=[f"f{i}.md" for i in range(6)])
+
+    # index.json не переписывается, загрузка берёт новое поколение
+    assert path.read_bytes() == json_before
+    reloaded = IndexStore(path)
+    reloaded.load()
+    assert len(reloaded.all()) == 550 and reloaded.all()[200].anchor == "n0"
+    after = reloaded.ann()
+    assert after is not None and after.n_items == 550
+    assert np.array_equal(after.centroids, before.centroids)
+    # Оставшиеся строки — в прежних списках
+    kept = {it.anchor: lab for it, lab in zip(reloaded.all(), after.labels().tolist()) if not it.anchor.startswith("n")}
+    assert kept == {a: lab for a, lab in labels.items() if a in kept}
+    assert len(kept) == 500
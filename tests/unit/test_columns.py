@@ -0,0 +1,60 @@
+from pathlib import Path
+
+import numpy as np
+
+from app.server.rag.columns import ChunkColumns, ChunkView, IndexedChunk
+from app.server.rag.index_store import IndexStore
+from app.server.rag.reader import Chunk
+
+
+def test_columns_intern_files_and_titles_and_slice_blob():
+    cols = ChunkColumns.from_rows(
+        ["a.md", "a.md", "b.md"], ["T", "T", "U"], ["x1", "x2", "x3"], [0, 1, 0], ["q1", "", "q3"]
+    )
+    assert cols.files == ["a.md", "b.md"] and cols.titles == ["T", "U"]
+    assert [cols.anchor(i) for i in range(3)] == ["x1", "x2", "x3"]
+    assert [cols.quote(i) for i in range(3)] == ["q1", "", "q3"]
+    assert cols.seq_array().tolist() == [0, 1, 0]
+
+    sub = cols.take(np.array([2, 0]))
+    assert [sub.file(i) for i in range(2)] == ["b.md", "a.md"]
+    assert [sub.quote(i) for i in range(2)] == ["q3", "q1"]
+    both = ChunkColumns.concat([sub, cols.take(np.array([1]))])
+    assert [both.anchor(i) for i in range(3)] == ["x3", "x1", "x2"]
+
+
+def test_view_builds_chunks_lazily_over_matrix():
+    cols = ChunkColumns.from_rows(["a.md"], ["T"], ["x"], [5], ["q"])
+    matrix = np.array([[1.0, 2.0]], dtype=np.float32)
+    view = ChunkView(cols, matrix)
+    it = view[0]
+    assert isinstance(it, IndexedChunk) and it.seq == 5 and it.quote == "q"
+    assert np.shares_memory(it.embedding, matrix)
+    assert view[-1].anchor == "x" and len(view[0:5]) == 1
+
+
+def test_store_items_setter_and_splice_keep_columns_consistent(tmp_path: Path):
+    store = IndexStore(tmp_path / "index.json")
+    store.items = [
+        IndexedChunk(file="a.md", title="A", anchor="x1", seq=0, embedding=[1.0, 0.0], quote="qa"),
+        IndexedChunk(file="b.md", title="B", anchor="x2", seq=0, embedding=[0.0, 1.0], quote="qb"),
+    ]
+    assert store.matrix.shape == (2, 2) and store.columns.files == ["a.md", "b.md"]
+    store.save()
+    store.splice(["a.md"], [Chunk(file="a.md", title="A2", text="new", anchor="y1", seq=0)], [[0.5, 0.5]], order=["a.md", "b.md"])
+    loaded = IndexStore(tmp_path / "index.json")
+    loaded.load()
+    assert [(it.file, it.title, it.anchor) for it in loaded.all()] == [("a.md", "A2", "y1"), ("b.md", "B", "x2")]
+    assert np.allclose(loaded.matrix, [[0.5, 0.5], [0.0, 1.0]])
+
+
+def test_view_equals_list_of_chunks_with_vector_embeddings():
+    cols = ChunkColumns.from_rows(["a.md", "b.md"], ["T", "U"], ["x", "y"], [0, 1], ["q", "r"])
+    view = ChunkView(cols, np.array([[1.0, 0.0], [0.5, 0.25]], dtype=np.float32))
+    same = [
+        IndexedChunk(file="a.md", title="T", anchor="x", seq=0, embedding=[1.0, 0.0], quote="q"),
+        IndexedChunk(file="b.md", title="U", anchor="y", seq=1, embedding=[0.5, 0.25], quote="r"),
+    ]
+    assert view == same
+    assert view != [same[0], IndexedChunk(file="b.md", title="U", anchor="y", seq=1, embedding=[0.5, 0.0], quote="r")]
+    assert view != same[:1]
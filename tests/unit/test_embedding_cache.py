@@ -0,0 +1,31 @@
+from app.server.providers.embedding_cache import QueryEmbeddingCache
+
+
+def test_query_cache_lru_eviction_and_normalization():
+    cache = QueryEmbeddingCache(max_size=2)
+    cache.put("m", "Кто такой  Эрот?", [1.0])
+    assert cache.get("m", "кто такой эрот?") == [1.0]
+    assert cache.get("other-model", "кто такой эрот?") is None
+
+    cache.put("m", "b", [2.0])
+    cache.get("m", "кто такой эрот?")  # освежаем первый ключ
+    cache.put("m", "c", [3.0])
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "c") == [3.0]
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3 and stats["misses"] == 2
+
+
+def test_query_cache_ttl_expires(monkeypatch):
+    import app.server.providers.embedding_cache as mod
+
+    now = [100.0]
+    monkeypatch.setattr(mod.time, "monotonic", lambda: now[0])
+    cache = QueryEmbeddingCache(max_size=4, ttl=10)
+    cache.put("m", "q", [1.0])
+    now[0] += 5
+    assert cache.get("m", "q") == [1.0]
+    now[0] += 6
+    assert cache.get("m", "q") is None
+    assert cache.stats()["expired"] == 1
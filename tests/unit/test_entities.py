@@ -0,0 +1,68 @@
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.server.rag.entities import EntityIndex, stem
+from app.server.rag.index_store import IndexStore
+from app.server.rag.reader import Chunk
+from app.server.rag.retriever import rank_top
+
+TITLES = ["Речь Федра", "Речь Федра", "Речь Павсания", "Речь Павсания", "Речь Сократа"]
+QUOTES = [
+    "Эрот — древнейший бог, говорит Федр.",
+    "Любовь делает влюблённых лучше.",
+    "Эротов два, как и Афродит: небесный и пошлый.",
+    "Закон об Эроте у афинян сложен, замечает Павсаний.",
+    "Диотима учила Сократа, что Эрот — не бог.",
+]
+
+
+def test_stem_folds_case_endings():
+    assert {stem(w) for w in ("Павсаний", "Павсания", "Павсанием", "павсании")} == {"павсан"}
+    assert stem("Сократа") == stem("Сократ") == "сократ"
+
+
+def test_capitalized_mid_sentence_words_become_entities():
+    ents = EntityIndex.build(TITLES, QUOTES)
+    # «Любовь» и «Закон» начинают предложения, «бог» пишется со строчной; «Эротов» в начале не считается
+    assert {"эрот", "павсан", "федр", "сократ"} <= set(ents.vocab)
+    assert not {"любов", "закон", "бог"} & set(ents.vocab)
+    assert list(ents.rows_for(["павсан"])) == [2, 3]
+    assert list(ents.rows_for(["павсан"], title=True)) == [2, 3]
+    assert list(ents.rows_for(["эрот"])) == [0, 2, 3, 4]
+    assert ents.match(["что", "говорит", "павсаний", "эроте", "эрот"]) == [["павсан"], ["эрот"]]
+    # Написание, которого нет в корпусе, находится через синонимы словаря
+    assert ents.match(["паусаний"], {"паусан": ["паусан", "павсан"]}) == [["павсан"]]
+
+
+def test_entity_postings_are_persisted_and_attached(tmp_path: Path):
+    p = tmp_path / "index.json"
+    chunks = [Chunk(file="a.md", title=t, text=q, anchor=f"a{i}", seq=i) for i, (t, q) in enumerate(zip(TITLES, QUOTES))]
+    IndexStore(path=p).rebuild(chunks, [[1.0, 0.0]] * len(chunks))
+    store = IndexStore(path=p)
+    store.load()
+    ents = store.entities()
+    assert isinstance(ents.rows, np.memmap)
+    assert list(ents.rows_for(["сократ"])) == [4]
+
+
+def test_rank_top_prefers_entity_postings():
+    items = [
+        SimpleNamespace(file="a.md", title=t, anchor=f"a{i}", seq=i, quote=q, embedding=[1.0, 0.0])
+        for i, (t, q) in enumerate(zip(TITLES, QUOTES))
+    ]
+    store = SimpleNamespace(all=lambda: items)
+    hits = rank_top("что говорит Павсаний?", [1.0, 0.0], store, top_k=2)
+    assert sorted(h["anchor"] for h in hits) == ["a2", "a3"]
+    # Постинги — кандидаты, а не фильтр: выдача добирается до top_k
+    hits = rank_top("что говорит Павсаний?", [1.0, 0.0], store, top_k=4)
+    assert len(hits) == 4
+    assert sorted(h["anchor"] for h in hits[:2]) == ["a2", "a3"]
+    # Несколько сущностей — выше абзац, где упомянуты все
+    hits = rank_top("Сократ и Эрот", [1.0, 0.0], store, top_k=5)
+    assert len(hits) == 5
+    assert hits[0]["anchor"] == "a4"
+    # Сущность вне границы — выше совпадения по ключевым словам
+    hits = rank_top("Павсаний о влюблённых", [1.0, 0.0], store, top_k=5, max_seq=1)
+    assert [h["anchor"] for h in hits] == ["a1", "a0"]
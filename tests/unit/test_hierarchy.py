@@ -0,0 +1,88 @@
+import numpy as np
+
+import app.server.rag.hierarchy as hierarchy
+import app.server.rag.retriever as retriever
+from app.server.rag.hierarchy import SectionIndex
+from app.server.rag.index_store import _inverse_norms
+
+
+class Item:
+    def __init__(self, file, title, anchor, seq, embedding, quote):
+        self.file, self.title, self.anchor, self.seq, self.embedding, self.quote = file, title, anchor, seq, embedding, quote
+
+
+class FakeStore:
+    def __init__(self, items):
+        self._items = items
+
+    def all(self):
+        return self._items
+
+
+def _corpus(n_sections=40, per=30, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_sections, dim))
+    items = []
+    for s in range(n_sections):
+        for j in range(per):
+            vec = centers[s] + 0.3 * rng.standard_normal(dim)
+            seq = s * per + j
+            items.append(Item("book.md", f"Глава {s}", f"s{s}p{j}", seq, vec.tolist(), f"абзац {s} {j}"))
+    return items
+
+
+def test_section_index_groups_by_file_and_title():
+    items = _corpus(n_sections=3, per=4)
+    matrix = np.asarray([it.embedding for it in items], dtype=np.float32)
+    sec = SectionIndex.build(items, matrix, _inverse_norms(matrix))
+    assert sec.n_sections == 3
+    assert sec.min_seqs.tolist() == [0, 4, 8]
+    assert sec.rows_of(np.array([1])).tolist() == [4, 5, 6, 7]
+    assert np.allclose(np.linalg.norm(sec.centroids, axis=1), 1.0)
+    # Граница чтения отсекает разделы, начинающиеся позже
+    assert sec.top_sections(items[0].embedding, [], max_seq=5, top_m=1).tolist() == [0]
+
+
+def test_rank_top_scores_only_top_sections(monkeypatch):
+    monkeypatch.setattr(hierarchy, "HIER_RETRIEVAL", True)
+    monkeypatch.setattr(hierarchy, "HIER_MIN_ITEMS", 100)
+    monkeypatch.setattr(hierarchy, "HIER_TOP_SECTIONS", 4)
+    store = FakeStore(_corpus())
+    scored = []
+    real = retriever._cosine_scores
+
+    def counting(q, matrix, inv_norms):
+        scored.append(matrix.shape[0])
+        return real(q, matrix, inv_norms)
+
+    monkeypatch.setattr(retriever, "_cosine_scores", counting)
+    target = store.all()[17 * 30 + 5]
+    res = retriever.rank_top("", target.embedding, store, top_k=3)
+    assert res[0]["anchor"] == "s17p5"
+    assert set(res[0]) == {"file", "anchor", "title", "quote", "score", "kw_ratio", "cosine", "bm25"}
+    assert scored == [4 * 30]
+
+    # Раздел по ключевому слову заголовка выбирается BM25 первого этапа, граница соблюдается
+    res = retriever.rank_top("глава", target.embedding, store, top_k=3, max_seq=100)
+    assert all(int(r["anchor"][1:].split("p")[0]) <= 3 for r in res)
+
+
+def test_rank_top_sections_keep_lexical_hits_outside_top(monkeypatch):
+    monkeypatch.setattr(hierarchy, "HIER_RETRIEVAL", True)
+    monkeypatch.setattr(hierarchy, "HIER_MIN_ITEMS", 100)
+    monkeypatch.setattr(hierarchy, "HIER_TOP_SECTIONS", 4)
+    items = _corpus()
+    # Подстрока цитаты: keyword-совпадение есть, а BM25 разделов его не видит
+    items[3 * 30 + 2].quote = "абзац про неуникальность"
+    store = FakeStore(items)
+    scored = []
+    real = retriever._cosine_scores
+
+    def counting(q, matrix, inv_norms):
+        scored.append(matrix.shape[0])
+        return real(q, matrix, inv_norms)
+
+    monkeypatch.setattr(retriever, "_cosine_scores", counting)
+    res = retriever.rank_top("уникальн", items[17 * 30 + 5].embedding, store, top_k=4 * 30 + 1)
+    assert "s3p2" in [r["anchor"] for r in res]
+    assert scored == [4 * 30 + 1]
@@ -0,0 +1,45 @@
+import os
+from pathlib import Path
+
+from app.server.rag.index_store import IndexCache, IndexStore
+from app.server.rag.reader import Chunk
+
+
+def _build(p: Path, n: int) -> IndexStore:
+    store = IndexStore(path=p)
+    chunks = [Chunk(file="a.md", title="T", text=f"t{i}", anchor=f"a{i}", seq=i) for i in range(n)]
+    store.rebuild(chunks, [[1.0, 0.0] for _ in range(n)])
+    return store
+
+
+def test_cache_loads_once_and_reloads_on_change(tmp_path: Path):
+    p = tmp_path / "index.json"
+    _build(p, 2)
+    cache = IndexCache(path=p, check_interval=0.0)
+
+    s1 = cache.get()
+    s2 = cache.get()
+    assert s1 is s2
+    assert len(s1.all()) == 2
+    assert (cache.misses, cache.hits, cache.reloads) == (1, 1, 0)
+
+    # Меняем файл: другой размер и mtime → перезагрузка
+    _build(p, 3)
+    st = p.stat()
+    os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    s3 = cache.get()
+    assert s3 is not s1
+    assert len(s3.all()) == 3
+    assert cache.reloads == 1
+
+
+def test_cache_publish_replaces_without_disk_read(tmp_path: Path):
+    p = tmp_path / "index.json"
+    cache = IndexCache(path=p, check_interval=0.0)
+    assert cache.get().all() == []
+
+    store = _build(p, 1)
+    cache.publish(store)
+    assert cache.get() is store
+    stats = cache.stats()
+    assert stats["items"] == 1 and stats["reloads"] == 1
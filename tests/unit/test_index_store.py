@@ -1,7 +1,11 @@
 import json
+import os
 from pathlib import Path
 
-from app.server.rag.index_store import IndexStore, IndexedChunk
+import numpy as np
+import pytest
+
+from app.server.rag.index_store import IndexStore, IndexedChunk, convert_json_index
 from app.server.rag.reader import Chunk
 
 
@@ -29,7 +33,7 @@ def test_index_store_save_and_load(tmp_path: Path):
     assert len(items) == 2
     assert isinstance(items[0], IndexedChunk)
     assert items[0].file == "a.md"
-    assert items[0].embedding == [0.0, 1.0]
+    assert list(items[0].embedding) == [0.0, 1.0]
 
 
 def test_index_store_handles_missing_quote_on_load(tmp_path: Path):
@@ -44,3 +48,142 @@ def test_index_store_handles_missing_quote_on_load(tmp_path: Path):
     items = store.all()
     assert len(items) == 1
     assert hasattr(items[0], "quote")
+
+
+def test_binary_index_is_memory_mapped_without_copy(tmp_path: Path):
+    p = tmp_path / "index.json"
+    store = IndexStore(path=p)
+    chunks = [
+        Chunk(file="a.md", title="T", text="X", anchor="aaa", seq=0),
+        Chunk(file="a.md", title="T", text="Y", anchor="bbb", seq=1),
+    ]
+    store.rebuild(chunks, [[0.0, 1.0], [1.0, 0.0]])
+    assert store.vectors_path.stat().st_size == 2 * 2 * 4
+
+    store2 = IndexStore(path=p)
+    store2.load()
+    assert isinstance(store2.matrix, np.memmap)
+    assert store2.matrix.shape == (2, 2)
+    assert np.shares_memory(store2.all()[1].embedding, store2.matrix)
+    assert [it.anchor for it in store2.all()] == ["aaa", "bbb"]
+    assert store2.all()[1].file == "a.md"
+
+
+def test_convert_legacy_json_index(tmp_path: Path):
+    p = tmp_path / "index.json"
+    legacy = [
+        {"file": "a.md", "title": "T", "anchor": "a", "seq": 0, "embedding": [0.5, 0.5], "quote": "q"},
+    ]
+    p.write_text(json.dumps(legacy), encoding="utf-8")
+    convert_json_index(p)
+
+    store = IndexStore(path=p)
+    assert store.has_binary()
+    store.load()
+    assert store.all()[0].quote == "q"
+    assert np.allclose(store.matrix, [[0.5, 0.5]])
+
+
+def _chunks(n: int):
+    return [Chunk(file="a.md", title="T", text=f"t{i}", anchor=f"a{i}", seq=i) for i in range(n)]
+
+
+def test_generation_swap_keeps_old_snapshot_readable(tmp_path: Path):
+    p = tmp_path / "index.json"
+    writer = IndexStore(path=p)
+    writer.rebuild(_chunks(2), [[1.0, 0.0], [0.0, 1.0]])
+    first = writer.generation
+    assert (tmp_path / "index.gen" / "CURRENT").read_text().strip() == first
+
+    reader = IndexStore(path=p)
+    reader.load()
+    assert reader.generation == first
+
+    writer.rebuild(_chunks(3), [[1.0, 1.0], [2.0, 2.0], [3.0, 3.0]])
+    assert writer.generation != first
+    # Старый снимок по-прежнему читается, новый загрузчик видит новое поколение
+    assert np.allclose(reader.matrix, [[1.0, 0.0], [0.0, 1.0]])
+    fresh = IndexStore(path=p)
+    fresh.load()
+    assert fresh.generation == writer.generation
+    assert len(fresh.all()) == 3
+
+
+def test_old_generations_are_garbage_collected(tmp_path: Path, monkeypatch):
+    import app.server.rag.index_store as mod
+
+    monkeypatch.setattr(mod, "INDEX_GENERATIONS_KEEP", 2)
+    p = tmp_path / "index.json"
+    store = IndexStore(path=p)
+    for _ in range(4):
+        store.rebuild(_chunks(1), [[1.0, 0.0]])
+    gens = sorted(d.name for d in (tmp_path / "index.gen").iterdir() if d.is_dir())
+    assert len(gens) == 2
+    assert store.generation in gens
+    assert not any(n.startswith(".tmp-") for n in gens)
+
+
+def test_generation_is_attached_via_mmap_and_shared_between_readers(tmp_path: Path):
+    import mmap
+
+    from app.server.rag.index_store import IndexCache
+
+    p = tmp_path / "index.json"
+    writer = IndexStore(path=p)
+    chunks = [
+        Chunk(file="a.md", title="Речь Павсания", text="Эрот пандемос", anchor="α", seq=0),
+        Chunk(file="b.md", title="Речь Федра", text="О любви", anchor="b", seq=1),
+    ]
+    writer.rebuild(chunks, [[1.0, 0.0], [0.0, 2.0]])
+
+    a, b = IndexStore(path=p), IndexStore(path=p)
+    a.load()
+    b.load()
+    # Колонки, нормы и лексика — отображения файлов поколения, а не разобранные копии
+    assert isinstance(a.columns.seqs, np.memmap) and isinstance(a.columns.blob, mmap.mmap)
+    assert isinstance(a.inverse_norms(), np.memmap)
+    assert isinstance(a.lexical().hay.blob, mmap.mmap)
+    assert isinstance(a.lexical().bm25.doc_ids, np.memmap)
+    assert a.columns.seqs.filename == b.columns.seqs.filename
+    assert [(it.file, it.title, it.anchor, it.seq, it.quote) for it in a.all()] == [
+        (c.file, c.title, c.anchor, c.seq, c.text) for c in chunks
+    ]
+    assert list(a.lexical().hay.docs_containing("павсан")) == [0]
+    assert np.allclose(a.inverse_norms(), [1.0, 0.5])
+
+    # Кэш другого воркера подхватывает поколение, опубликованное этим процессом
+    cache = IndexCache(path=p, check_interval=0.0)
+    assert len(cache.get().all()) == 2
+    writer.rebuild(chunks[:1], [[1.0, 0.0]])
+    assert cache.get().generation == writer.generation
+    assert len(cache.get().all()) == 1 and cache.reloads == 1
+
+
+def test_private_mode_reads_generation_into_memory(tmp_path: Path, monkeypatch):
+    import app.server.rag.index_store as mod
+
+    p = tmp_path / "index.json"
+    IndexStore(path=p).rebuild(_chunks(3), [[1.0, 0.0]] * 3)
+    monkeypatch.setattr(mod, "INDEX_SHARED", False)
+    store = IndexStore(path=p)
+    store.load()
+    assert not isinstance(store.columns.seqs, np.memmap) and isinstance(store.columns.blob, bytes)
+    assert [it.anchor for it in store.all()] == ["a0", "a1", "a2"]
+    assert list(store.lexical().hay.docs_containing("t1")) == [1]
+
+
+def test_load_binary_rejects_truncated_columns(tmp_path: Path, monkeypatch):
+    p = tmp_path / "index.json"
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(Path(os.readlink(f"/proc/self/fd/{fd}")).name) or real_fsync(fd))
+    store = IndexStore(path=p)
+    chunks = [Chunk(file="a.md", title="T", text=t, anchor=t, seq=i) for i, t in enumerate("XYZ")]
+    store.rebuild(chunks, [[1.0, 0.0]] * 3)
+    # Все файлы поколения синхронизированы до публикации
+    assert {"seqs.i32", "blob.utf8", "tables.json", "inv_norms.f32", "meta.json"} <= set(synced)
+
+    # Файл колонки обрезан (сбой до записи на диск) — загрузка не подхватывает пустой индекс молча
+    (store.generation_dir / "seqs.i32").write_bytes(b"")
+    with pytest.raises(ValueError):
+        IndexStore(path=p).load()
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from app.server.rag.jobs import JobRunner, ReindexCancelled
+
+
+def wait(job, timeout=5.0):
+    end = time.time() + timeout
+    while job.status in ("queued", "running") and time.time() < end:
+        time.sleep(0.01)
+    return job
+
+
+def test_job_reports_progress_and_result():
+    runner = JobRunner()
+    seen = []
+
+    def fn(job):
+        job.report("parse", 1, 1)
+        for i in range(1, 5):
+            job.report("embed", i, 4)
+            seen.append(job.percent)
+        job.report("save", 0, 1)
+        return {"items": 4, "embedded": 4}
+
+    job = wait(runner.submit(fn))
+    assert job.status == "done"
+    assert job.items == 4 and job.result["embedded"] == 4
+    assert job.to_dict()["percent"] == 100.0
+    assert seen == sorted(seen) and seen[-1] == 95.0
+
+
+def test_job_cancel_stops_at_next_checkpoint():
+    runner = JobRunner()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fn(job):
+        job.report("embed", 0, 10)
+        started.set()
+        release.wait(2)
+        job.report("embed", 5, 10)  # здесь должна сработать отмена
+        return {"items": 10}
+
+    job = runner.submit(fn)
+    assert started.wait(2)
+    runner.cancel(job.id)
+    release.set()
+    wait(job)
+    assert job.status == "cancelled"
+    assert job.items is None
+    # Отменённая задача не принимает новый прогресс
+    with pytest.raises(ReindexCancelled):
+        job.report("save", 0, 1)
+
+
+def test_job_error_is_reported():
+    runner = JobRunner()
+
+    def fn(job):
+        raise RuntimeError("boom")
+
+    job = wait(runner.submit(fn))
+    assert job.status == "error" and job.error == "boom"
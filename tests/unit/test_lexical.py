@@ -0,0 +1,97 @@
+import math
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from app.server.rag.index_store import IndexStore
+from app.server.rag.lexical import BM25Index, SubstringIndex, tokenize
+from app.server.rag.reader import Chunk
+
+
+DOCS = [
+    "речь федра о любви",
+    "павсаний говорит об эроте и любви любви",
+    "сократ и диотима",
+    "",
+]
+
+
+def brute_bm25(docs, query, k1=1.5, b=0.75):
+    toks = [tokenize(d) for d in docs]
+    N = max(1, len(toks))
+    avgdl = sum(len(t) for t in toks) / N or 1.0
+    df = Counter(w for t in toks for w in set(t))
+    out = []
+    for t in toks:
+        tf = Counter(t)
+        s = 0.0
+        for q in set(tokenize(query)):
+            n = df.get(q, 0)
+            if not n:
+                continue
+            idf = max(0.0, math.log((N - n + 0.5) / (n + 0.5)))
+            f = tf.get(q, 0)
+            s += idf * (f * (k1 + 1)) / (f + k1 * (1 - b + b * len(t) / avgdl))
+        out.append(s)
+    return out
+
+
+def test_bm25_scores_only_matching_docs_and_match_bruteforce():
+    idx = BM25Index.build(DOCS)
+    docs, scores = idx.score(tokenize("любви сократ"))
+    assert list(docs) == [0, 1, 2]
+    expected = brute_bm25(DOCS, "любви сократ")
+    assert np.allclose(scores, [expected[d] for d in docs])
+
+
+def test_substring_index_finds_each_doc_once():
+    sub = SubstringIndex(["павсаний павсаний", "нет", "о павсании"])
+    assert list(sub.docs_containing("павсан")) == [0, 2]
+    assert list(sub.docs_containing("нет")) == [1]
+    assert not sub.docs_containing("xyz").size
+
+
+def test_rebuild_writes_bm25_sidecar(tmp_path: Path):
+    p = tmp_path / "index.json"
+    store = IndexStore(path=p)
+    store.rebuild([Chunk(file="a.md", title="Речь Федра", text="О любви", anchor="a", seq=0)], [[1.0, 0.0]])
+    assert store.bm25_path.exists()
+    loaded = IndexStore(path=p)
+    loaded.load()
+    assert loaded.lexical().bm25.vocab == ["любви", "речь", "федра"]
+
+
+def test_bm25_prefix_by_seq_matches_index_built_on_prefix():
+    # Два файла с перекрывающимися seq: граница применяется к обоим
+    docs = ["любовь и эрот", "эрот эрот", "сократ о любви", "любовь", "речь агафона"]
+    seqs = [0, 1, 2, 0, 1]
+    idx = BM25Index.build(docs, seqs)
+    assert idx.prefix_size(1) == 4
+
+    prefix = [i for i, s in enumerate(seqs) if s <= 1]
+    ref = BM25Index.build([docs[i] for i in prefix])
+    q = tokenize("любовь эрот")
+    docs_b, scores_b = idx.score(q, max_seq=1)
+    docs_r, scores_r = ref.score(q)
+    assert [int(d) for d in docs_b] == [prefix[d] for d in docs_r]
+    assert np.allclose(scores_b, scores_r)
+    ids, _ = idx.postings("любовь", max_seq=0)
+    assert sorted(ids.tolist()) == [0, 3]
+
+
+def test_lexical_index_attached_from_files_matches_built(tmp_path: Path):
+    from app.server.rag.lexical import LexicalIndex
+
+    items = [Chunk(file="a.md", title=t, text="", anchor="a", seq=i) for i, t in enumerate(["Павсаний", "", "Федр о любви"])]
+    for it, q in zip(items, DOCS):
+        it.quote = q
+    built = LexicalIndex.from_items(items)
+    built.save(tmp_path)
+    attached = LexicalIndex.attach(tmp_path)
+    for needle in ("павсан", "любви", "о", "xyz"):
+        assert list(attached.hay.docs_containing(needle)) == list(built.hay.docs_containing(needle))
+    for max_seq in (None, 1):
+        d1, s1 = built.bm25.score(tokenize("любви эроте"), max_seq)
+        d2, s2 = attached.bm25.score(tokenize("любви эроте"), max_seq)
+        assert list(d1) == list(d2) and np.allclose(s1, s2)
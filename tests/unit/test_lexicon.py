@@ -0,0 +1,48 @@
+import json
+import random
+from pathlib import Path
+
+from app.server.rag.lexicon import AhoCorasick, Lexicon, load_lexicon, lexicon_paths
+
+
+def test_automaton_finds_all_overlapping_matches_like_bruteforce():
+    words = ["он", "она", "ан", "нас", "а", "сон", "оно"]
+    ac = AhoCorasick((w, "w", w, False) for w in words)
+    rnd = random.Random(0)
+    for _ in range(200):
+        text = "".join(rnd.choice("онас ") for _ in range(rnd.randint(0, 30)))
+        expected = sorted(
+            (i, i + len(w), w) for w in words for i in range(len(text)) if text.startswith(w, i)
+        )
+        assert sorted((m.start, m.end, m.key) for m in ac.scan(text)) == expected
+
+
+def test_word_patterns_respect_boundaries():
+    ac = AhoCorasick([("читаю", "trigger", "now", True), ("эрот", "name", "эрот", True)])
+    assert [m.key for m in ac.scan("я читаю про эрота")] == ["now"]
+    assert [m.key for m in ac.scan("перечитаю, эрот!")] == ["эрот"]
+
+
+def test_lexicon_scan_groups_categories_and_keeps_priority(tmp_path: Path):
+    data = {
+        "speakers": [{"key": "сократ", "order": 2}, {"key": "федр", "order": 1, "stems": ["федр", "phaedr"]}],
+        "triggers": {"now": ["я читаю"]},
+        "anachronisms": ["интернет"],
+        "aliases": [["павсан", "паусан"]],
+    }
+    path = tmp_path / "book.lexicon.json"
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    lex = load_lexicon([path])
+    scan = lex.scan("Я   читаю Phaedrus и Сократа.\nИнтернет? Павсаний")
+    assert scan.text.startswith("я читаю phaedrus")
+    assert scan.keys("speaker") == ["федр", "сократ"]
+    assert lex.speakers == ["сократ", "федр"] and lex.speaker_order == {"сократ": 2, "федр": 1}
+    assert scan.has("trigger", "now") and scan.has("anachronism")
+    assert lex.aliases["паусан"] == ["паусан", "павсан"]
+    assert not Lexicon.merge([]).scan("я читаю сократа").matches
+
+
+def test_book_lexicon_ships_next_to_the_book():
+    paths = lexicon_paths()
+    assert paths and all(p.name.endswith(".lexicon.json") for p in paths)
+    assert "алкивиад" in load_lexicon(paths).speakers
@@ -0,0 +1,35 @@
+import os
+from pathlib import Path
+
+from app.server.rag.manifest import Manifest, diff_manifest, load_manifest, save_manifest, scan_sources
+
+
+def test_scan_and_diff_detect_content_changes(tmp_path: Path):
+    (tmp_path / "a.md").write_text("a", encoding="utf-8")
+    (tmp_path / "b.md").write_text("b", encoding="utf-8")
+    old = scan_sources([tmp_path])
+
+    # touch без изменения содержимого — не изменение
+    st = (tmp_path / "a.md").stat()
+    os.utime(tmp_path / "a.md", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    (tmp_path / "b.md").write_text("bb", encoding="utf-8")
+    (tmp_path / "c.md").write_text("c", encoding="utf-8")
+    new = scan_sources([tmp_path], old)
+
+    diff = diff_manifest(old, new)
+    names = lambda fs: [Path(f).name for f in fs]
+    assert names(diff.added) == ["c.md"]
+    assert names(diff.changed) == ["b.md"]
+    assert names(diff.unchanged) == ["a.md"]
+    assert diff.removed == []
+    assert not diff.is_empty()
+
+
+def test_manifest_roundtrip(tmp_path: Path):
+    (tmp_path / "a.md").write_text("a", encoding="utf-8")
+    m = Manifest(model="m", files=scan_sources([tmp_path]))
+    path = tmp_path / "index.manifest.json"
+    save_manifest(path, m)
+    assert load_manifest(path) == m
+    path.write_text("{broken", encoding="utf-8")
+    assert load_manifest(path) is None
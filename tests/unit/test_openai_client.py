@@ -0,0 +1,186 @@
+import httpx
+
+from app.server.providers import openai_client
+from app.server.providers.openai_client import OpenAIClient, close_http_client, http_client
+
+
+def test_http_pool_is_shared_and_recreated_after_close():
+    c1 = http_client()
+    assert http_client() is c1
+    close_http_client()
+    assert c1.is_closed
+    c2 = http_client()
+    assert c2 is not c1 and not c2.is_closed
+    close_http_client()
+
+
+def test_embed_and_chat_reuse_one_connection_pool(monkeypatch):
+    monkeypatch.setattr(openai_client, "FAKE_EMBEDDINGS", False)
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path)
+        if request.url.path.endswith("/embeddings"):
+            return httpx.Response(200, json={"data": [{"embedding": [0.1, 0.2]}]})
+        return httpx.Response(200, json={"choices": [{"message": {"content": " ok "}}]})
+
+    http = httpx.Client(transport=httpx.MockTransport(handler))
+    client = OpenAIClient(api_key="k", http=http)
+    assert client.embed(["a"]) == [[0.1, 0.2]]
+    assert client.chat("q") == "ok"
+    assert client.http is http
+    assert seen == ["/v1/embeddings", "/v1/chat/completions"]
+
+
+def test_async_client_embed_and_chat(monkeypatch):
+    import asyncio
+    from app.server.providers.openai_client import AsyncOpenAIClient
+
+    monkeypatch.setattr(openai_client, "FAKE_EMBEDDINGS", False)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/embeddings"):
+            return httpx.Response(200, json={"data": [{"embedding": [1.0]}, {"embedding": [2.0]}]})
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ответ"}}]})
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http:
+            client = AsyncOpenAIClient(api_key="k", http=http)
+            return await client.embed(["a", "b"]), await client.chat("q")
+
+    embs, reply = asyncio.run(run())
+    assert embs == [[1.0], [2.0]]
+    assert reply == "ответ"
+
+
+def test_embed_query_skips_network_on_repeat(monkeypatch):
+    from app.server.providers.embedding_cache import QueryEmbeddingCache
+
+    monkeypatch.setattr(openai_client, "FAKE_EMBEDDINGS", False)
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(1)
+        return httpx.Response(200, json={"data": [{"embedding": [0.5]}]})
+
+    client = OpenAIClient(api_key="k", http=httpx.Client(transport=httpx.MockTransport(handler)))
+    client.query_cache = QueryEmbeddingCache(max_size=8)
+    assert client.embed_query("Что такое эрот?") == [0.5]
+    assert client.embed_query("что такое  эрот?") == [0.5]
+    assert len(calls) == 1
+    assert client.query_cache.stats()["hits"] == 1
+
+
+def test_split_batches_respects_item_and_token_limits():
+    from app.server.providers.openai_client import split_batches
+
+    texts = ["a" * 10, "b" * 10, "c" * 10, "d" * 100, "e"]
+    # ≈5 токенов на короткий текст, 50 на длинный
+    assert split_batches(texts, max_items=2, max_tokens=1000) == [[0, 1], [2, 3], [4]]
+    assert split_batches(texts, max_items=10, max_tokens=20) == [[0, 1, 2], [3], [4]]
+
+
+def test_embed_batched_retries_and_keeps_order(monkeypatch):
+    import json
+    import threading
+    from app.server.providers.openai_client import embed_batched
+
+    monkeypatch.setattr(openai_client, "FAKE_EMBEDDINGS", False)
+    lock = threading.Lock()
+    state = {"calls": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        inputs = json.loads(request.content)["input"]
+        with lock:
+            state["calls"] += 1
+            first = state["calls"] == 1
+        if first:
+            return httpx.Response(429, headers={"retry-after": "0"}, json={"error": "rate"})
+        return httpx.Response(200, json={"data": [{"embedding": [float(t)]} for t in inputs]})
+
+    client = OpenAIClient(api_key="k", http=httpx.Client(transport=httpx.MockTransport(handler)))
+    texts = [str(i) for i in range(10)]
+    sleeps = []
+    out = embed_batched(client, texts, max_items=3, concurrency=3, sleep=sleeps.append)
+    assert out == [[float(i)] for i in range(10)]
+    assert state["calls"] == 5  # 4 пакета + 1 повтор
+    assert sleeps == [0.0]
+
+
+def test_embed_batched_does_not_retry_client_errors(monkeypatch):
+    import pytest
+    from app.server.providers.openai_client import OpenAIHTTPError, embed_batched
+
+    monkeypatch.setattr(openai_client, "FAKE_EMBEDDINGS", False)
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(1)
+        return httpx.Response(400, json={"error": "too long"})
+
+    client = OpenAIClient(api_key="k", http=httpx.Client(transport=httpx.MockTransport(handler)))
+    with pytest.raises(OpenAIHTTPError) as exc:
+        embed_batched(client, ["x"], sleep=lambda s: None)
+    assert exc.value.status_code == 400
+    assert len(calls) == 1
+
+
+def test_dimensions_are_requested_from_api_when_model_supports_them(monkeypatch):
+    import json
+
+    monkeypatch.setattr(openai_client, "FAKE_EMBEDDINGS", False)
+    monkeypatch.setattr(openai_client, "EMBED_DIMENSIONS", 256)
+    bodies = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        bodies.append(json.loads(request.content))
+        return httpx.Response(200, json={"data": [{"embedding": [0.1, 0.2]}]})
+
+    client = OpenAIClient(api_key="k", http=httpx.Client(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(openai_client, "OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+    client.embed(["a"])
+    assert bodies[-1]["dimensions"] == 256
+    assert client.embedding_model == "text-embedding-3-small@256"
+
+    # Модель без поддержки dimensions — полные векторы, понижение локально
+    monkeypatch.setattr(openai_client, "OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+    client.embed(["a"])
+    assert "dimensions" not in bodies[-1]
+    assert client.embedding_model == "text-embedding-ada-002"
+
+
+def test_async_pool_of_previous_loop_is_closed():
+    import asyncio
+
+    async def get():
+        return openai_client.async_http_client()
+
+    async def get_and_settle():
+        pool = openai_client.async_http_client()
+        await asyncio.sleep(0)
+        return pool
+
+    first = asyncio.run(get())
+    second = asyncio.run(get_and_settle())
+    try:
+        assert second is not first
+        assert first.is_closed and not second.is_closed
+    finally:
+        asyncio.run(openai_client.aclose_http_client())
+
+
+def test_retry_after_is_capped_by_backoff_max(monkeypatch):
+    from app.server.providers.openai_client import OpenAIHTTPError, _with_retries
+
+    monkeypatch.setattr(openai_client, "EMBED_BACKOFF_MAX", 30.0)
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OpenAIHTTPError("rate", 429, retry_after=3600.0)
+        return [[1.0]]
+
+    sleeps = []
+    assert _with_retries(fn, max_retries=2, sleep=sleeps.append) == [[1.0]]
+    assert sleeps == [30.0]
@@ -0,0 +1,74 @@
+from pathlib import Path
+
+from app.server.providers.embedding_cache import EmbeddingDiskCache
+from app.server.rag.pipeline import embed_with_cache
+
+
+class CountingClient:
+    embedding_model = "test-model"
+
+    def __init__(self):
+        self.batches = []
+
+    def embed(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+def test_embed_with_cache_reuses_unchanged_texts(tmp_path: Path):
+    cache = EmbeddingDiskCache(path=tmp_path / "emb.sqlite")
+    client = CountingClient()
+
+    first = embed_with_cache(client, ["aa", "bbb", "aa"], cache)
+    assert first == [[2.0, 1.0], [3.0, 1.0], [2.0, 1.0]]
+    assert client.batches == [["aa", "bbb"]]
+    assert cache.last_run == {"reused": 1, "embedded": 2}
+
+    # Неизменённая библиотека: ни одного вызова API
+    again = embed_with_cache(client, ["aa", "bbb"], cache)
+    assert again == [[2.0, 1.0], [3.0, 1.0]]
+    assert len(client.batches) == 1
+    assert cache.last_run == {"reused": 2, "embedded": 0}
+
+    # Изменился один абзац → один текст в API
+    embed_with_cache(client, ["aa", "cccc"], cache)
+    assert client.batches[-1] == ["cccc"]
+
+
+def test_rebuild_index_reembeds_only_changed_files(tmp_path: Path):
+    from app.server.rag.index_store import IndexStore
+    from app.server.rag.pipeline import rebuild_index
+
+    book = tmp_path / "book"
+    ctx = tmp_path / "context"
+    book.mkdir()
+    ctx.mkdir()
+    (book / "a.md").write_text("# A\n\nalpha one\n\nalpha two\n", encoding="utf-8")
+    (book / "b.md").write_text("# B\n\nbeta\n", encoding="utf-8")
+    cache = EmbeddingDiskCache(path=tmp_path / "emb.sqlite")
+    client = CountingClient()
+    path = tmp_path / "index.json"
+
+    store = rebuild_index(client, IndexStore(path), cache, sources=[book, ctx])
+    assert [(it.file.rsplit("/", 1)[-1], it.seq) for it in store.all()] == [("a.md", 0), ("a.md", 1), ("b.md", 0)]
+    first_gen = store.generation
+
+    # Без изменений: ни разбора, ни новой версии индекса
+    store = rebuild_index(client, IndexStore(path), cache, sources=[book, ctx])
+    assert store.generation == first_gen
+
+    # Новая заметка контекста и правка b.md: в API уходят только их абзацы
+    (ctx / "note.md").write_text("# Note\n\ngamma\n", encoding="utf-8")
+    (book / "b.md").write_text("# B\n\nbeta changed\n", encoding="utf-8")
+    calls = len(client.batches)
+    store = rebuild_index(client, IndexStore(path), cache, sources=[book, ctx])
+    assert client.batches[calls:] == [["beta changed", "gamma"]]
+    files = [(it.file.rsplit("/", 1)[-1], it.seq) for it in store.all()]
+    assert files == [("a.md", 0), ("a.md", 1), ("b.md", 0), ("note.md", 0)]
+
+    # Удалённый файл уходит из индекса, остальные seq не меняются
+    (book / "a.md").unlink()
+    store = rebuild_index(client, IndexStore(path), cache, sources=[book, ctx])
+    reloaded = IndexStore(path)
+    reloaded.load()
+    assert [(it.file.rsplit("/", 1)[-1], it.seq) for it in reloaded.all()] == [("b.md", 0), ("note.md", 0)]
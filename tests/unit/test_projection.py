@@ -0,0 +1,61 @@
+from pathlib import Path
+
+import numpy as np
+
+from app.server.providers import openai_client
+from app.server.providers.embedding_cache import EmbeddingDiskCache
+from app.server.rag.ann_bench import synthetic_corpus
+from app.server.rag.index_store import IndexStore
+from app.server.rag.pipeline import rebuild_index
+from app.server.rag.projection import Projection
+from app.server.rag.retriever import rank_top
+
+
+def test_truncate_and_pca_reduce_and_normalize(tmp_path: Path):
+    m = synthetic_corpus(500, 48, seed=9)
+    for kind in ("truncate", "pca"):
+        proj = Projection.fit(kind, 16, m)
+        out = proj.apply(m)
+        assert out.shape == (500, 16)
+        assert np.allclose(np.linalg.norm(out, axis=1), 1.0, atol=1e-5)
+        proj.save(tmp_path / f"{kind}.npz")
+        again = Projection.load(tmp_path / f"{kind}.npz")
+        assert np.allclose(again.apply_one(m[3].tolist()), out[3], atol=1e-5)
+
+
+class VecClient:
+    embedding_model = "vec-model"
+    embedding_dimensions = None
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed(self, texts):
+        return [self.vectors[t].tolist() for t in texts]
+
+
+def test_local_pca_is_stored_with_index_and_applied_to_queries(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(openai_client, "EMBED_DIMENSIONS", 8)
+    monkeypatch.setattr(openai_client, "EMBED_REDUCTION", "pca")
+    m = synthetic_corpus(60, 32, seed=10)
+    book = tmp_path / "book"
+    book.mkdir()
+    (book / "a.md").write_text("# A\n\n" + "\n\n".join(f"p{i}" for i in range(60)) + "\n", encoding="utf-8")
+    client = VecClient({f"p{i}": m[i] for i in range(60)} | {"new": m[0] * 2})
+    cache = EmbeddingDiskCache(path=tmp_path / "emb.sqlite")
+    path = tmp_path / "index.json"
+
+    rebuild_index(client, IndexStore(path), cache, sources=[book])
+    store = IndexStore(path)
+    store.load()
+    assert store.projection is not None and store.projection.kind == "pca"
+    assert store.matrix.shape == (60, 8)
+    # Полноразмерный эмбеддинг запроса проецируется той же PCA
+    assert rank_top("", m[17].tolist(), store, top_k=1)[0]["anchor"] == store.all()[17].anchor
+
+    # Инкрементальная переиндексация использует сохранённую проекцию
+    components = store.projection.components.copy()
+    (book / "b.md").write_text("# B\n\nnew\n", encoding="utf-8")
+    updated = rebuild_index(client, IndexStore(path), cache, sources=[book])
+    assert np.array_equal(updated.projection.components, components)
+    assert updated.matrix.shape == (61, 8)
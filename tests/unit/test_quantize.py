@@ -0,0 +1,48 @@
+from pathlib import Path
+
+import numpy as np
+
+from app.server.rag.ann_bench import synthetic_corpus
+from app.server.rag.index_store import IndexStore
+from app.server.rag.quantize import dequantize, quantize, recall_at_k
+from app.server.rag.reader import Chunk
+from app.server.rag.retriever import rank_top
+
+
+def test_int8_quantization_uses_per_vector_scale():
+    m = np.asarray([[0.5, -1.0, 0.25], [100.0, 50.0, -25.0]], dtype=np.float32)
+    q, scales = quantize(m, "int8")
+    assert q.dtype == np.int8 and scales.shape == (2,)
+    assert np.abs(q).max() == 127
+    assert np.allclose(dequantize(q, scales), m, rtol=0.02, atol=1e-3)
+
+
+def test_recall_loss_is_small_for_float16_and_int8():
+    m = synthetic_corpus(3000, 64, seed=7)
+    assert recall_at_k(m, "float32") == 1.0
+    assert recall_at_k(m, "float16") >= 0.98
+    assert recall_at_k(m, "int8") >= 0.9
+
+
+def test_quantized_store_roundtrip_and_ranking(tmp_path: Path):
+    m = synthetic_corpus(300, 32, seed=8)
+    chunks = [Chunk(file="a.md", title="T", text=f"p{i}", anchor=f"a{i}", seq=i) for i in range(300)]
+    for precision, dtype, name in (("float16", np.float16, "vectors.f16"), ("int8", np.int8, "vectors.i8")):
+        path = tmp_path / precision / "index.json"
+        path.parent.mkdir()
+        writer = IndexStore(path)
+        writer.rebuild(chunks, m.tolist())
+        writer.save_binary(precision)
+
+        store = IndexStore(path)
+        store.load()
+        assert store.precision == precision
+        assert store.matrix.dtype == dtype
+        assert store.vectors_path.name == name
+        assert store.vectors_path.stat().st_size == 300 * 32 * np.dtype(dtype).itemsize
+        assert 0.0 < store.quantization["recall_at_10"] <= 1.0
+        # Эмбеддинг элемента — разквантованные значения
+        assert np.allclose(np.asarray(store.all()[5].embedding, dtype=np.float32), m[5], rtol=0.05, atol=0.05)
+        res = rank_top("", m[42].tolist(), store, top_k=3)
+        assert res[0]["anchor"] == "a42"
+        assert abs(res[0]["cosine"] - 1.0) < 1e-2
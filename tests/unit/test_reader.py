@@ -79,3 +79,97 @@ C
     assert len(chunks) == 3
     # Проверим, что file указывает на соответствующий абсолютный путь
     assert chunks[0].file.endswith("a.md") or chunks[0].file.endswith("z.md")
+
+
+def test_streaming_split_matches_splitlines(tmp_path: Path):
+    md = "# Речь Павсания\r\n\r\nЭрот не один,\r\nа их два.\u2028Вот.\r\n\r\n# Ёмкий заголовок\nТекст — с тире…\n"
+    p = tmp_path / "c.md"
+    p.write_bytes(md.encode("utf-8"))
+    chunks = parse_markdown_file(p)
+
+    assert [c.text for c in chunks] == ["Эрот не один,\nа их два.\nВот.", "Текст — с тире…"]
+    assert [c.title for c in chunks] == ["Речь Павсания", "Ёмкий заголовок"]
+
+
+def test_iter_markdown_file_is_lazy(tmp_path: Path):
+    from app.server.rag.reader import iter_markdown_file
+
+    p = write(tmp_path, "d.md", "# T\n\nА\n\nБ\n")
+    it = iter_markdown_file(p)
+    first = next(it)
+    assert first.text == "А" and first.seq == 0
+    assert [c.text for c in it] == ["Б"]
+
+
+def test_parse_markdown_dir_parallel_matches_serial(tmp_path: Path, monkeypatch):
+    from app.server.rag import reader
+
+    d = tmp_path / "notes"
+    (d / "sub").mkdir(parents=True)
+    for i in range(12):
+        write(d if i % 2 else d / "sub", f"n{i:02d}.md", f"# Заметка {i}\n\nПервый {i}.\n\nВторой {i}.\n")
+
+    serial = parse_markdown_dir(d, workers=1)
+    monkeypatch.setattr(reader, "PARSE_PARALLEL_MIN_FILES", 1)
+    parallel = parse_markdown_dir(d, workers=3)
+
+    assert len(serial) == 24
+    assert parallel == serial
+    assert [c.seq for c in parallel[:2]] == [0, 1]
+
+
+class _InlinePool:
+    """Пул, выполняющий пакеты сразу в текущем процессе; запоминает вызовы shutdown."""
+
+    instances: list = []
+
+    def __init__(self, max_workers, mp_context=None):
+        self.shutdowns = []
+        _InlinePool.instances.append(self)
+
+    def submit(self, fn, *args):
+        from concurrent.futures import Future
+
+        fut = Future()
+        try:
+            fut.set_result(fn(*args))
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shutdowns.append((wait, cancel_futures))
+
+
+def test_closing_parallel_parse_cancels_pending_without_waiting(tmp_path: Path, monkeypatch):
+    from app.server.rag import reader
+
+    paths = [write(tmp_path, f"n{i}.md", f"# T\n\nА{i}\n") for i in range(8)]
+    monkeypatch.setattr(reader, "PARSE_PARALLEL_MIN_FILES", 1)
+    monkeypatch.setattr(reader, "ProcessPoolExecutor", _InlinePool)
+    _InlinePool.instances = []
+
+    it = reader.iter_parsed_files(paths, workers=2)
+    assert next(it)[0].text == "А0"
+    it.close()
+    assert _InlinePool.instances[0].shutdowns == [(False, True)]
+
+
+def test_parallel_parse_propagates_worker_errors_without_serial_rerun(tmp_path: Path, monkeypatch):
+    import pytest
+
+    from app.server.rag import reader
+
+    paths = [write(tmp_path, "a.md", "A\n"), tmp_path / "missing.md", write(tmp_path, "b.md", "B\n"), write(tmp_path, "c.md", "C\n")]
+    monkeypatch.setattr(reader, "PARSE_PARALLEL_MIN_FILES", 1)
+    monkeypatch.setattr(reader, "ProcessPoolExecutor", _InlinePool)
+    _InlinePool.instances = []
+    calls = []
+    real = reader.parse_markdown_file
+    monkeypatch.setattr(reader, "parse_markdown_file", lambda p: calls.append(p) or real(p))
+
+    with pytest.raises(FileNotFoundError):
+        list(reader.iter_parsed_files(paths, workers=2))
+    # Каждый файл разобран один раз (пакетами пула), повторного последовательного прохода нет
+    assert len(calls) == 4
+    assert _InlinePool.instances[0].shutdowns == [(False, True)]
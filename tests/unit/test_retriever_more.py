@@ -35,3 +35,47 @@ def test_retrieve_empty_query_still_returns_top_by_cosine():
     assert len(res) == 1
     # Должен выбрать документ с embedding ближе к [1,0]
     assert res[0]["file"] == "a.md"
+
+
+def test_cosine_scores_vectorized_with_store_norms():
+    import numpy as np
+    from app.server.rag.index_store import IndexStore
+    from app.server.rag.retriever import _cosine_scores
+
+    store = IndexStore()
+    store.items = [
+        IndexedChunk(file="a.md", title="A", anchor="x1", seq=0, embedding=[3.0, 0.0], quote=""),
+        IndexedChunk(file="b.md", title="B", anchor="x2", seq=1, embedding=[1.0, 1.0], quote=""),
+        IndexedChunk(file="c.md", title="C", anchor="x3", seq=2, embedding=[0.0, 0.0], quote=""),
+    ]
+    scores = _cosine_scores([2.0, 0.0], store.embedding_matrix(), store.inverse_norms())
+    assert np.allclose(scores, [1.0, 2 ** -0.5, 0.0], atol=1e-6)
+
+
+def test_top_k_partial_selection_orders_desc_and_stable():
+    import numpy as np
+    from app.server.rag.retriever import _top_k
+
+    scores = np.array([0.1, 0.9, 0.5, 0.9, 0.3])
+    assert list(_top_k(scores, 3)) == [1, 3, 2]
+    assert list(_top_k(scores, 10)) == [1, 3, 2, 4, 0]
+
+
+def test_aretrieve_top_uses_async_embed():
+    import asyncio
+    from app.server.rag.retriever import aretrieve_top
+
+    class AsyncFakeClient:
+        def __init__(self):
+            self.calls = 0
+
+        async def embed(self, texts):
+            self.calls += 1
+            return [[1.0, 0.0] for _ in texts]
+
+    a = IndexedChunk(file="a.md", title="A", anchor="x1", seq=0, embedding=[1.0, 0.0], quote="...")
+    b = IndexedChunk(file="b.md", title="B", anchor="x2", seq=1, embedding=[0.0, 1.0], quote="...")
+    client = AsyncFakeClient()
+    res = asyncio.run(aretrieve_top("вопрос", FakeStore([a, b]), client, top_k=1))
+    assert client.calls == 1
+    assert res[0]["file"] == "a.md"
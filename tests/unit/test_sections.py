@@ -0,0 +1,38 @@
+from pathlib import Path
+from types import SimpleNamespace
+
+from app.server.rag.index_store import IndexStore
+from app.server.rag.reader import Chunk
+from app.server.rag.sections import SectionTable
+
+
+def _items():
+    rows = [("Речь Федра", "эрот древнейший бог"), ("Речь Федра", "влюблённые"), (" Речь Павсания ", "два эрота")]
+    rows += [("", "Федр говорит снова"), ("Речь Сократа", "диотима")]
+    return [SimpleNamespace(file="a.md", title=t, quote=q, seq=i) for i, (t, q) in enumerate(rows)]
+
+
+def test_section_table_spans_counts_and_first_seq():
+    table = SectionTable.from_items(_items())
+    assert table.sections() == [
+        {"title": "Речь Федра", "min_seq": 0, "max_seq": 1, "count": 2},
+        {"title": "Речь Павсания", "min_seq": 2, "max_seq": 2, "count": 1},
+        {"title": "Речь Сократа", "min_seq": 4, "max_seq": 4, "count": 1},
+    ]
+    assert table.span("федр") == (0, 1)
+    assert table.span("алкивиад") is None
+    # Основа ищется и в цитатах: «диотима» только в тексте, «эрот» — раньше заголовка Павсания
+    assert table.first_seq("диотим") == 4
+    assert table.first_seq("эрот") == 0
+    assert table.first_seq("нет такого") is None
+
+
+def test_index_store_builds_section_table_once_per_generation(tmp_path: Path):
+    p = tmp_path / "index.json"
+    chunks = [Chunk(file="a.md", title=t, text=q, anchor=f"a{i}", seq=i) for i, (t, q) in enumerate([("Федр", "x"), ("Павсаний", "y")])]
+    IndexStore(path=p).rebuild(chunks, [[1.0, 0.0], [0.0, 1.0]])
+    store = IndexStore(path=p)
+    store.load()
+    table = store.section_table()
+    assert store.section_table() is table
+    assert table.span("павсан") == (1, 1) and table.first_seq("федр") == 0
@@ -0,0 +1,110 @@
+from pathlib import Path
+
+from app.server.rag.watcher import SourceWatcher
+
+
+class Clock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def test_watcher_debounces_and_waits_for_running_job(tmp_path: Path):
+    clock = Clock()
+    busy = {"v": False}
+
+    def trigger():
+        busy["v"] = True
+        return lambda: "running" if busy["v"] else "done"
+
+    w = SourceWatcher([tmp_path], trigger, debounce=5.0, clock=clock)
+    (tmp_path / "a.md").write_text("a", encoding="utf-8")
+    assert w.poll_once() is False  # первый опрос — базовый снимок
+
+    (tmp_path / "b.md").write_text("b", encoding="utf-8")
+    clock.t = 1.0
+    assert w.poll_once() is False
+    assert w.stats()["queue_depth"] == 1
+
+    # Правки продолжаются — таймер дебаунса сбрасывается
+    (tmp_path / "a.md").write_text("aa", encoding="utf-8")
+    clock.t = 4.0
+    assert w.poll_once() is False
+    clock.t = 8.0
+    assert w.poll_once() is False
+    clock.t = 9.5
+    assert w.poll_once() is True
+    assert [Path(p).name for p in w.batch] == ["a.md", "b.md"]
+    assert w.stats()["queue_depth"] == 0 and w.stats()["reindex_running"]
+
+    # Пока задача идёт, новые изменения ждут в очереди
+    (tmp_path / "b.md").unlink()
+    clock.t = 20.0
+    w.poll_once()
+    clock.t = 30.0
+    assert w.poll_once() is False
+    assert w.stats()["queue_depth"] == 1
+    busy["v"] = False
+    assert w.poll_once() is True
+    assert [Path(p).name for p in w.batch] == ["b.md"]
+    assert w.stats()["triggers"] == 2 and w.stats()["last_scan_at"] is not None
+
+
+def test_watcher_records_trigger_errors(tmp_path: Path):
+    clock = Clock()
+
+    def trigger():
+        raise RuntimeError("no key")
+
+    w = SourceWatcher([tmp_path], trigger, debounce=0.0, clock=clock)
+    w.poll_once()
+    (tmp_path / "a.md").write_text("a", encoding="utf-8")
+    assert w.poll_once() is False
+    assert w.stats()["last_error"] == "no key"
+    # Пути не теряются: они снова в очереди, следующий опрос повторяет запуск
+    assert w.stats()["queue_depth"] == 1
+    assert w.poll_once() is False
+    assert w.stats()["queue_depth"] == 1
+
+
+def test_watcher_requeues_paths_of_failed_job(tmp_path: Path):
+    clock = Clock()
+    calls = []
+    status = {"v": "running"}
+
+    def trigger():
+        calls.append(1)
+        status["v"] = "running"
+        return lambda: status["v"]
+
+    w = SourceWatcher([tmp_path], trigger, debounce=1.0, clock=clock)
+    w.poll_once()
+    (tmp_path / "a.md").write_text("a", encoding="utf-8")
+    w.poll_once()
+    clock.t = 2.0
+    assert w.poll_once() is True and w.stats()["queue_depth"] == 0
+
+    status["v"] = "error"
+    clock.t = 3.0
+    assert w.poll_once() is False
+    assert w.stats()["queue_depth"] == 1 and not w.stats()["reindex_running"]
+    clock.t = 10.0
+    assert w.poll_once() is True
+    assert len(calls) == 2 and [Path(p).name for p in w.batch] == ["a.md"]
+
+
+def test_only_one_watcher_per_lock_runs(tmp_path: Path):
+    lock = tmp_path / "watch.lock"
+    first = SourceWatcher([tmp_path], lambda: None, interval=60, lock_path=lock)
+    second = SourceWatcher([tmp_path], lambda: None, interval=60, lock_path=lock)
+    try:
+        assert first.start() is True
+        assert second.start() is False
+        assert first.stats()["leader"] and not second.stats()["leader"]
+        first.stop()
+        assert second.start() is True
+    finally:
+        first.stop()
+        second.stop()